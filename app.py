@@ -1,15 +1,15 @@
 import streamlit as st
 import json
 import pandas as pd
-import networkx as nx
-from pyvis.network import Network
-import tempfile
-import os
 
-from utils.parse_drawio_xml import parse_drawio_xml
-from utils.parse_vuln import parse_vuln_report_text
-from utils.networkx_core import build_attack_graph
-from utils.rag import generate_risk_assessment_from_reports
+from utils.cache import cached_parse_drawio_xml, cached_parse_vuln_reports, content_digest
+from utils.instrumentation import NULL_INSTRUMENTATION, Instrumentation
+from utils.networkx_core import AttackGraph, path_risk
+from utils.rag import NO_API_KEY_MESSAGE, NO_CONTEXT_MESSAGE, stream_risk_assessments
+from utils.retrieval import FindingIndex, path_contexts
+from utils.rules import RuleSet, default_rules
+from utils.visualize import build_graph_html
+from utils.what_if import WhatIfAnalysis
 
 # --- UI settings ---
 st.set_page_config(page_title="Attack Chain Visualization", layout="wide")
@@ -24,36 +24,45 @@ Streamlitのsecrets機能を使って、お使いのGemini APIキーを`GEMINI_A
 
 # --- File Uploaders ---
 st.subheader("入力ファイル")
-drawio_xml = st.file_uploader("Draw.io の XML をアップロードしてください（構造情報）", type=["xml"])
+drawio_xml = st.file_uploader("Draw.io の XML をアップロードしてください（構造情報）", type=["xml", "drawio"])
 uploaded_reports = st.file_uploader("TXTファイルで出力された脆弱性レポート (Nuclei/Nikto)をアップロードしてください", type=["txt"], accept_multiple_files=True)
 uploaded_map = st.file_uploader("あらかじめ、ドメイン名とdrawio上のホスト名が紐付いたJSONファイルをアップロードしてください", type=["json"])
+uploaded_rules = st.file_uploader(
+    "分類ルールのJSONファイル（任意）",
+    type=["json"],
+    help="重要度・侵入口/重要ノードのキーワード・Niktoの深刻度判定ルールを変更します。指定しない場合は既定のルールを使用します。"
+)
+show_performance = st.checkbox(
+    "パフォーマンスパネルを表示",
+    help="この再実行で行われた各処理ステージの実行時間とカウンタ（ノード数・BFS回数・検出パス数など）を表示します。"
+)
 
 # --- Main processing block ---
 if drawio_xml and uploaded_reports and uploaded_map:
 
+    # Stage timings / counters of this rerun (no-op unless the performance panel is shown)
+    instrumentation = Instrumentation() if show_performance else NULL_INSTRUMENTATION
+
     # 1. Parse all input files
+    rules_bytes = uploaded_rules.read() if uploaded_rules else b""
+    try:
+        rules = RuleSet.from_config(json.loads(rules_bytes)) if rules_bytes else default_rules
+    except ValueError as e:
+        st.error(f"分類ルールを読み込めませんでした: {e}")
+        st.stop()
+
     drawio_xml_text = drawio_xml.read().decode("utf-8")
-    drawio_dict = parse_drawio_xml(drawio_xml_text)
-
-    vuln_dict = {}
-    report_texts = []
-    for rep in uploaded_reports:
-        txt = rep.read().decode("utf-8")
-        report_texts.append(txt)
-        parsed = parse_vuln_report_text(txt)
-        for key, value in parsed.items():
-            if key in vuln_dict:
-                vuln_dict[key]['findings'].extend(value['findings'])
-            else:
-                vuln_dict[key] = value
-
-    # Recalculate Vuln_Count and Severity after merging
-    for h, data in vuln_dict.items():
-        sev_values = [f["severity"] for f in data["findings"]]
-        data["Vuln_Count"] = len(sev_values)
-        data["Severity"] = round(sum(sev_values) / len(sev_values), 2) if sev_values else 0
-
-    manual_map = json.loads(uploaded_map.read())
+    # Parse results are cached by content hash, so reruns skip unchanged inputs
+    with instrumentation.stage("parse_drawio"):
+        drawio_dict = cached_parse_drawio_xml(drawio_xml_text)
+
+    report_bytes = [rep.read() for rep in uploaded_reports]
+    report_texts = [raw.decode("utf-8") for raw in report_bytes]
+    with instrumentation.stage("parse_reports"):
+        vuln_dict = cached_parse_vuln_reports(report_bytes, rules=rules)
+
+    map_bytes = uploaded_map.read()
+    manual_map = json.loads(map_bytes)
 
     # --- Analysis Configuration (Optional Overrides) ---
     st.subheader("解析設定（オプション）")
@@ -72,17 +81,55 @@ if drawio_xml and uploaded_reports and uploaded_map:
         help="指定しない場合はキーワードに基づき自動検出されます。"
     )
 
+    path_mode = st.radio(
+        "攻撃パスの探索方法",
+        ["最短経路", "悪用可能性の高い順（リスク重み付き）"],
+        horizontal=True,
+        help="リスク重み付きでは、脆弱性件数・深刻度・重要度から求めた累積的な悪用可能性が高い経路を、最短でなくても上位から表示します。"
+    )
+    path_cols = st.columns(3)
+    if path_mode == "最短経路":
+        max_paths = path_cols[0].number_input("列挙する攻撃パスの上限（0 = 上限なし）", min_value=0, value=0, step=50)
+        top_k = path_cols[1].number_input("総リスク上位K件のみ表示（0 = すべて）", min_value=0, value=0, step=5)
+        dedup_subpaths = path_cols[2].checkbox("他の経路に含まれる部分経路を除外", value=False)
+        k_best = None
+    else:
+        k_best = path_cols[0].number_input("表示する経路数（K）", min_value=1, value=10, step=5)
+        max_paths, top_k, dedup_subpaths = None, 0, False
+
     selected_entry_nodes = [node_label_to_id[label] for label in selected_entry_labels]
     selected_critical_nodes = [node_label_to_id[label] for label in selected_critical_labels]
 
     # 2. Build and enrich the graph
-    G, attack_paths = build_attack_graph(
-        drawio_dict,
-        vuln_dict,
-        manual_map,
+    # The AttackGraph survives reruns; changing only the selection re-scores incrementally
+    input_key = content_digest("\n".join(
+        [content_digest(drawio_xml_text), content_digest(map_bytes), rules.digest]
+        + [content_digest(raw) for raw in report_bytes]
+    ))
+    attack_graph = st.session_state.get("attack_graph")
+    if attack_graph is None or st.session_state.get("attack_graph_key") != input_key:
+        attack_graph = AttackGraph(drawio_dict, vuln_dict, manual_map, instrumentation=instrumentation, rules=rules)
+        st.session_state["attack_graph"] = attack_graph
+        st.session_state["attack_graph_key"] = input_key
+        # Per-input state of the on-demand assessments (section 6)
+        st.session_state["assessments"] = {}
+        st.session_state["assess_requested"] = set()
+        st.session_state["finding_index"] = None
+        st.session_state["what_if"] = WhatIfAnalysis(attack_graph)
+    # Only the stages re-run on this rerun are recorded
+    attack_graph.instrumentation = instrumentation
+    attack_graph.update_selection(
         entry_nodes=selected_entry_nodes or None,
         critical_nodes=selected_critical_nodes or None
     )
+    attack_graph.configure_paths(
+        max_paths=int(max_paths) if max_paths else None,
+        top_k=int(top_k) or None,
+        dedup_subpaths=dedup_subpaths,
+        k_best=int(k_best) if k_best else None
+    )
+    with instrumentation.stage("networkx_view"):
+        G, attack_paths = attack_graph.G, attack_graph.paths
 
     # 3. Prepare data for display
     node_data = [data for _, data in G.nodes(data=True)]
@@ -100,41 +147,15 @@ if drawio_xml and uploaded_reports and uploaded_map:
     # 5. Build and display the interactive graph with Pyvis
     st.subheader("攻撃チェーンとして考えられる攻撃経路図")
     
-    net = Network(height="755px", width="100%", bgcolor="#ffffff", directed=True)
-    
-    # Get a set of all nodes that are part of any attack path
-    path_nodes = set(node for path in attack_paths for node in path)
-
-    for node_id, data in G.nodes(data=True):
-        node_color = {"border": "#FF0000", "background": "#FFDCDC"} if node_id in path_nodes else {}
-        border_width = 3 if node_id in path_nodes else 1
-        
-        net.add_node(
-            node_id,
-            label=data.get('label'),
-            title=str(data),
-            color=node_color,
-            borderWidth=border_width
-        )
-
-    for source_id, target_id, _ in G.edges(data=True):
-        target_node_data = G.nodes[target_id]
-        
-        risk = target_node_data.get("Risk_Score", 0.0)
-        width = 1 + (risk / 900)
-        red = min(255, int(risk * 20))
-        green = max(0, 150 - int(risk * 20))
-        color = f"rgb({red},{green},80)"
-
-        title = f"To: {target_node_data.get('label', 'N/A')}\n" + json.dumps(target_node_data, indent=2)
-
-        net.add_edge(source_id, target_id, width=width, color=color, title=title)
-
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".html") as tmp_file:
-        net.save_graph(tmp_file.name)
-        html_content = open(tmp_file.name, 'r', encoding='utf-8').read()
-        st.components.v1.html(html_content, height=750)
-        os.remove(tmp_file.name)
+    # Large diagrams use the static mode (server-side layout, clustered off-path nodes)
+    with instrumentation.stage("render_graph_html"):
+        # Keyed on what determines the graph and its paths, instead of hashing the whole graph
+        render_key = content_digest(json.dumps(
+            [input_key, attack_graph.entry_nodes, attack_graph.critical_nodes, attack_graph.path_options],
+            sort_keys=True
+        ))
+        html_content = build_graph_html(G, attack_paths, drawio_dict=drawio_dict, key=render_key)
+    st.components.v1.html(html_content, height=750)
 
     # 6. Display Detected Attack Paths and Generate Explanations
     st.subheader("検出された攻撃チェーンにおける総リスク評価")
@@ -142,35 +163,140 @@ if drawio_xml and uploaded_reports and uploaded_map:
         # Create a reverse map from node ID to domain name for easy lookup
         id_to_domain_map = {v: k for k, v in manual_map.items()}
 
-        for i, path in enumerate(attack_paths):
-            path_labels = [G.nodes[node_id].get('label', 'unknown') for node_id in path]
-            st.markdown(f"**Path {i+1}:** `{' → '.join(path_labels)}`")
+        # --- Prepare data for RAG, including Risk_Scores ---
+        paths_node_scores = [
+            [
+                {
+                    'label': G.nodes[node_id].get('label', 'unknown'),
+                    'Risk_Score': G.nodes[node_id].get('Risk_Score', 'N/A')
+                }
+                for node_id in path
+            ]
+            for path in attack_paths
+        ]
 
-            # --- Prepare data for RAG, including Risk_Scores ---
-            path_node_scores = []
-            for node_id in path:
-                node_info = G.nodes[node_id]
-                path_node_scores.append({
-                    'label': node_info.get('label', 'unknown'),
-                    'Risk_Score': node_info.get('Risk_Score', 'N/A')
-                })
+        # Assessments are generated on demand and memoized for this input set
+        memo = st.session_state.setdefault("assessments", {})
+        requested = st.session_state.setdefault("assess_requested", set())
+
+        prefetch = st.number_input(
+            "リスクの高い上位N件のパスを自動で評価（0 = 個別に評価ボタンを押したパスのみ）",
+            min_value=0, max_value=len(attack_paths), value=0, step=1
+        )
+        risk_of = {n: G.nodes[n].get('Risk_Score', 0.0) for n in G.nodes}
+        by_risk = sorted(range(len(attack_paths)), key=lambda i: -path_risk(attack_paths[i], risk_of))
+        wanted = set(by_risk[:int(prefetch)])
+
+        def memo_key(i):
+            return content_digest(json.dumps([attack_paths[i], paths_node_scores[i]], ensure_ascii=False, default=str))
+
+        placeholders = {}
+        for i, path_node_scores in enumerate(paths_node_scores):
+            path_labels = [node['label'] for node in path_node_scores]
+            st.markdown(f"**Path {i+1}:** `{' → '.join(path_labels)}`")
 
             # --- Display RAG explanation in an expander ---
-            with st.expander(f"Path {i+1} のリスク評価を見る"):
+            key = memo_key(i)
+            with st.expander(f"Path {i+1} のリスク評価を見る", expanded=(key in requested)):
                 # --- DEBUG: Display data being sent to RAG ---
                 # st.subheader("Debug Info: Data for AI")
                 # st.markdown("**Attack Path with Scores:**")
                 # st.json(path_node_scores)
                 # --- END DEBUG ---
 
-                with st.spinner("実際にいくつかの攻撃シナリオが存在する可能性を分析しています..."):
+                if key in memo:
                     st.subheader("リスク評価")
-                    # Pass the risk scores to the RAG function
-                    explanation = generate_risk_assessment_from_reports(path_node_scores, report_texts)
-                    st.markdown(explanation, unsafe_allow_html=True)
+                    st.markdown(memo[key], unsafe_allow_html=True)
+                    continue
+                if st.button("このパスのリスク評価を生成", key=f"assess_{key}"):
+                    requested.add(key)
+                if key in requested or i in wanted:
+                    st.subheader("リスク評価")
+                    body = st.empty()
+                    body.markdown("実際にいくつかの攻撃シナリオが存在する可能性を分析しています...")
+                    placeholders[i] = (body, st.empty())
+
+        if placeholders:
+            targets = sorted(placeholders)
+            # Only the findings of the hosts on each path (and their neighbors) are sent
+            finding_index = st.session_state.get("finding_index")
+            if finding_index is None:
+                finding_index = st.session_state["finding_index"] = FindingIndex(vuln_dict)
+            with instrumentation.stage("retrieve_contexts"):
+                contexts = path_contexts(
+                    G, [attack_paths[i] for i in targets], attack_graph.host_of, vuln_dict, index=finding_index
+                )
+
+            # The requested paths are generated in the background; unchanged paths come from the response cache
+            explanations = {i: "" for i in targets}
+            for event in stream_risk_assessments([paths_node_scores[i] for i in targets], report_texts, contexts=contexts):
+                i = targets[event["index"]]
+                body, stats = placeholders[i]
+                explanations[i] = event["text"] if event["error"] else explanations[i] + event["text"]
+                body.markdown(explanations[i] + ("" if event["done"] else " ▌"), unsafe_allow_html=True)
+                if not event["done"]:
+                    continue
+                if event["error"] is None and explanations[i] not in (NO_API_KEY_MESSAGE, NO_CONTEXT_MESSAGE):
+                    memo[memo_key(i)] = explanations[i]
+                if event["cached"]:
+                    stats.caption("キャッシュ済みの評価を表示しています")
+                elif event["ttft"] is not None:
+                    stats.caption(f"最初の応答まで {event['ttft']:.2f} 秒 / 全体 {event['latency']:.2f} 秒")
     else:
         st.info("侵入口から重要ノードへの攻撃パスは見つかりませんでした。")
 
+    # 7. What-if analysis (the built graph is not changed)
+    st.subheader("What-if分析（対策の効果）")
+    what_if = st.session_state["what_if"]
+    with instrumentation.stage("what_if_rank_edges"):
+        ranked_edges = what_if.rank_edges()
+    if ranked_edges:
+        st.caption("遮断すると多くの最短攻撃経路を断てる接続（上位）")
+        st.dataframe(pd.DataFrame(
+            [{"接続": f"{e['source_label']} → {e['target_label']}", "通過する経路数": e["paths"],
+              "割合": f"{e['share'] * 100:.1f}%"} for e in ranked_edges]
+        ))
+    labels_by_id = dict(zip(attack_graph.graph.node_ids, attack_graph.graph.labels))
+    edge_options = list(dict.fromkeys(
+        [(e["source"], e["target"]) for e in ranked_edges]
+        + [(p[i], p[i + 1]) for p in attack_paths for i in range(len(p) - 1)]
+    ))
+    what_if_cols = st.columns(2)
+    removed_edges = what_if_cols[0].multiselect(
+        "遮断する接続", options=edge_options,
+        format_func=lambda e: f"{labels_by_id.get(e[0])} → {labels_by_id.get(e[1])}",
+    )
+    patched_hosts = what_if_cols[1].multiselect("修正済みとみなすホスト", options=sorted(vuln_dict))
+    if removed_edges or patched_hosts:
+        with instrumentation.stage("what_if"):
+            scenario = what_if.evaluate(removed_edges=removed_edges, patched_hosts=patched_hosts)
+        metric_cols = st.columns(3)
+        metric_cols[0].metric("Risk_Scoreの合計", f"{scenario['risk_delta']:+.2f}")
+        metric_cols[1].metric("攻撃パス数", len(scenario["paths"]), len(scenario["paths"]) - len(attack_paths))
+        metric_cols[2].metric("消える攻撃パス", len(scenario["removed_paths"]))
+        if scenario["nodes"]:
+            st.dataframe(pd.DataFrame(scenario["nodes"])[
+                ["label", "Risk_Score_before", "Risk_Score", "proximity_before", "proximity", "patched"]
+            ])
+        for path in scenario["added_paths"][:20]:
+            st.write("新たに現れる攻撃パス: " + " → ".join(labels_by_id.get(n, n) for n in path))
+
+    # 8. Optional performance panel
+    if show_performance:
+        st.subheader("パフォーマンス")
+        profile = instrumentation.snapshot()
+        perf_cols = st.columns(2)
+        perf_cols[0].dataframe(pd.DataFrame(
+            [{"stage": name, "ms": round(data["seconds"] * 1000, 2), "calls": data["calls"]}
+             for name, data in profile["stages"].items()]
+        ))
+        perf_cols[1].dataframe(pd.DataFrame(
+            [{"counter": name, "value": value} for name, value in profile["counters"].items()]
+        ))
+        download_cols = st.columns(2)
+        download_cols[0].download_button("JSONで保存", instrumentation.to_json(indent=2), file_name="profile.json")
+        download_cols[1].download_button("Prometheus形式で保存", instrumentation.to_prometheus(), file_name="profile.prom")
+
 
 else:
     st.info("Draw.io XML、脆弱性レポート、マニュアルマップJSONをすべてアップロードすると、分析が開始されます。")
\ No newline at end of file
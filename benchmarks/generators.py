@@ -0,0 +1,234 @@
+"""
+Seeded generators for synthetic benchmark inputs.
+
+The same (kind, size, seed) always produces the same draw.io diagram and
+the same reports, so timings taken on different commits are comparable.
+Reports are written line by line, so millions of findings never have to be
+held in memory.
+"""
+import base64
+import os
+import random
+import zlib
+from urllib.parse import quote
+from xml.sax.saxutils import escape, quoteattr
+
+# Tiers of the layered topology: (label prefix, share of the nodes)
+LAYERED_TIERS = [
+    ("gateway", 0.02),
+    ("lb", 0.03),
+    ("web", 0.25),
+    ("api", 0.30),
+    ("svc", 0.25),
+    ("db", 0.15),
+]
+# Label prefixes of the mesh topology (a few of them match the entry/critical keywords)
+MESH_KINDS = ["host", "svc", "worker", "cache", "web", "api", "db", "admin"]
+# Outgoing edges per node (layered: into the next tiers, mesh: to random nodes)
+FANOUT = 2
+
+NUCLEI_TEMPLATES = [
+    ("missing-x-frame-options", "info"), ("tech-detect", "info"), ("cors-misconfig", "medium"),
+    ("exposed-git-config", "medium"), ("open-redirect", "medium"), ("sqli-error-based", "high"),
+    ("jwt-none-alg", "high"), ("default-login", "high"), ("log4j-rce", "critical"),
+    ("weak-cipher-suites", "low"), ("http-missing-security-headers", "info"), ("directory-listing", "low"),
+]
+NIKTO_MESSAGES = [
+    "The anti-clickjacking X-Frame-Options header is missing.",
+    "The X-Content-Type-Options header is not set.",
+    "Retrieved x-powered-by header: Express.",
+    "config file exposed",
+    "Directory indexing found.",
+    "Uncommon header 'x-recruiting' found, with contents: /#/jobs.",
+]
+URL_PATHS = ["/", "/login", "/admin", "/api/v1/users", "/ftp/", "/search?q=1", "/.git/config", "/rest/products"]
+
+
+# --- Topologies ---
+
+def topology(kind: str = "layered", cells: int = 2000, seed: int = 0):
+    """
+    Returns (labels, edges) for about `cells` draw.io cells (nodes + edges).
+    Node i has id f"n{i}"; edges are (source index, target index) pairs.
+    """
+    rng = random.Random(seed)
+    n = max(2, cells // (1 + FANOUT))
+    if kind == "layered":
+        return _layered(rng, n)
+    if kind == "mesh":
+        return _mesh(rng, n)
+    raise ValueError(f"unknown topology kind: {kind}")
+
+
+def _layered(rng, n):
+    sizes = [max(1, int(n * share)) for _, share in LAYERED_TIERS]
+    sizes[-2] += n - sum(sizes)
+    labels, tiers, start = [], [], 0
+    for (prefix, _), size in zip(LAYERED_TIERS, sizes):
+        tiers.append(range(start, start + size))
+        labels.extend(f"{prefix}-{i}" for i in range(size))
+        start += size
+
+    edges = []
+    for t in range(1, len(tiers)):
+        # Every node has one parent in the tier above ...
+        for v in tiers[t]:
+            edges.append((rng.choice(tiers[t - 1]), v))
+    for t, tier in enumerate(tiers[:-1]):
+        # ... and further links, mostly into the next tier, sometimes one tier further (e.g. web -> svc)
+        for u in tier:
+            for _ in range(FANOUT - 1):
+                nxt = tiers[t + 1] if t + 2 >= len(tiers) or rng.random() < 0.85 else tiers[t + 2]
+                edges.append((u, rng.choice(nxt)))
+    return labels, edges
+
+
+def _mesh(rng, n):
+    labels = [f"{MESH_KINDS[rng.randrange(len(MESH_KINDS))]}-{i}" for i in range(n)]
+    edges = [(rng.randrange(n), rng.randrange(n)) for _ in range(n * FANOUT)]
+    return labels, [(u, v) for u, v in edges if u != v]
+
+
+# --- draw.io ---
+
+def _label_value(label: str, i: int) -> str:
+    # Every tenth label carries draw.io HTML markup, as exported by the editor
+    return f"<b>{label}</b><br>zone-{i % 7}" if i % 10 == 0 else label
+
+
+def _page_cells(labels, edges, nodes):
+    yield '<mxGraphModel><root><mxCell id="0"/><mxCell id="1" parent="0"/>'
+    for i in nodes:
+        value = quoteattr(_label_value(labels[i], i))
+        yield (
+            f'<mxCell id="n{i}" value={value} style="rounded=1;html=1;" vertex="1" parent="1">'
+            f'<mxGeometry x="{(i % 100) * 140}" y="{(i // 100) * 90}" width="120" height="60" as="geometry"/>'
+            "</mxCell>"
+        )
+    for j, (u, v) in enumerate(edges):
+        yield (
+            f'<mxCell id="e{j}" style="endArrow=classic;" edge="1" parent="1" source="n{u}" target="n{v}">'
+            '<mxGeometry relative="1" as="geometry"/></mxCell>'
+        )
+    yield "</root></mxGraphModel>"
+
+
+def drawio_xml(kind: str = "layered", cells: int = 2000, seed: int = 0,
+               compressed: bool = False, pages: int = 1) -> str:
+    """
+    Builds a draw.io document. Nodes are split over `pages` diagrams (edges
+    are kept on the page of their source); with compressed=True every page
+    is stored in draw.io's compressed format.
+    """
+    labels, edges = topology(kind, cells, seed)
+    pages = max(1, pages)
+    page_of = [i * pages // len(labels) for i in range(len(labels))]
+
+    parts = ['<mxfile host="benchmark">']
+    for p in range(pages):
+        nodes = [i for i in range(len(labels)) if page_of[i] == p]
+        page_edges = [e for e in edges if page_of[e[0]] == p]
+        model = "".join(_page_cells(labels, page_edges, nodes))
+        if pages > 1:
+            # Edge ids must stay unique across pages
+            model = model.replace('id="e', f'id="p{p}e')
+        if compressed:
+            deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+            raw = deflate.compress(quote(model, safe="~()*!.'").encode("ascii")) + deflate.flush()
+            body = escape(base64.b64encode(raw).decode("ascii"))
+        else:
+            body = model
+        parts.append(f'<diagram id="page-{p}" name="Page-{p + 1}">{body}</diagram>')
+    parts.append("</mxfile>")
+    return "".join(parts)
+
+
+# --- Scan reports ---
+
+def scan_targets(labels, coverage: float = 0.3, seed: int = 0):
+    """
+    Picks the scanned nodes and their report hosts.
+
+    Returns (targets, manual_map): targets is a list of (host, port). Half of
+    the scanned nodes are mapped through the manual map (IP hosts), the other
+    half are found by label matching (host names derived from the label).
+    """
+    rng = random.Random(seed)
+    targets, manual_map = [], {}
+    for i, label in enumerate(labels):
+        if rng.random() >= coverage:
+            continue
+        port = rng.choice((80, 443, 3000, 5000, 8080))
+        if len(targets) % 2 == 0:
+            host = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+            manual_map[label] = f"{host}:{port}"
+        else:
+            host = f"{label}.corp.local"
+        targets.append((host, port))
+    return targets, manual_map
+
+
+def iter_nuclei_lines(targets, findings: int, seed: int = 0):
+    """Yields `findings` Nuclei result lines spread over the targets."""
+    rng = random.Random(seed)
+    for _ in range(findings):
+        host, port = targets[rng.randrange(len(targets))]
+        template, sev = NUCLEI_TEMPLATES[rng.randrange(len(NUCLEI_TEMPLATES))]
+        scheme = "https" if port == 443 else "http"
+        line = f"[{template}] [http] [{sev}] {scheme}://{host}:{port}{rng.choice(URL_PATHS)}"
+        if rng.random() < 0.2:
+            line += ' ["param=id"]'
+        yield line + "\n"
+
+
+def iter_nikto_lines(host: str, port: int, findings: int, seed: int = 0):
+    """Yields a Nikto report (header and `findings` result lines) for one target."""
+    rng = random.Random(seed)
+    yield "- Nikto v2.5.0\n"
+    yield "-" * 75 + "\n"
+    yield "+ Target IP:          127.0.0.1\n"
+    yield f"+ Target Host: {host}\n"
+    yield f"+ Target Port: {port}\n"
+    for _ in range(findings):
+        yield f"+ GET {rng.choice(URL_PATHS)}: {rng.choice(NIKTO_MESSAGES)}\n"
+
+
+def write_lines(path: str, lines) -> int:
+    """Writes lines to path in buffered batches; returns the file size in bytes."""
+    with open(path, "w", encoding="utf-8") as f:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= 10000:
+                f.write("".join(batch))
+                batch = []
+        f.write("".join(batch))
+    return os.path.getsize(path)
+
+
+def write_reports(out_dir: str, targets, findings: int, seed: int = 0,
+                  nikto_share: float = 0.1, findings_per_file: int = 250000) -> list:
+    """
+    Writes `findings` findings as Nuclei reports of at most findings_per_file
+    lines plus one Nikto report per target for nikto_share of them (Nikto
+    scans a single target). Returns the report paths, sorted by name.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    nikto_findings = int(findings * nikto_share)
+    nikto_targets = targets[:max(1, min(len(targets), 20))] if nikto_findings else []
+
+    paths = []
+    for t, (host, port) in enumerate(nikto_targets):
+        count = nikto_findings // len(nikto_targets) + (t < nikto_findings % len(nikto_targets))
+        path = os.path.join(out_dir, f"nikto_{t:03d}.txt")
+        write_lines(path, iter_nikto_lines(host, port, count, rng.randrange(1 << 30)))
+        paths.append(path)
+
+    remaining = findings - nikto_findings
+    for f in range(0, remaining, findings_per_file):
+        count = min(findings_per_file, remaining - f)
+        path = os.path.join(out_dir, f"nuclei_{f // findings_per_file:03d}.txt")
+        write_lines(path, iter_nuclei_lines(targets, count, rng.randrange(1 << 30)))
+        paths.append(path)
+    return sorted(paths)
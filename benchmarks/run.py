@@ -0,0 +1,301 @@
+"""
+Benchmark runner.
+
+    python -m benchmarks.run --scenario small --output bench.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --scenario small --save-baseline benchmarks/baseline.json
+
+Each scenario generates its inputs once, then runs the pipeline stages
+`--repeat` times (the median wall time is reported) plus one pass under
+tracemalloc for the peak memory of every stage. Scenarios run in separate
+processes so their peak RSS values are independent. With --baseline, a
+stage that is slower / uses more memory than the baseline by more than
+--tolerance (and by more than a small absolute amount) is reported as a
+regression and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+from benchmarks.generators import drawio_xml, scan_targets, topology, write_reports
+from utils.networkx_core import AttackGraph
+from utils.parse_drawio_xml import parse_drawio_xml
+from utils.parse_vuln import merge_host_aggregates, parse_vuln_report_text, parse_vuln_reports
+from utils.pipeline import path_records, read_text, risk_table
+from utils.retrieval import path_contexts
+
+RESULTS_VERSION = 1
+
+# name -> generator / pipeline parameters. text_reports also times parse_vuln_report_text
+# on the whole report texts (skipped for the largest inputs, which are only streamed).
+SCENARIOS = {
+    "small": {"kind": "layered", "cells": 2000, "findings": 20000, "max_paths": 200, "k_best": 20,
+              "text_reports": True},
+    "mesh": {"kind": "mesh", "cells": 20000, "findings": 100000, "max_paths": 200, "k_best": 20,
+             "text_reports": True},
+    "medium": {"kind": "layered", "cells": 20000, "findings": 500000, "max_paths": 500, "k_best": 50,
+               "text_reports": True, "compressed": True, "pages": 4},
+    "large": {"kind": "layered", "cells": 100000, "findings": 2000000, "max_paths": 1000, "k_best": 50,
+              "text_reports": False},
+}
+DEFAULT_SCENARIOS = ["small", "mesh"]
+
+# Regression thresholds: relative increase, and the smallest absolute increase that counts
+DEFAULT_TOLERANCE = 0.25
+MIN_SECONDS = 0.05
+MIN_MB = 2.0
+
+
+# --- Stages ---
+
+def _stages(params, inputs, state):
+    """Yields (stage name, callable) in pipeline order; each callable reads and writes `state`."""
+
+    def parse_drawio():
+        state["drawio"] = parse_drawio_xml(inputs["drawio_text"])
+
+    def parse_reports_text():
+        merge_host_aggregates(*(parse_vuln_report_text(read_text(p)) for p in inputs["report_paths"]))
+
+    def parse_reports_stream():
+        state["vuln"] = parse_vuln_reports(inputs["report_paths"], workers=1)
+
+    def build_attack_graph():
+        state["ag"] = AttackGraph(state["drawio"], state["vuln"], inputs["manual_map"], max_paths=params["max_paths"])
+        state["shortest_paths"] = len(state["ag"].paths)
+
+    def k_best_paths():
+        state["ag"].configure_paths(k_best=params["k_best"])
+
+    def export():
+        ag = state["ag"]
+        risk_table(ag.graph)
+        path_records(ag.graph, ag.paths, ag.exploit_weights)
+
+    def contexts():
+        ag = state["ag"]
+        path_contexts(ag.graph, ag.paths, ag.host_of, state["vuln"])
+
+    def networkx_view():
+        state["ag"].G
+
+    yield "parse_drawio", parse_drawio
+    if params.get("text_reports"):
+        yield "parse_reports_text", parse_reports_text
+    yield "parse_reports_stream", parse_reports_stream
+    yield "build_attack_graph", build_attack_graph
+    yield "k_best_paths", k_best_paths
+    yield "export", export
+    yield "retrieval_contexts", contexts
+    yield "networkx_view", networkx_view
+
+
+def _run_once(params, inputs, memory: bool = False):
+    """Runs all stages once; returns ({stage: seconds or peak MB}, final state)."""
+    out, state = {}, {}
+    for name, fn in _stages(params, inputs, state):
+        if memory:
+            tracemalloc.start()
+            fn()
+            out[name] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            fn()
+            out[name] = time.perf_counter() - start
+    return out, state
+
+
+def _rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def run_scenario(name: str, params: dict, repeat: int = 3, seed: int = 0, memory: bool = True) -> dict:
+    """Generates the scenario inputs (reports go to a temporary directory) and benchmarks every stage."""
+    with tempfile.TemporaryDirectory(prefix=f"bench_{name}_") as tmp:
+        start = time.perf_counter()
+        labels, edges = topology(params["kind"], params["cells"], seed)
+        targets, manual_map = scan_targets(labels, seed=seed)
+        inputs = {
+            "drawio_text": drawio_xml(params["kind"], params["cells"], seed,
+                                      compressed=params.get("compressed", False), pages=params.get("pages", 1)),
+            "report_paths": write_reports(tmp, targets, params["findings"], seed),
+            "manual_map": manual_map,
+        }
+        generate_s = time.perf_counter() - start
+
+        runs = {}
+        for _ in range(max(1, repeat)):
+            timings, state = _run_once(params, inputs)
+            for stage, sec in timings.items():
+                runs.setdefault(stage, []).append(sec)
+        peaks = _run_once(params, inputs, memory=True)[0] if memory else {}
+
+        ag = state["ag"]
+        counts = {
+            "nodes": ag.graph.number_of_nodes(),
+            "edges": ag.graph.number_of_edges(),
+            "report_files": len(inputs["report_paths"]),
+            "report_bytes": sum(os.path.getsize(p) for p in inputs["report_paths"]),
+            "findings": params["findings"],
+            "hosts": len(state["vuln"]),
+            "mapped_nodes": len(ag.host_of),
+            "shortest_paths": state["shortest_paths"],
+            "k_best_paths": len(ag.paths),
+        }
+
+    stages = {}
+    for stage, secs in runs.items():
+        stages[stage] = {"seconds": round(statistics.median(secs), 6), "runs": [round(s, 6) for s in secs]}
+        if stage in peaks:
+            stages[stage]["peak_mb"] = round(peaks[stage], 3)
+    return {
+        "params": dict(params, seed=seed, repeat=repeat),
+        "counts": counts,
+        "generate_seconds": round(generate_s, 3),
+        "stages": stages,
+        "total_seconds": round(sum(s["seconds"] for s in stages.values()), 6),
+        "peak_rss_mb": round(_rss_mb(), 1),
+    }
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_benchmarks(names, repeat: int = 3, seed: int = 0, memory: bool = True, isolate: bool = True) -> dict:
+    """Runs the named scenarios (each in a fresh process when isolate is set) and returns the results document."""
+    results = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "scenarios": {},
+    }
+    for name in names:
+        args = (name, SCENARIOS[name], repeat, seed, memory)
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                results["scenarios"][name] = pool.submit(run_scenario, *args).result()
+        else:
+            results["scenarios"][name] = run_scenario(*args)
+        print(format_scenario(name, results["scenarios"][name]), file=sys.stderr)
+    return results
+
+
+# --- Baseline comparison ---
+
+def compare(results: dict, baseline: dict, tolerance: float = DEFAULT_TOLERANCE,
+            min_seconds: float = MIN_SECONDS, min_mb: float = MIN_MB) -> list:
+    """
+    Compares stage timings and peak memory with a baseline document.
+
+    Returns one dict per regression (scenario, stage, metric, baseline,
+    current, ratio). Scenarios or stages missing from either side are skipped.
+    """
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for stage, cur in scenario["stages"].items():
+            old = base["stages"].get(stage)
+            if old is None:
+                continue
+            for metric, min_delta in (("seconds", min_seconds), ("peak_mb", min_mb)):
+                if metric not in cur or metric not in old:
+                    continue
+                before, after = old[metric], cur[metric]
+                if after > before * (1 + tolerance) and after - before > min_delta:
+                    regressions.append({
+                        "scenario": name,
+                        "stage": stage,
+                        "metric": metric,
+                        "baseline": before,
+                        "current": after,
+                        "ratio": round(after / before, 3) if before else None,
+                    })
+    return regressions
+
+
+def format_scenario(name: str, scenario: dict) -> str:
+    lines = [f"[{name}] {scenario['counts']}"]
+    for stage, data in scenario["stages"].items():
+        peak = f"{data['peak_mb']:10.1f} MB" if "peak_mb" in data else ""
+        lines.append(f"  {stage:<22} {data['seconds'] * 1000:10.1f} ms {peak}")
+    lines.append(f"  {'total':<22} {scenario['total_seconds'] * 1000:10.1f} ms   peak RSS {scenario['peak_rss_mb']} MB")
+    return "\n".join(lines)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the parsing and scoring pipeline on synthetic inputs")
+    parser.add_argument("--scenario", "-s", action="append", choices=sorted(SCENARIOS),
+                        help=f"Scenario to run (repeatable, default: {' '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per scenario (median is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the input generators")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--no-isolate", action="store_true", help="Run scenarios in this process")
+    parser.add_argument("--output", "-o", default=None, help="Write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="Baseline results JSON to compare against")
+    parser.add_argument("--save-baseline", default=None, help="Also write the results as a new baseline file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed relative increase before a stage counts as a regression (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = run_benchmarks(args.scenario or DEFAULT_SCENARIOS, repeat=args.repeat, seed=args.seed,
+                             memory=not args.no_memory, isolate=not args.no_isolate)
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        results["regressions"] = regressions
+        for r in regressions:
+            print(f"[regression] {r['scenario']}/{r['stage']} {r['metric']}: "
+                  f"{r['baseline']} -> {r['current']} (x{r['ratio']})", file=sys.stderr)
+        if regressions:
+            status = 1
+        else:
+            print(f"[+] no regressions against {args.baseline}", file=sys.stderr)
+
+    payload = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import sys
+
+from utils.cache import ContentCache
+from utils.instrumentation import Instrumentation
+from utils.pipeline import (
+    StageTimer, list_report_files, path_records, read_text, resolve_labels, risk_table, run_pipeline, write_results,
+)
+from utils.retrieval import DEFAULT_MAX_CHARS
+from utils.rules import load_rules
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Headless attack path analysis (draw.io + Nuclei/Nikto reports + manual mapping)"
+    )
+    parser.add_argument("--drawio", "-d", required=True, help="draw.io XML file")
+    parser.add_argument("--reports", "-r", required=True, help="Directory containing Nuclei/Nikto TXT reports")
+    parser.add_argument("--map", "-m", required=True, help="Manual mapping JSON file (label -> host:port)")
+    parser.add_argument("--output", "-o", required=True, help="Output directory")
+    parser.add_argument("--format", choices=["json", "csv", "both"], default="both", help="Output format for tables")
+    parser.add_argument("--entry", action="append", default=[], help="Entry node label (repeatable, overrides auto-detection)")
+    parser.add_argument("--critical", action="append", default=[], help="Critical node label (repeatable, overrides auto-detection)")
+    parser.add_argument("--max-paths", type=int, default=None, help="Stop after enumerating this many attack paths")
+    parser.add_argument("--top-k", type=int, default=None, help="Keep only the K paths with the highest summed Risk_Score")
+    parser.add_argument("--dedup-subpaths", action="store_true", help="Drop paths contained in a longer path")
+    parser.add_argument("--k-best", type=int, default=None, help="Return the K most exploitable paths (risk-weighted) instead of shortest paths")
+    parser.add_argument("--workers", type=int, default=None, help="Processes used to parse reports (default: one per CPU)")
+    parser.add_argument("--cache-dir", default=None, help="Persist parsed diagrams/reports here and reuse them on later runs")
+    parser.add_argument("--assess", action="store_true", help="Generate LLM risk assessments (requires GEMINI_API_KEY)")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="Concurrent LLM requests for --assess (default: 4)")
+    parser.add_argument("--llm-stub", action="store_true", help="Use an offline stub model instead of Gemini for --assess")
+    parser.add_argument("--context-chars", type=int, default=DEFAULT_MAX_CHARS,
+                        help="Max characters of retrieved findings per prompt for --assess (default: %(default)s, 0 = send full reports)")
+    parser.add_argument("--html", action="store_true", help="Render the interactive graph as attack_graph.html")
+    parser.add_argument("--html-mode", choices=["auto", "pyvis", "static"], default="auto",
+                        help="Graph renderer for --html: pyvis physics, or static server-side layout (auto: static for large graphs)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage timings and counters of the graph build (profile.json / profile.prom)")
+    parser.add_argument("--snapshot", default=None,
+                        help="Save the analysis (graph, scores, paths, findings) as a snapshot directory")
+    parser.add_argument("--diff-against", default=None,
+                        help="Compare with an earlier snapshot and write snapshot_diff.json (saves to OUTPUT/snapshot unless --snapshot)")
+    parser.add_argument("--remove-edge", nargs=2, action="append", default=[], metavar=("SRC", "DST"),
+                        help="What-if: evaluate the analysis without this edge (labels, repeatable; writes what_if.json)")
+    parser.add_argument("--add-edge", nargs=2, action="append", default=[], metavar=("SRC", "DST"),
+                        help="What-if: evaluate the analysis with this extra edge (labels, repeatable)")
+    parser.add_argument("--patch-host", action="append", default=[], metavar="HOST",
+                        help="What-if: evaluate the analysis with this report host (host:port) patched (repeatable)")
+    parser.add_argument("--rank-edges", type=int, default=None, metavar="N",
+                        help="List the N edges carrying the most shortest attack paths (what_if.json)")
+    parser.add_argument("--rules", default=None, metavar="PATH",
+                        help="JSON classification rules (importance, entry/critical keywords, Nikto severity)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running: re-analyze as lines are appended to the reports and write deltas.jsonl")
+    parser.add_argument("--watch-interval", type=float, default=2.0, help="Polling interval of --watch in seconds")
+    return parser
+
+
+def _stub_model():
+    from utils.rag import LocalStubModel
+    return LocalStubModel()
+
+
+def _watch(args, formats, rules):
+    """Writes the initial results, then one JSON line per update to deltas.jsonl until interrupted."""
+    from utils.parse_drawio_xml import parse_drawio_xml
+    from utils.watch import WatchSession
+
+    timer = StageTimer()
+    with timer.stage("read_inputs"):
+        drawio_dict = parse_drawio_xml(read_text(args.drawio))
+        with open(args.map, "r", encoding="utf-8") as f:
+            manual_map = json.load(f)
+    with timer.stage("initial_analysis"):
+        session = WatchSession(
+            drawio_dict, manual_map, args.reports,
+            entry_nodes=resolve_labels(drawio_dict, args.entry) or None,
+            critical_nodes=resolve_labels(drawio_dict, args.critical) or None,
+            max_paths=args.max_paths, top_k=args.top_k, dedup_subpaths=args.dedup_subpaths, k_best=args.k_best,
+            rules=rules,
+        )
+    ag = session.attack_graph
+    result = {
+        "risk_table": risk_table(ag.graph),
+        "paths": path_records(ag.graph, ag.paths, ag.exploit_weights if args.k_best else None),
+        "timings": {name: round(sec, 6) for name, sec in timer.timings.items()},
+    }
+    for path in write_results(result, args.output, formats=formats):
+        print(f"[+] wrote {path}", file=sys.stderr)
+    print(f"[+] watching {args.reports} (Ctrl+C to stop)", file=sys.stderr)
+
+    with open(os.path.join(args.output, "deltas.jsonl"), "a", encoding="utf-8") as out:
+        def on_delta(delta):
+            out.write(json.dumps(delta, ensure_ascii=False) + "\n")
+            out.flush()
+            print(f"[watch] +{delta['findings']} findings, {len(delta['hosts'])} hosts, "
+                  f"{len(delta['nodes'])} nodes, {len(delta['paths'])} paths ({delta['elapsed_s'] * 1000:.2f} ms)",
+                  file=sys.stderr)
+
+        try:
+            session.run(on_delta, interval=args.watch_interval)
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+def _run(args, drawio_text, report_paths, manual_map, timer, rules):
+    what_if = {
+        "removed_edges": args.remove_edge,
+        "added_edges": args.add_edge,
+        "patched_hosts": args.patch_host,
+        "rank_edges": args.rank_edges,
+    }
+    return run_pipeline(
+        drawio_text,
+        None,
+        manual_map,
+        entry_labels=args.entry,
+        critical_labels=args.critical,
+        assess=args.assess,
+        render_html=args.html,
+        timer=timer,
+        report_paths=report_paths,
+        workers=args.workers,
+        max_paths=args.max_paths,
+        top_k=args.top_k,
+        dedup_subpaths=args.dedup_subpaths,
+        k_best=args.k_best,
+        llm_concurrency=args.llm_concurrency,
+        llm_model=_stub_model() if args.llm_stub else None,
+        context_chars=args.context_chars,
+        html_mode=args.html_mode,
+        cache=ContentCache(cache_dir=args.cache_dir) if args.cache_dir else None,
+        instrumentation=Instrumentation() if args.profile else None,
+        snapshot_dir=args.snapshot or (os.path.join(args.output, "snapshot") if args.diff_against else None),
+        # The what-if stage only runs when one of its flags was given
+        what_if=what_if if any(what_if.values()) else None,
+        rules=rules,
+    )
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    formats = ("json", "csv") if args.format == "both" else (args.format,)
+    try:
+        rules = load_rules(args.rules) if args.rules else None
+    except (OSError, ValueError) as exc:
+        print(f"[!] {exc}", file=sys.stderr)
+        return 2
+    if args.watch:
+        return _watch(args, formats, rules)
+    timer = StageTimer()
+
+    with timer.stage("read_inputs"):
+        drawio_text = read_text(args.drawio)
+        report_paths = list_report_files(args.reports)
+        with open(args.map, "r", encoding="utf-8") as f:
+            manual_map = json.load(f)
+
+    if not report_paths:
+        print(f"[!] No .txt reports found in {args.reports}", file=sys.stderr)
+
+    # e.g. unknown labels in --remove-edge / --add-edge, or a --snapshot DIR that is not a snapshot
+    try:
+        result = _run(args, drawio_text, report_paths, manual_map, timer, rules)
+    except (ValueError, FileExistsError) as exc:
+        print(f"[!] {exc}", file=sys.stderr)
+        return 2
+
+    written = write_results(result, args.output, formats=formats)
+
+    if result.get("snapshot"):
+        written.append(result["snapshot"])
+    if args.diff_against:
+        from utils.snapshot import diff_snapshots, load_snapshot
+        diff = diff_snapshots(load_snapshot(args.diff_against), load_snapshot(result["snapshot"]))
+        path = os.path.join(args.output, "snapshot_diff.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(diff, f, ensure_ascii=False, indent=2)
+        written.append(path)
+        print(f"[diff] {len(diff['risk_changes'])} Risk_Score changes, +{len(diff['added_paths'])} / "
+              f"-{len(diff['removed_paths'])} paths, {sum(h['new_findings'] for h in diff['new_findings'].values())} "
+              f"new findings on {len(diff['new_findings'])} hosts", file=sys.stderr)
+
+    for path in written:
+        print(f"[+] wrote {path}", file=sys.stderr)
+    for stage, sec in result["timings"].items():
+        print(f"[time] {stage:<20} {sec * 1000:10.2f} ms", file=sys.stderr)
+    print(f"[+] nodes: {len(result['risk_table'])}, attack paths: {len(result['paths'])}", file=sys.stderr)
+    if result.get("profile"):
+        for stage, data in result["profile"]["stages"].items():
+            print(f"[profile] {stage:<20} {data['seconds'] * 1000:10.2f} ms ({data['calls']}x)", file=sys.stderr)
+        print(f"[profile] counters: {result['profile']['counters']}", file=sys.stderr)
+    what_if = result.get("what_if") or {}
+    for edge in what_if.get("ranked_edges", []):
+        print(f"[what-if] {edge['source_label']} -> {edge['target_label']}: {edge['paths']} paths "
+              f"({edge['share'] * 100:.1f}%)", file=sys.stderr)
+    if what_if.get("scenario"):
+        scenario = what_if["scenario"]
+        print(f"[what-if] Risk_Score {scenario['risk_delta']:+.3f} on {len(scenario['nodes'])} nodes, paths "
+              f"{len(result['paths'])} -> {len(scenario['paths'])} (+{len(scenario['added_paths'])} / "
+              f"-{len(scenario['removed_paths'])})", file=sys.stderr)
+    if result.get("cache_stats"):
+        print(f"[cache] {result['cache_stats']}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import argparse
+import sys
+
+from utils.cache import ContentCache
+from utils.service import DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS, AnalysisService, make_server
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Attack path analysis service (POST /jobs, GET /jobs/<id>, GET /metrics)"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Jobs analyzed concurrently")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Jobs waiting beyond this are rejected with 429 (default: %(default)s)")
+    parser.add_argument("--cache-dir", default=None, help="Persist parsed diagrams/reports here (shared by all jobs)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    service = AnalysisService(
+        workers=args.workers,
+        queue_size=args.queue_size,
+        cache=ContentCache(cache_dir=args.cache_dir),
+    )
+    server = make_server(service, args.host, args.port)
+    print(f"[+] listening on http://{args.host}:{server.server_address[1]} "
+          f"({args.workers} workers, queue {args.queue_size})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
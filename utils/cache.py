@@ -0,0 +1,189 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from utils.parse_drawio_xml import PARSER_VERSION as DRAWIO_PARSER_VERSION
+from utils.parse_drawio_xml import parse_drawio_xml
+from utils.parse_vuln import PARSER_VERSION as VULN_PARSER_VERSION
+from utils.parse_vuln import CHUNK_SIZE, merge_host_aggregates, parse_each_report
+from utils.rules import default_rules
+
+# Optional directory for the persisted store of the process-wide cache
+CACHE_DIR_ENV = "ATTACKROUTE_CACHE_DIR"
+
+
+_MISSING = object()
+
+
+def content_digest(content) -> str:
+    """SHA-256 of a str or bytes payload."""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def file_digest(path) -> str:
+    """SHA-256 of a file's content, read in chunks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_digest(source) -> str:
+    # Report sources are raw bytes or paths (see parse_each_report)
+    if isinstance(source, (bytes, bytearray)):
+        return content_digest(source)
+    return file_digest(source)
+
+
+class ContentCache:
+    """
+    LRU cache for parse results keyed by content hash and parser version.
+
+    Entries live in memory (at most max_entries) and, when cache_dir is
+    given, are also pickled to disk so they survive process restarts.
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries: int = 128, cache_dir: str = None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._computing = {}  # key -> lock held while one caller computes it
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(namespace: str, version, digest: str) -> str:
+        return f"{namespace}-v{version}-{digest}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+        if self.cache_dir and os.path.exists(self._disk_path(key)):
+            try:
+                with open(self._disk_path(key), "rb") as f:
+                    value = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                value = None
+            else:
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._remember(key, value)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.cache_dir:
+            # Write atomically so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, self._disk_path(key))
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def get_or_compute(self, key, compute):
+        """Cached value of key, computed on a miss; concurrent callers of the same key wait for one computation."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            key_lock = self._computing.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._entries:  # computed by another caller in the meantime
+                    self._entries.move_to_end(key)
+                    return self._entries[key]
+            try:
+                value = compute()
+                self.put(key, value)
+            finally:
+                with self._lock:
+                    self._computing.pop(key, None)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+
+
+# Process-wide cache shared by Streamlit reruns and headless callers
+default_cache = ContentCache(cache_dir=os.environ.get(CACHE_DIR_ENV) or None)
+
+
+# --- Cached Parsers ---
+
+def cached_parse_drawio_xml(xml_text: str, cache: ContentCache = None):
+    """parse_drawio_xml() that skips parsing for an already seen diagram."""
+    cache = cache or default_cache
+    key = cache.make_key("drawio", DRAWIO_PARSER_VERSION, content_digest(xml_text))
+    return cache.get_or_compute(key, lambda: parse_drawio_xml(xml_text))
+
+
+def cached_parse_vuln_reports(sources, workers: int = None, cache: ContentCache = None, rules=None):
+    """
+    parse_vuln_reports() with per-report and per-report-set caching.
+    Sources are paths or raw bytes; only reports not in the cache are parsed.
+    Keys include the severity rules' digest, so changed rules re-parse.
+    """
+    cache = cache or default_cache
+    rules = rules or default_rules
+    sources = list(sources)
+    version = f"{VULN_PARSER_VERSION}.{rules.severity_digest}"
+    keys = [cache.make_key("vuln", version, _source_digest(src)) for src in sources]
+
+    set_key = cache.make_key("vulnset", version, content_digest("\n".join(keys)))
+
+    def parse_set():
+        parsed = [cache.get(key, _MISSING) for key in keys]
+        missing = [i for i, value in enumerate(parsed) if value is _MISSING]
+        if missing:
+            fresh = parse_each_report([sources[i] for i in missing], workers=workers, rules=rules)
+            for i, value in zip(missing, fresh):
+                cache.put(keys[i], value)
+                parsed[i] = value
+        return merge_host_aggregates(*parsed)
+
+    return cache.get_or_compute(set_key, parse_set)
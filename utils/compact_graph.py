@@ -0,0 +1,296 @@
+from array import array
+
+import networkx as nx
+import numpy as np
+
+
+def _csr(keys, values, n):
+    """CSR (indptr, indices) grouping values by key; the input order is kept within each row."""
+    order = np.argsort(keys, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=indptr[1:])
+    return indptr, values[order]
+
+
+class _RowAdjacency:
+    """Integer adjacency over CSR rows, returned as Python lists for pure-Python searches."""
+
+    def __init__(self, indptr, indices):
+        self._indptr = indptr
+        self._indices = indices
+
+    def __getitem__(self, i):
+        return self._indices[self._indptr[i]:self._indptr[i + 1]].tolist()
+
+    def __len__(self):
+        return len(self._indptr) - 1
+
+
+class _AdjacencyView:
+    """Read-only G.succ / G.pred style mapping over node ids."""
+
+    def __init__(self, graph, indptr, indices):
+        self._graph = graph
+        self._indptr = indptr
+        self._indices = indices
+
+    def __getitem__(self, node_id):
+        i = self._graph.index[node_id]
+        ids = self._graph.node_ids
+        return [ids[j] for j in self._indices[self._indptr[i]:self._indptr[i + 1]].tolist()]
+
+    def __contains__(self, node_id):
+        return node_id in self._graph.index
+
+    def __iter__(self):
+        return iter(self._graph.node_ids)
+
+    def __len__(self):
+        return len(self._graph.node_ids)
+
+
+class _NodeView:
+    """
+    Read-only G.nodes style view. Rows are built on access from the label
+    list and the typed columns, so writing to them has no effect.
+    """
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def _row(self, values):
+        label, *rest = values
+        row = {} if label is None else {"label": label}
+        row.update(zip(self._graph.columns, rest))
+        return row
+
+    def __getitem__(self, node_id):
+        g = self._graph
+        i = g.index[node_id]
+        return self._row([g.labels[i]] + [g.column_value(name, i) for name in g.columns])
+
+    def __call__(self, data: bool = False):
+        if not data:
+            return iter(self._graph.node_ids)
+        g = self._graph
+        columns = [g.column_values(name) for name in g.columns]
+        return ((node_id, self._row(values)) for node_id, *values in zip(g.node_ids, g.labels, *columns))
+
+    def __iter__(self):
+        return iter(self._graph.node_ids)
+
+    def __contains__(self, node_id):
+        return node_id in self._graph.index
+
+    def __len__(self):
+        return len(self._graph.node_ids)
+
+
+class CompactGraph:
+    """
+    Array-backed directed graph for the scoring pipeline.
+
+    Node ids are interned to row numbers, successors and predecessors are
+    CSR arrays and node attributes are typed NumPy columns, so a graph with
+    100k+ nodes costs a few arrays instead of one dict per node and edge.
+    Parallel edges are merged like in a networkx DiGraph.
+
+    A read-only subset of the networkx DiGraph API (nodes, succ, pred,
+    in_degree, edges, ``in``) is provided for callers that only read the
+    graph; to_networkx() builds a real DiGraph for callers that need one.
+    """
+
+    def __init__(self, node_ids, labels, sources, targets):
+        self.node_ids = list(node_ids)
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+        self.labels = list(labels)
+        n = len(self.node_ids)
+        dtype = np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+        sources = np.asarray(sources, dtype=np.int64).reshape(-1)
+        targets = np.asarray(targets, dtype=np.int64).reshape(-1)
+        # Merge parallel edges, keeping the first occurrence (DiGraph semantics)
+        _, first = np.unique(sources * max(n, 1) + targets, return_index=True)
+        first.sort()
+        sources, targets = sources[first], targets[first]
+
+        self.indptr, self.indices = _csr(sources, targets.astype(dtype), n)
+        self.pred_indptr, self.pred_indices = _csr(targets, sources.astype(dtype), n)
+
+        # name -> NumPy array indexed by row; names in node_columns hold row numbers (-1 = None)
+        self.columns = {}
+        self.node_columns = set()
+
+    @classmethod
+    def from_drawio(cls, data: dict):
+        """
+        Builds the graph straight from parse_drawio_xml() output (same nodes,
+        edges and order as build_graph_from_dict, without a networkx graph).
+        Edge endpoints that are not nodes are added without a label;
+        edges missing an endpoint are skipped.
+        """
+        node_ids, labels, index = [], [], {}
+        for node in data["nodes"]:
+            i = index.setdefault(node["id"], len(node_ids))
+            if i == len(node_ids):
+                node_ids.append(node["id"])
+                labels.append(None)
+            labels[i] = node.get("label", "unknown")
+
+        sources, targets = array("q"), array("q")
+        for edge in data["edges"]:
+            source, target = edge.get("source"), edge.get("target")
+            if source is None or target is None:
+                continue
+            for node_id in (source, target):
+                if node_id not in index:
+                    index[node_id] = len(node_ids)
+                    node_ids.append(node_id)
+                    labels.append(None)
+            sources.append(index[source])
+            targets.append(index[target])
+        return cls(node_ids, labels, sources, targets)
+
+    @classmethod
+    def from_networkx(cls, G):
+        """Builds the graph from a networkx DiGraph (only labels are copied)."""
+        node_ids = list(G.nodes)
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        sources, targets = [], []
+        for u, v in G.edges():
+            sources.append(index[u])
+            targets.append(index[v])
+        return cls(node_ids, [G.nodes[n].get("label") for n in node_ids], sources, targets)
+
+    # --- Columns ---
+
+    def set_column(self, name: str, values, node_refs: bool = False):
+        """Stores a per-node column; with node_refs the values are row numbers of other nodes (-1 = None)."""
+        values = np.asarray(values)
+        if values.shape != (len(self.node_ids),):
+            raise ValueError(f"column {name} must have {len(self.node_ids)} values, got shape {values.shape}")
+        self.columns[name] = values
+        if node_refs:
+            self.node_columns.add(name)
+        else:
+            self.node_columns.discard(name)
+
+    def column_value(self, name: str, i: int):
+        value = self.columns[name][i].item()
+        if name in self.node_columns:
+            return self.node_ids[value] if value >= 0 else None
+        return value
+
+    def column_values(self, name: str) -> list:
+        values = self.columns[name].tolist()
+        if name in self.node_columns:
+            ids = self.node_ids
+            return [ids[v] if v >= 0 else None for v in values]
+        return values
+
+    # --- Structure ---
+
+    @property
+    def csr(self):
+        """(nodes, index, indptr, indices) like networkx_core.graph_to_csr()."""
+        return self.node_ids, self.index, self.indptr, self.indices
+
+    def has_edge_rows(self, u: int, v: int) -> bool:
+        return bool((self.indices[self.indptr[u]:self.indptr[u + 1]] == v).any())
+
+    def with_edge_changes(self, removed=(), added=()):
+        """
+        Copy of the graph with (source_row, target_row) edges removed and added,
+        sharing the node ids, labels and columns. Added edges come last among
+        the successors / predecessors of their endpoints, as if appended to the
+        diagram; edges that already exist are not added twice.
+        """
+        n = len(self.node_ids)
+        drop = np.asarray([u * n + v for u, v in removed], dtype=np.int64)
+        extra = [(u, v) for u, v in dict.fromkeys(added) if not self.has_edge_rows(u, v)]
+
+        def edited(indptr, indices, flip):
+            rows = np.repeat(np.arange(n), np.diff(indptr))
+            keys = indices * n + rows if flip else rows * n + indices
+            keep = ~np.isin(keys, drop)
+            rows, cols = rows[keep], indices[keep].astype(np.int64)
+            if extra:
+                new_rows, new_cols = zip(*((v, u) if flip else (u, v) for u, v in extra))
+                rows = np.concatenate([rows, np.asarray(new_rows, dtype=np.int64)])
+                cols = np.concatenate([cols, np.asarray(new_cols, dtype=np.int64)])
+            return _csr(rows, cols.astype(indices.dtype), n)
+
+        graph = CompactGraph.__new__(CompactGraph)
+        graph.node_ids, graph.index, graph.labels = self.node_ids, self.index, self.labels
+        graph.indptr, graph.indices = edited(self.indptr, self.indices, False)
+        graph.pred_indptr, graph.pred_indices = edited(self.pred_indptr, self.pred_indices, True)
+        graph.columns = dict(self.columns)
+        graph.node_columns = set(self.node_columns)
+        return graph
+
+    def in_degrees(self):
+        return np.diff(self.pred_indptr)
+
+    def out_degrees(self):
+        return np.diff(self.indptr)
+
+    def succ_lists(self) -> _RowAdjacency:
+        """Successors by row number, for pure-Python path searches."""
+        return _RowAdjacency(self.indptr, self.indices)
+
+    def pred_lists(self) -> _RowAdjacency:
+        """Predecessors by row number."""
+        return _RowAdjacency(self.pred_indptr, self.pred_indices)
+
+    # --- networkx-style read API ---
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    @property
+    def succ(self):
+        return _AdjacencyView(self, self.indptr, self.indices)
+
+    @property
+    def pred(self):
+        return _AdjacencyView(self, self.pred_indptr, self.pred_indices)
+
+    def in_degree(self, node_id) -> int:
+        i = self.index[node_id]
+        return int(self.pred_indptr[i + 1] - self.pred_indptr[i])
+
+    def edges(self):
+        ids = self.node_ids
+        sources = np.repeat(np.arange(len(ids)), self.out_degrees()).tolist()
+        return [(ids[u], ids[v]) for u, v in zip(sources, self.indices.tolist())]
+
+    def number_of_nodes(self) -> int:
+        return len(self.node_ids)
+
+    def number_of_edges(self) -> int:
+        return len(self.indices)
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    def __iter__(self):
+        return iter(self.node_ids)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def to_networkx(self, columns=None):
+        """
+        Returns a networkx DiGraph with the labels and the given columns
+        (default: all) as node attributes.
+        """
+        names = list(self.columns) if columns is None else list(columns)
+        G = nx.DiGraph()
+        values = [self.column_values(name) for name in names]
+        for node_id, label, *row in zip(self.node_ids, self.labels, *values):
+            attrs = {} if label is None else {"label": label}
+            attrs.update(zip(names, row))
+            G.add_node(node_id, **attrs)
+        G.add_edges_from(self.edges())
+        return G
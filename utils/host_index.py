@@ -0,0 +1,173 @@
+import re
+from collections import deque
+
+_NORMALIZE_RE = re.compile(r"[\s\-_]+")
+
+# Substring lookup is used while the hosts' substrings cost at most this
+# many times the total label length (see HostMatchIndex._substring_matches)
+SUBSTRING_TABLE_FACTOR = 4
+
+
+def normalize_text(text: str) -> str:
+    """Converts text to a consistent format for comparison."""
+    if not text:
+        return ""
+    return _NORMALIZE_RE.sub("", text.lower())
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over a list of patterns.
+    iter_matches() reports every (possibly overlapping) occurrence in one pass.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(pid)
+
+        # Breadth-first construction of failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str):
+        """Yields (end_index, pattern_id) for every occurrence in text."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for pid in out[state]:
+                yield i, pid
+
+
+class HostMatchIndex:
+    """
+    Maps node labels to vulnerability report hosts.
+
+    Priority 1 is the manual map (normalized label -> exact host key, a hash
+    lookup). Otherwise every host whose normalized key contains the
+    normalized label is a candidate; candidates are found for all labels at
+    once with an Aho-Corasick automaton and ordered deterministically:
+    exact key match first, then the shortest host key, then the key itself.
+    """
+
+    def __init__(self, vuln_dict: dict, manual_map: dict):
+        self.vuln_dict = vuln_dict
+        self.norm_manual_map = {normalize_text(k): v for k, v in manual_map.items()}
+        self.norm_hosts = [(normalize_text(k), k) for k in vuln_dict]
+        # host key -> manually mapped normalized labels (built on first use)
+        self._manual_by_host = None
+
+    @staticmethod
+    def _priority(norm_label, norm_host, host_key):
+        return (norm_host != norm_label, len(norm_host), host_key)
+
+    def _substring_matches(self, pending):
+        """Maps each matched normalized label to the set of (norm_host, host_key) pairs containing it."""
+        found = {}
+        host_cost = sum(len(h) * (len(h) + 1) // 2 for h, _ in self.norm_hosts)
+        if host_cost <= SUBSTRING_TABLE_FACTOR * sum(len(label) for label in pending):
+            # Few/short hosts and many labels: look up every substring of each host
+            # instead of building an automaton over all labels
+            for norm_host, host_key in self.norm_hosts:
+                n = len(norm_host)
+                for sub in {norm_host[i:j] for i in range(n) for j in range(i + 1, n + 1)}:
+                    if sub in pending:
+                        found.setdefault(sub, set()).add((norm_host, host_key))
+            return found
+
+        automaton = AhoCorasick(pending)
+        for norm_host, host_key in self.norm_hosts:
+            for _, pid in automaton.iter_matches(norm_host):
+                found.setdefault(automaton.patterns[pid], set()).add((norm_host, host_key))
+        return found
+
+    def add_hosts(self, host_keys):
+        """Registers hosts added to vuln_dict after the index was built."""
+        self.norm_hosts.extend((normalize_text(k), k) for k in host_keys)
+
+    def is_manual(self, norm_label: str) -> bool:
+        """True when the label is manually mapped to a host present in vuln_dict."""
+        return self.norm_manual_map.get(norm_label) in self.vuln_dict
+
+    def labels_for_host(self, host_key: str, norm_labels):
+        """
+        Returns (manual, contained): the normalized labels among norm_labels
+        that are manually mapped to host_key, and those contained in it.
+        Used to place a single new host without matching every label again.
+        """
+        if self._manual_by_host is None:
+            self._manual_by_host = {}
+            for label, host in self.norm_manual_map.items():
+                self._manual_by_host.setdefault(host, []).append(label)
+        manual = [label for label in self._manual_by_host.get(host_key, ()) if label in norm_labels]
+        norm_host = normalize_text(host_key)
+        n = len(norm_host)
+        contained = [
+            sub for sub in {norm_host[i:j] for i in range(n) for j in range(i + 1, n + 1)} if sub in norm_labels
+        ]
+        return manual, contained
+
+    def prefers(self, norm_label: str, host_key: str, current_key: str) -> bool:
+        """True when host_key ranks before current_key (or None) as the substring match of a label."""
+        if current_key is None:
+            return True
+        return (self._priority(norm_label, normalize_text(host_key), host_key)
+                < self._priority(norm_label, normalize_text(current_key), current_key))
+
+    def candidates_for(self, labels):
+        """Returns, for each label, the list of matching host keys in priority order."""
+        norm_labels = [normalize_text(label) for label in labels]
+        results = [[] for _ in norm_labels]
+
+        pending = {}
+        for i, norm_label in enumerate(norm_labels):
+            if not norm_label:
+                continue
+            host_key = self.norm_manual_map.get(norm_label)
+            if host_key and host_key in self.vuln_dict:
+                results[i].append(host_key)
+                continue
+            pending.setdefault(norm_label, []).append(i)
+
+        if pending:
+            # Labels without any matching host keep their empty candidate list
+            for norm_label, hosts in self._substring_matches(pending).items():
+                ordered = [
+                    host_key
+                    for norm_host, host_key in sorted(
+                        hosts, key=lambda h: self._priority(norm_label, h[0], h[1])
+                    )
+                ]
+                for i in pending[norm_label]:
+                    results[i] = list(ordered)
+        return results
+
+    def match_all(self, labels):
+        """Returns the best matching vuln_dict entry (or None) for each label."""
+        return [self.vuln_dict[c[0]] if c else None for c in self.candidates_for(labels)]
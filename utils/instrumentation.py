@@ -0,0 +1,100 @@
+import json
+import re
+import time
+from contextlib import contextmanager, nullcontext
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = "attackroute"
+
+_METRIC_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Instrumentation:
+    """
+    Per-stage timings and counters for the analysis pipeline.
+
+    stage(name) times a block, count(name, n) adds to a counter. Listeners
+    are called as listener(kind, name, value) with kind "stage" (value in
+    seconds) or "count", e.g. to forward the events to a logger or a
+    metrics client. Pass an instance to AttackGraph / run_pipeline; without
+    one the pipeline uses NULL_INSTRUMENTATION, which records nothing.
+    """
+
+    enabled = True
+
+    def __init__(self, listeners=()):
+        self.listeners = list(listeners)
+        self.reset()
+
+    def reset(self):
+        self.timings = {}   # stage -> total seconds
+        self.calls = {}     # stage -> number of runs
+        self.counters = {}  # counter -> total
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+            for listener in self.listeners:
+                listener("stage", name, elapsed)
+
+    def count(self, name: str, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        for listener in self.listeners:
+            listener("count", name, value)
+
+    # --- Export ---
+
+    def snapshot(self) -> dict:
+        """Stages (in first-run order) and counters as plain data."""
+        return {
+            "stages": {
+                name: {"seconds": round(sec, 6), "calls": self.calls[name]} for name, sec in self.timings.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix: str = METRIC_PREFIX) -> str:
+        """Prometheus text exposition format (stage seconds / runs and one counter per name)."""
+        lines = [
+            f"# HELP {prefix}_stage_seconds_total Time spent in each analysis stage.",
+            f"# TYPE {prefix}_stage_seconds_total counter",
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {sec:.6f}' for name, sec in self.timings.items()]
+        lines += [
+            f"# HELP {prefix}_stage_runs_total Number of runs of each analysis stage.",
+            f"# TYPE {prefix}_stage_runs_total counter",
+        ]
+        lines += [f'{prefix}_stage_runs_total{{stage="{name}"}} {n}' for name, n in self.calls.items()]
+        for name, value in self.counters.items():
+            metric = f"{prefix}_{_METRIC_NAME_RE.sub('_', name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+class _NullInstrumentation:
+    """Disabled instrumentation: stage() returns a shared no-op context and count() does nothing."""
+
+    enabled = False
+    _context = nullcontext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def count(self, name: str, value=1):
+        pass
+
+
+NULL_INSTRUMENTATION = _NullInstrumentation()
@@ -1,27 +1,23 @@
-import math
+import functools
+import heapq
+import itertools
 import networkx as nx
-import re
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+from utils.host_index import HostMatchIndex, normalize_text
+from utils.instrumentation import NULL_INSTRUMENTATION
+from utils.risk_paths import exploit_weights, k_riskiest_paths
+from utils.rules import DEFAULT_CONFIG, KeywordMatcher, default_rules
+from utils.scoring import RiskScorer
 
 # --- Constants ---
-ENTRY_KEYWORDS = ["web", "ui", "frontend", "shop", "wordpress"]
-CRITICAL_KEYWORDS = ["db", "redis", "api", "admin", "backend"]
+# Built-in classification rules; configurable rules are passed as a RuleSet (see utils.rules)
+ENTRY_KEYWORDS = DEFAULT_CONFIG["entry_keywords"]
+CRITICAL_KEYWORDS = DEFAULT_CONFIG["critical_keywords"]
 
 # Node importance weight configuration
-IMPORTANCE_CONFIG = {
-    "db": 4.0,
-    "redis": 3.0,
-    "api": 3.0,
-    "admin": 3.0,
-    "backend": 3.0,
-    "default": 1.0,
-}
-
-# --- Helper Functions ---
-def _normalize_text(text: str) -> str:
-    """Converts text to a consistent format for comparison."""
-    if not text:
-        return ""
-    return re.sub(r"[\s\-_]+", "", text.lower())
+IMPORTANCE_CONFIG = DEFAULT_CONFIG["importance"]
 
 # --- Graph Building and Enrichment ---
 
@@ -37,70 +33,115 @@ def build_graph_from_dict(data: dict):
 def attach_vuln_data_dict(G, vuln_dict: dict, manual_map: dict):
     """
     Attaches vulnerability data to graph nodes, prioritizing manual mapping
-    but falling back to automatic name matching.
-    """
-    # Pre-normalize maps for efficient and robust lookup
-    norm_vuln_map = {_normalize_text(k): v for k, v in vuln_dict.items()}
-    norm_manual_map = {_normalize_text(k): v for k, v in manual_map.items()}
-
-    for node_id, data in G.nodes(data=True):
-        # Initialize with defaults
-        data["Vuln_Count"] = 0
-        data["Severity"] = 0.0
-        
-        label = data.get("label")
-        if not label:
-            continue
-
-        norm_label = _normalize_text(label)
-
-        # Priority 1: Manual Mapping (normalized)
-        host_key = norm_manual_map.get(norm_label)
-        if host_key and host_key in vuln_dict:
-            v = vuln_dict[host_key]
-            data["Vuln_Count"] = v.get("Vuln_Count", 0)
-            data["Severity"] = v.get("Severity", 0.0)
-            continue # Move to next node once mapped
-
-        # Priority 2: Automatic Fallback Mapping
-        for norm_host, vuln_data in norm_vuln_map.items():
-            if norm_label in norm_host:
-                data["Vuln_Count"] = vuln_data.get("Vuln_Count", 0)
-                data["Severity"] = vuln_data.get("Severity", 0.0)
-                # print(f"Auto-mapped '{label}' to '{norm_host}'") # Optional: for debugging
-                break # Stop after first match
+    but falling back to automatic name matching (see HostMatchIndex).
+    """
+    nodes = list(G.nodes)
+    matches = HostMatchIndex(vuln_dict, manual_map).match_all([G.nodes[n].get("label") for n in nodes])
+    for node_id, v in zip(nodes, matches):
+        data = G.nodes[node_id]
+        data["Vuln_Count"] = v.get("Vuln_Count", 0) if v else 0
+        data["Severity"] = v.get("Severity", 0.0) if v else 0.0
     return G
 
 
-def compute_proximity(G, entry_nodes: list, beta: float = 0.7):
+def graph_to_csr(G):
+    """
+    Builds a compact CSR adjacency (successor lists) for G.
+    Returns (nodes, index, indptr, indices) where nodes[i] is the node id of row i.
+    """
+    nodes = list(G.nodes)
+    index = {node_id: i for i, node_id in enumerate(nodes)}
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    indices = []
+    for i, node_id in enumerate(nodes):
+        indices.extend(index[succ] for succ in G.succ[node_id])
+        indptr[i + 1] = len(indices)
+    return nodes, index, indptr, np.asarray(indices, dtype=np.int64)
+
+
+def multi_source_bfs(indptr, indices, sources):
+    """
+    Level-synchronous BFS from all sources at once over a CSR adjacency.
+    Returns (dist, nearest): hop distance to the closest source and the index
+    of that source for every node, both -1 where no source reaches the node.
+    """
+    n = len(indptr) - 1
+    dist = np.full(n, -1, dtype=np.int64)
+    nearest = np.full(n, -1, dtype=np.int64)
+
+    frontier = np.asarray(list(dict.fromkeys(sources)), dtype=np.int64)
+    dist[frontier] = 0
+    nearest[frontier] = frontier
+
+    level = 0
+    while frontier.size:
+        level += 1
+        starts = indptr[frontier]
+        counts = indptr[frontier + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            break
+
+        # Gather all out-edges of the frontier in one vectorized step
+        owner = np.repeat(frontier, counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        targets = indices[np.repeat(starts, counts) + offsets]
+
+        unseen = dist[targets] < 0
+        targets, owner = targets[unseen], owner[unseen]
+        frontier, first = np.unique(targets, return_index=True)
+        dist[frontier] = level
+        nearest[frontier] = nearest[owner[first]]
+    return dist, nearest
+
+
+def proximity_from_entries(csr, entry_nodes: list, beta: float = 0.7):
+    """
+    Returns (proximity, nearest) arrays indexed like the CSR rows:
+    exp(-beta * d) to the closest entry (0.0 when unreachable) and the row
+    index of that entry (-1 when unreachable).
+    """
+    nodes, index, indptr, indices = csr
+    sources = [index[e] for e in entry_nodes if e in index]
+    dist, nearest = multi_source_bfs(indptr, indices, sources)
+    proximity = np.where(dist >= 0, np.exp(-beta * np.maximum(dist, 0)), 0.0)
+    return proximity, nearest
+
+
+def _write_nearest_entry(G, nodes, nearest):
+    node_attrs = G.nodes
+    for node_id, i in zip(nodes, nearest.tolist()):
+        node_attrs[node_id]["nearest_entry"] = nodes[i] if i >= 0 else None
+
+
+def compute_proximity(G, entry_nodes: list, beta: float = 0.7, csr=None):
     """
     Computes proximity to entry points for all nodes in the graph.
+
+    One multi-source BFS gives the distance d to the closest entry;
+    proximity = exp(-beta * d) (0.0 when unreachable) and the closest entry
+    is stored as 'nearest_entry'. A prebuilt graph_to_csr(G) may be passed.
     """
-    for node_id in G.nodes:
-        G.nodes[node_id]["proximity"] = 0.0
-
-    for entry in entry_nodes:
-        if entry not in G:
-            continue
-        
-        lengths = nx.single_source_shortest_path_length(G, entry)
-        for target, d in lengths.items():
-            proximity = math.exp(-beta * d)
-            G.nodes[target]["proximity"] = max(
-                G.nodes[target].get("proximity", 0), proximity
-            )
+    csr = csr or graph_to_csr(G)
+    proximity, nearest = proximity_from_entries(csr, entry_nodes, beta)
+
+    nodes = csr[0]
+    node_attrs = G.nodes
+    for node_id, value in zip(nodes, proximity.tolist()):
+        node_attrs[node_id]["proximity"] = value
+    _write_nearest_entry(G, nodes, nearest)
     return G
 
-def assign_importance(G):
+def label_importance(label, rules=None) -> float:
+    """Returns the importance weight of a node label."""
+    return (rules or default_rules).importance(label)
+
+def assign_importance(G, rules=None):
     """Assigns an 'Importance' score to each node based on its label."""
-    for node_id, data in G.nodes(data=True):
-        label = data.get("label", "").lower()
-        importance = IMPORTANCE_CONFIG["default"]
-        for key, value in IMPORTANCE_CONFIG.items():
-            if key != "default" and key in label:
-                importance = value
-                break
-        data["Importance"] = importance
+    items = list(G.nodes(data=True))
+    importance, _, _ = (rules or default_rules).classify_labels(data.get("label", "") for _, data in items)
+    for (node_id, data), value in zip(items, importance):
+        data["Importance"] = value
     return G
 
 def calculate_risk_score(G):
@@ -108,70 +149,462 @@ def calculate_risk_score(G):
     Calculates the 'Risk_Score' for each node based on its attributes.
     Risk_Score = (Vuln_Count * Severity) * Importance * proximity
     """
-    for node_id, data in G.nodes(data=True):
-        vuln_count = data.get("Vuln_Count", 0)
-        severity = data.get("Severity", 0.0)
-        importance = data.get("Importance", 1.0)
-        proximity = data.get("proximity", 0.0)
-
-        risk = (vuln_count * severity) * importance * proximity
-        data["Risk_Score"] = round(risk, 6)
-    return G
+    scorer = RiskScorer.from_graph(G)
+    scorer.compute()
+    return scorer.write_back(G)
 
 # --- Node Detection and Path Extraction ---
 
+def _labeled_nodes(G):
+    if isinstance(G, CompactGraph):
+        return zip(G.node_ids, G.labels)
+    return ((node_id, data.get("label")) for node_id, data in G.nodes(data=True))
+
+@functools.lru_cache(maxsize=32)
+def _keyword_matcher(keywords: tuple) -> KeywordMatcher:
+    return KeywordMatcher(keywords)
+
 def detect_nodes_by_keywords(G, keywords: list):
     """Finds nodes whose labels contain any of the given keywords."""
-    matched_nodes = []
-    for node_id, data in G.nodes(data=True):
-        label = data.get("label", "").lower()
-        if any(k in label for k in keywords):
-            matched_nodes.append(node_id)
-    return matched_nodes
+    # The keyword list is compiled once (see KeywordMatcher) and cached
+    matcher = _keyword_matcher(tuple(keywords))
+    return [node_id for node_id, label in _labeled_nodes(G) if matcher.search((label or "").lower())]
 
-def detect_entry_nodes(G):
+def _root_nodes(G):
+    if isinstance(G, CompactGraph):
+        return [G.node_ids[i] for i in np.flatnonzero(G.in_degrees() == 0).tolist()]
+    return [n for n in G.nodes if G.in_degree(n) == 0]
+
+def _merge_entries(roots, keyword_entries):
+    # Ordered de-duplication (not a set) so results do not depend on PYTHONHASHSEED
+    return list(dict.fromkeys(roots + keyword_entries))
+
+def detect_entry_nodes(G, rules=None):
     """
     Detects potential entry nodes based on graph topology or keywords.
     """
-    entries = set(n for n in G.nodes if G.in_degree(n) == 0)
-    keyword_entries = detect_nodes_by_keywords(G, ENTRY_KEYWORDS)
-    entries.update(keyword_entries)
-    return list(entries)
+    keyword_entries = detect_nodes_by_keywords(G, (rules or default_rules).entry_keywords)
+    return _merge_entries(_root_nodes(G), keyword_entries)
 
-def detect_critical_nodes(G):
+def detect_critical_nodes(G, rules=None):
     """Detects critical nodes based on keywords in their labels."""
-    return detect_nodes_by_keywords(G, CRITICAL_KEYWORDS)
-
-def extract_attack_paths(G, entry_nodes: list, critical_nodes: list):
-    """Finds all shortest paths from entry nodes to critical nodes."""
-    paths = []
-    for e in entry_nodes:
-        for c in critical_nodes:
-            if G.has_node(e) and G.has_node(c) and nx.has_path(G, e, c):
-                for path in nx.all_shortest_paths(G, source=e, target=c):
-                    paths.append(path)
-    return paths
+    return detect_nodes_by_keywords(G, (rules or default_rules).critical_keywords)
 
-# --- Main Orchestration Function ---
+def _shortest_path_dag(adj, source):
+    """
+    BFS from source over an adjacency mapping (G.succ or G.pred).
+    Returns (dist, preds) where preds[v] lists the nodes one hop closer to
+    source on some shortest path.
+    """
+    dist = {source: 0}
+    preds = {source: []}
+    frontier = [source]
+    while frontier:
+        next_frontier = []
+        for u in frontier:
+            du = dist[u] + 1
+            for v in adj[u]:
+                dv = dist.get(v)
+                if dv is None:
+                    dist[v] = du
+                    preds[v] = [u]
+                    next_frontier.append(v)
+                elif dv == du:
+                    preds[v].append(u)
+        frontier = next_frontier
+    return dist, preds
 
-def build_attack_graph(drawio_dict, vuln_dict, manual_map, entry_nodes=None, critical_nodes=None):
+def _iter_dag_paths(preds, source, target):
+    """Lazily yields every source→target path of a shortest-path DAG."""
+    stack = [[target, 0]]
+    while stack:
+        node, i = stack[-1]
+        if node == source:
+            yield [n for n, _ in reversed(stack)]
+            stack.pop()
+        elif i < len(preds[node]):
+            stack[-1][1] = i + 1
+            stack.append([preds[node][i], 0])
+        else:
+            stack.pop()
+
+def iter_source_paths(adj, source, targets, reverse: bool = False):
     """
-    Builds and enriches the attack graph with all relevant data and calculations.
+    Shortest paths from one BFS source to each reachable target, over adj
+    (G.succ, or G.pred with reverse=True to search from critical nodes back
+    to entries; the paths are then returned entry first).
+    """
+    dist, preds = _shortest_path_dag(adj, source)
+    for t in targets:
+        if t in dist:
+            for path in _iter_dag_paths(preds, source, t):
+                yield path[::-1] if reverse else path
+
+def search_from_criticals(entries, criticals) -> bool:
+    """True when the path search runs one reverse BFS per critical node instead of one BFS per entry."""
+    return len(criticals) < len(entries)
+
+def _iter_shortest_paths(succ, pred, entries, criticals, instrumentation=NULL_INSTRUMENTATION):
+    if search_from_criticals(entries, criticals):
+        for c in criticals:
+            instrumentation.count("bfs_runs")
+            yield from iter_source_paths(pred, c, entries, reverse=True)
+    else:
+        for e in entries:
+            instrumentation.count("bfs_runs")
+            yield from iter_source_paths(succ, e, criticals)
+
+def iter_attack_paths(G, entry_nodes: list, critical_nodes: list, instrumentation=NULL_INSTRUMENTATION):
+    """
+    Lazily yields all shortest paths from entry nodes to critical nodes.
+
+    Runs one BFS per entry node, or one reverse BFS per critical node when
+    there are fewer critical nodes, and walks the resulting shortest-path
+    DAG instead of searching every (entry, critical) pair separately.
+    On a CompactGraph the search runs on row numbers.
+    """
+    entries = [e for e in dict.fromkeys(entry_nodes) if e in G]
+    criticals = [c for c in dict.fromkeys(critical_nodes) if c in G]
+    if not entries or not criticals:
+        return
+
+    if isinstance(G, CompactGraph):
+        index, ids = G.index, G.node_ids
+        paths = _iter_shortest_paths(
+            G.succ_lists(), G.pred_lists(), [index[e] for e in entries], [index[c] for c in criticals], instrumentation
+        )
+        for path in paths:
+            yield [ids[i] for i in path]
+    else:
+        yield from _iter_shortest_paths(G.succ, G.pred, entries, criticals, instrumentation)
+
+def drop_subpaths(paths):
+    """Removes duplicate paths and paths contained (contiguously) in a longer one."""
+    paths = [tuple(p) for p in paths]
+    lengths = {len(p) for p in paths}
+    contained = set()
+    for p in paths:
+        for size in lengths:
+            if size < len(p):
+                contained.update(p[i:i + size] for i in range(len(p) - size + 1))
+
+    kept = []
+    seen = set()
+    for p in paths:
+        if p not in contained and p not in seen:
+            seen.add(p)
+            kept.append(list(p))
+    return kept
+
+def path_risk(path, risk_of) -> float:
+    """Summed Risk_Score of the nodes on a path."""
+    return sum(risk_of.get(n, 0.0) for n in path)
+
+def extract_attack_paths(G, entry_nodes: list, critical_nodes: list,
+                         max_paths: int = None, top_k: int = None,
+                         dedup_subpaths: bool = False, risk_of: dict = None,
+                         instrumentation=NULL_INSTRUMENTATION):
+    """
+    Finds shortest paths from entry nodes to critical nodes.
+
+    max_paths caps how many paths are enumerated, dedup_subpaths drops
+    paths that are part of a longer one, and top_k keeps the k paths with
+    the highest summed Risk_Score (read from risk_of, or from G).
+    """
+    paths = iter_attack_paths(G, entry_nodes, critical_nodes, instrumentation)
+    if max_paths is not None:
+        paths = itertools.islice(paths, max_paths)
+    if dedup_subpaths:
+        paths = drop_subpaths(paths)
+    if top_k is not None:
+        if risk_of is None:
+            risk_of = {n: d.get("Risk_Score", 0.0) for n, d in G.nodes(data=True)}
+        return heapq.nlargest(top_k, paths, key=lambda p: path_risk(p, risk_of))
+    return list(paths)
+
+# --- Incremental Analysis ---
+
+class AttackGraph:
+    """
+    Keeps the built graph with its vulnerability data and importance, so that
+    changing the entry/critical selection only re-runs the affected stages:
+    entry changes recompute proximity, Risk_Score and paths; critical changes
+    only re-extract paths.
+
+    The graph is a CompactGraph (CSR arrays) whose columns are the
+    RiskScorer's NumPy arrays; proximity, scoring and path search all run
+    on it. A networkx DiGraph is only built when `G` is accessed.
+    Importance and the automatic entry/critical nodes follow `rules`
+    (a utils.rules.RuleSet; default_rules when not given).
     """
-    G = build_graph_from_dict(drawio_dict)
-    G = attach_vuln_data_dict(G, vuln_dict, manual_map)
 
-    if not entry_nodes:
-        entry_nodes = detect_entry_nodes(G)
-    if not critical_nodes:
-        critical_nodes = detect_critical_nodes(G)
+    def __init__(self, drawio_dict, vuln_dict, manual_map, entry_nodes=None, critical_nodes=None,
+                 beta: float = 0.7, max_paths: int = None, top_k: int = None, dedup_subpaths: bool = False,
+                 k_best: int = None, instrumentation=None, rules=None):
+        # Stage timings / counters (see utils.instrumentation); may be swapped between updates
+        self.instrumentation = instrumentation or NULL_INSTRUMENTATION
+        instr = self.instrumentation
+        with instr.stage("build_graph"):
+            self.graph = CompactGraph.from_drawio(drawio_dict)
+            self.csr = self.graph.csr
+        instr.count("nodes_processed", self.graph.number_of_nodes())
+        instr.count("edges_processed", self.graph.number_of_edges())
+        self.beta = beta
+        self.path_options = {"max_paths": max_paths, "top_k": top_k, "dedup_subpaths": dedup_subpaths, "k_best": k_best}
+
+        nodes = self.graph.node_ids
+        labels = self.graph.labels
+        self.vuln_dict = vuln_dict
+        with instr.stage("attach_vuln_data"):
+            self.host_index = HostMatchIndex(vuln_dict, manual_map)
+            host_candidates = self.host_index.candidates_for(labels)
+            # Best matching report host per node (None when unmapped)
+            self.host_of = {n: c[0] for n, c in zip(nodes, host_candidates) if c}
+            matches = [vuln_dict[c[0]] if c else None for c in host_candidates]
+
+            self.scorer = RiskScorer(nodes)
+            self.scorer.set("Vuln_Count", [v.get("Vuln_Count", 0) if v else 0 for v in matches])
+            self.scorer.set("Severity", [v.get("Severity", 0.0) if v else 0.0 for v in matches])
+        instr.count("match_attempts", len(labels))
+        instr.count("nodes_matched", len(self.host_of))
+        # Importance and the keyword entry/critical flags come from one scan of the labels
+        self.rules = rules or default_rules
+        with instr.stage("assign_importance"):
+            importance, is_entry, is_critical = self.rules.classify_labels(labels)
+            self.scorer.set("Importance", importance)
+            self.exploit_weights = dict(zip(nodes, exploit_weights(
+                self.scorer.columns["Vuln_Count"], self.scorer.columns["Severity"], self.scorer.columns["Importance"]
+            ).tolist()))
+        self.nearest = np.full(len(nodes), -1, dtype=np.int64)
+        # Lookups for incremental updates, built on first use
+        self._rows_by_host = None
+        self._rows_by_label = None
+        self._paths_by_node = None
+        self._G = None
+        self._dirty = {"Vuln_Count", "Severity", "Importance"}
+        self._sync_columns()
+        with instr.stage("detect_entry_critical"):
+            self.auto_entry_nodes = _merge_entries(
+                _root_nodes(self.graph), [n for n, flag in zip(nodes, is_entry) if flag]
+            )
+            self.auto_critical_nodes = [n for n, flag in zip(nodes, is_critical) if flag]
+        self.entry_nodes = None
+        self.critical_nodes = None
+        self.paths = []
+        self.update_selection(entry_nodes, critical_nodes)
+
+    def _sync_columns(self):
+        graph = self.graph
+        for name, values in self.scorer.columns.items():
+            graph.set_column(name, values)
+        graph.set_column("Risk_Score", self.scorer.risk)
+        graph.set_column("nearest_entry", self.nearest, node_refs=True)
+
+    @property
+    def G(self):
+        """A networkx DiGraph of the graph, with any pending score columns written back."""
+        if self._G is None:
+            self._G = self.graph.to_networkx(columns=[])
+        if self._dirty:
+            self.scorer.write_back(self._G, sorted(self._dirty - {"nearest_entry"}))
+            if "nearest_entry" in self._dirty:
+                _write_nearest_entry(self._G, self.csr[0], self.nearest)
+            self._dirty = set()
+        return self._G
+
+    def risk_frame(self):
+        """Returns the per-node scoring table as a DataFrame (no networkx graph needed)."""
+        return self.scorer.to_dataframe(labels=self.graph.labels)
+
+    def _rescore(self):
+        instr = self.instrumentation
+        with instr.stage("compute_proximity"):
+            proximity, self.nearest = proximity_from_entries(self.csr, self.entry_nodes, self.beta)
+            self.scorer.set("proximity", proximity)
+        instr.count("bfs_runs")
+        with instr.stage("calculate_risk_score"):
+            self.scorer.compute()
+            self._sync_columns()
+        instr.count("nodes_scored", len(self.csr[0]))
+        self._dirty.update(("proximity", "Risk_Score", "nearest_entry"))
+
+    def _extract_paths(self):
+        instr = self.instrumentation
+        with instr.stage("extract_attack_paths"):
+            self.paths = self._find_paths()
+            self._paths_by_node = None
+        instr.count("paths_found", len(self.paths))
+
+    def _find_paths(self):
+        options = dict(self.path_options)
+        k_best = options.pop("k_best")
+        if k_best:
+            # Risk-weighted mode: the k most exploitable paths, not only the shortest ones
+            return k_riskiest_paths(
+                self.graph, self.entry_nodes, self.critical_nodes, k=k_best, weight_of=self.exploit_weights,
+                instrumentation=self.instrumentation,
+            )
+
+        risk_of = None
+        if options["top_k"] is not None:
+            risk_of = dict(zip(self.csr[0], self.scorer.risk.tolist()))
+        return extract_attack_paths(
+            self.graph, self.entry_nodes, self.critical_nodes, risk_of=risk_of,
+            instrumentation=self.instrumentation, **options
+        )
 
-    # Compute metrics and risk
-    G = compute_proximity(G, entry_nodes)
-    G = assign_importance(G)
-    G = calculate_risk_score(G)
+    def configure_paths(self, max_paths: int = None, top_k: int = None, dedup_subpaths: bool = False,
+                        k_best: int = None):
+        """
+        Changes the path enumeration limits; only re-extracts paths when they differ.
+        With k_best set, the k most exploitable paths are returned instead of shortest paths.
+        """
+        options = {"max_paths": max_paths, "top_k": top_k, "dedup_subpaths": dedup_subpaths, "k_best": k_best}
+        if options == self.path_options:
+            return False
+        self.path_options = options
+        self._extract_paths()
+        return True
 
-    # Find attack paths
-    paths = extract_attack_paths(G, entry_nodes, critical_nodes)
+    def update_selection(self, entry_nodes=None, critical_nodes=None):
+        """
+        Applies a new entry/critical selection (None or empty = auto-detected).
+        Returns True when anything was recomputed.
+        """
+        entries = list(entry_nodes) if entry_nodes else self.auto_entry_nodes
+        criticals = list(critical_nodes) if critical_nodes else self.auto_critical_nodes
 
-    return G, paths
+        entries_changed = entries != self.entry_nodes
+        criticals_changed = criticals != self.critical_nodes
+        self.entry_nodes = entries
+        self.critical_nodes = criticals
+
+        if entries_changed:
+            self._rescore()
+        if entries_changed or criticals_changed:
+            self._extract_paths()
+        return entries_changed or criticals_changed
+
+    # --- Incremental vulnerability updates ---
+
+    def _host_rows(self):
+        if self._rows_by_host is None:
+            index = self.graph.index
+            self._rows_by_host = {}
+            for node_id, host_key in self.host_of.items():
+                self._rows_by_host.setdefault(host_key, set()).add(index[node_id])
+        return self._rows_by_host
+
+    def _label_rows(self):
+        if self._rows_by_label is None:
+            self._rows_by_label = {}
+            for i, label in enumerate(self.graph.labels):
+                norm_label = normalize_text(label)
+                if norm_label:
+                    self._rows_by_label.setdefault(norm_label, []).append(i)
+        return self._rows_by_label
+
+    def host_rows(self, host_keys) -> set:
+        """Row numbers of the nodes mapped to any of the given report hosts."""
+        rows_by_host = self._host_rows()
+        return {i for host_key in host_keys for i in rows_by_host.get(host_key, ())}
+
+    def _assign_host(self, i: int, host_key: str):
+        node_id = self.graph.node_ids[i]
+        rows_by_host = self._host_rows()
+        old = self.host_of.get(node_id)
+        if old is not None:
+            rows_by_host[old].discard(i)
+        self.host_of[node_id] = host_key
+        rows_by_host.setdefault(host_key, set()).add(i)
+
+    def _match_new_hosts(self, new_hosts) -> set:
+        """Maps the labels matching newly added hosts (manual map first, then better substring matches)."""
+        index = self.host_index
+        index.add_hosts(new_hosts)
+        rows_by_label = self._label_rows()
+        node_ids = self.graph.node_ids
+        moved = set()
+        for host_key in new_hosts:
+            manual, contained = index.labels_for_host(host_key, rows_by_label)
+            for norm_label in manual:
+                for i in rows_by_label[norm_label]:
+                    self._assign_host(i, host_key)
+                    moved.add(i)
+            for norm_label in contained:
+                if index.is_manual(norm_label):
+                    continue
+                for i in rows_by_label[norm_label]:
+                    if index.prefers(norm_label, host_key, self.host_of.get(node_ids[i])):
+                        self._assign_host(i, host_key)
+                        moved.add(i)
+        return moved
+
+    def update_vuln_data(self, changed_hosts, new_hosts=()):
+        """
+        Applies new aggregates of the given vuln_dict hosts (updated in place,
+        e.g. by update_host_aggregates) and re-scores only the nodes mapped to
+        them. new_hosts (hosts that were not in vuln_dict before) are matched
+        against the labels without matching every node again.
+
+        Returns (rows, paths_changed): the row numbers whose scores were
+        recomputed, and whether the paths were re-extracted. Shortest paths do
+        not depend on the scores; top_k / k_best rankings do and are redone.
+        """
+        instr = self.instrumentation
+        node_ids = self.graph.node_ids
+        with instr.stage("update_vuln_data"):
+            affected = self._match_new_hosts(new_hosts) if new_hosts else set()
+            rows_by_host = self._host_rows()
+            for host_key in changed_hosts:
+                affected.update(rows_by_host.get(host_key, ()))
+            rows = sorted(affected)
+
+            if rows:
+                columns = self.scorer.columns
+                vuln_count, severity = columns["Vuln_Count"], columns["Severity"]
+                for i in rows:
+                    data = self.vuln_dict[self.host_of[node_ids[i]]]
+                    vuln_count[i] = data.get("Vuln_Count", 0)
+                    severity[i] = data.get("Severity", 0.0)
+                self.scorer.compute_rows(rows)
+                weights = exploit_weights(vuln_count[rows], severity[rows], columns["Importance"][rows])
+                for i, w in zip(rows, weights.tolist()):
+                    self.exploit_weights[node_ids[i]] = w
+                self._dirty.update(("Vuln_Count", "Severity", "Risk_Score"))
+        instr.count("nodes_rescored", len(rows))
+
+        paths_changed = bool(rows) and (self.path_options["k_best"] or self.path_options["top_k"] is not None)
+        if paths_changed:
+            self._extract_paths()
+        return rows, bool(paths_changed)
+
+    def paths_through(self, node_ids) -> list:
+        """Indices of the current paths that pass through any of the given nodes."""
+        if self._paths_by_node is None:
+            self._paths_by_node = {}
+            for k, path in enumerate(self.paths):
+                for node_id in path:
+                    self._paths_by_node.setdefault(node_id, set()).add(k)
+        return sorted({k for node_id in node_ids for k in self._paths_by_node.get(node_id, ())})
+
+    def set_entry_nodes(self, entry_nodes):
+        return self.update_selection(entry_nodes, self.critical_nodes)
+
+    def set_critical_nodes(self, critical_nodes):
+        return self.update_selection(self.entry_nodes, critical_nodes)
+
+
+# --- Main Orchestration Function ---
+
+def build_attack_graph(drawio_dict, vuln_dict, manual_map, entry_nodes=None, critical_nodes=None,
+                       instrumentation=None, **path_options):
+    """
+    Builds and enriches the attack graph with all relevant data and calculations.
+    path_options (max_paths, top_k, dedup_subpaths, k_best) select and bound the path enumeration;
+    an Instrumentation records per-stage timings and counters.
+    """
+    attack_graph = AttackGraph(
+        drawio_dict, vuln_dict, manual_map, entry_nodes, critical_nodes, instrumentation=instrumentation, **path_options
+    )
+    return attack_graph.G, attack_graph.paths
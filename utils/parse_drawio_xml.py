@@ -1,82 +1,188 @@
+import base64
 import html
 import re
+import zlib
+from urllib.parse import unquote
 from xml.etree import ElementTree as ET
 
+# Bump when the parser output changes (invalidates cached parse results)
+PARSER_VERSION = 2
 
-def parse_mxfile(xml_text: str):
+# Size of the text slices fed to the pull parser
+FEED_CHUNK = 1 << 20
+
+# <br>, </p> and </div> become a space to preserve separation; all other tags are removed
+_LABEL_TAG_RE = re.compile(r"(</p>|<br/?>|</div>)|<[^>]+>", re.I)
+
+# Wrappers that carry the id and label of the mxCell inside them
+_WRAPPERS = ("UserObject", "object")
+
+
+def decode_diagram(text: str) -> str:
     """
-    Parse pure draw.io XML (the content of a .drawio file)
+    Decodes a compressed <diagram> payload (base64 + raw deflate + URL encoding),
+    the default storage format of draw.io.
     """
-    root = ET.fromstring(xml_text)
-    cells = []
+    data = zlib.decompress(base64.b64decode(text.strip()), -15)
+    return unquote(data.decode("utf-8"))
 
-    for mxcell in root.iter("mxCell"):
-        attr = mxcell.attrib.copy()
 
-        geom = mxcell.find("mxGeometry")
-        geom_attrib = geom.attrib.copy() if geom is not None else {}
+def clean_label(value: str) -> str:
+    """Turns an HTML cell value into a plain, escaped label."""
+    value = html.unescape(value)
+    if "<" in value:
+        value = _LABEL_TAG_RE.sub(lambda m: " " if m.group(1) else "", value)
+    # Consolidate whitespace and strip leading/trailing spaces
+    return html.escape(" ".join(value.split()))
 
-        value = html.unescape(attr.get("value", ""))
 
-        cells.append({
-            "id": attr.get("id"),
-            "value": value,
-            "vertex": attr.get("vertex"),
-            "edge": attr.get("edge"),
-            "source": attr.get("source"),
-            "target": attr.get("target"),
-            "parent": attr.get("parent"),
-            "style": attr.get("style"),
-            "geometry": geom_attrib
-        })
+def _iter_end_events(xml_text: str):
+    parser = ET.XMLPullParser(events=("end",))
+    for start in range(0, len(xml_text), FEED_CHUNK):
+        parser.feed(xml_text[start:start + FEED_CHUNK])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
 
-    return cells
 
+class _GraphBuilder:
+    """Collects nodes and edges while the document is being parsed."""
 
-def to_graph_json(cells):
-    """
-    Convert parsed cells → nodes + edges dictionary
-    """
-    nodes = []
-    edges = []
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.seen_ids = set()
+        # Start of the current page in nodes / edges
+        self.page_start = (0, 0)
 
-    for c in cells:
+    def add(self, cell, owner):
         # vertex = node
-        if c.get("vertex") == "1":
-            value = c.get("value") or ""
-            # Replace <br>, </p>, </div> with a space to preserve separation
-            value_with_spaces = re.sub(r"</p>|<br/?>|</div>", " ", value, flags=re.I)
-            # Remove all other HTML tags
-            stripped_value = re.sub(r"<[^>]+>", "", value_with_spaces)
-            # Consolidate whitespace and strip leading/trailing spaces
-            label = re.sub(r"\s+", " ", stripped_value).strip()
-
-            nodes.append({
-                "id": c["id"],
-                "label": html.escape(label),
-                "style": c.get("style"),
-                "geometry": c.get("geometry"),
+        if cell.get("vertex") == "1":
+            geom = cell.find("mxGeometry")
+            value = owner.get("label") if owner.tag in _WRAPPERS else cell.get("value")
+            self.nodes.append({
+                "id": owner.get("id"),
+                "label": clean_label(value or ""),
+                "style": cell.get("style"),
+                "geometry": dict(geom.attrib) if geom is not None else {},
+                "parent": cell.get("parent"),
+                "page": None,
             })
 
         # edge
-        if c.get("edge") == "1":
-            edges.append({
-                "id": c["id"],
-                "source": c.get("source"),
-                "target": c.get("target"),
-                "style": c.get("style"),
+        if cell.get("edge") == "1":
+            self.edges.append({
+                "id": owner.get("id"),
+                "source": cell.get("source"),
+                "target": cell.get("target"),
+                "style": cell.get("style"),
+                "page": None,
             })
 
-    return {"nodes": nodes, "edges": edges}
+    def end_page(self, page_id=None, name=None):
+        """
+        Finishes the nodes/edges added since the last page. Node ids are kept
+        unless they repeat an earlier page's, in which case they are prefixed
+        with the page id (and the page's edges and parents follow).
+        """
+        node_start, edge_start = self.page_start
+        page_nodes = self.nodes[node_start:]
+        page_edges = self.edges[edge_start:]
+        renamed = {}
+        for node in page_nodes:
+            if node["id"] in self.seen_ids:
+                renamed[node["id"]] = f"{page_id}:{node['id']}"
+        for node in page_nodes:
+            node["id"] = renamed.get(node["id"], node["id"])
+            node["page"] = name
+            if renamed:
+                node["parent"] = renamed.get(node["parent"], node["parent"])
+            self.seen_ids.add(node["id"])
+        for edge in page_edges:
+            edge["page"] = name
+            if renamed:
+                edge["source"] = renamed.get(edge["source"], edge["source"])
+                edge["target"] = renamed.get(edge["target"], edge["target"])
+        _resolve_bounds(page_nodes)
+        self.page_start = (len(self.nodes), len(self.edges))
+
+    def parse(self, xml_text: str):
+        """
+        Streams one document (plain <mxGraphModel> or an <mxfile> whose
+        <diagram> pages may be compressed). Elements are cleared as soon as
+        they have been read, so memory does not grow with the element tree.
+        """
+        for _, elem in _iter_end_events(xml_text):
+            tag = elem.tag
+            if tag == "mxCell":
+                # Cells inside UserObject/object carry no id; the wrapper handles them
+                if elem.get("id") is None:
+                    continue
+                self.add(elem, elem)
+            elif tag in _WRAPPERS:
+                cell = elem.find("mxCell")
+                self.add(cell if cell is not None else elem, elem)
+            elif tag == "diagram":
+                # Compressed pages hold their model as text instead of child elements
+                if len(elem) == 0 and elem.text and elem.text.strip():
+                    self.parse(decode_diagram(elem.text))
+                self.end_page(elem.get("id"), elem.get("name"))
+            else:
+                continue
+            elem.clear()
+
+
+def _float(geometry, name):
+    try:
+        return float(geometry.get(name) or 0)
+    except ValueError:
+        return 0.0
+
+
+def _resolve_bounds(nodes):
+    """
+    Absolute (x, y, width, height) per node. Children of groups/containers
+    store coordinates relative to their parent vertex.
+    """
+    by_id = {n["id"]: n for n in nodes}
+    origins = {}
+
+    for node in nodes:
+        geom = node["geometry"]
+        if not geom or ("x" not in geom and "y" not in geom and "width" not in geom):
+            node["bounds"] = None
+            continue
+
+        parent = by_id.get(node["parent"])
+        if parent is None:
+            # Top-level cell: coordinates are already absolute
+            x, y = _float(geom, "x"), _float(geom, "y")
+        else:
+            # Walk up the chain of parent vertices (cycle-safe), then add up the offsets
+            chain = [node]
+            while parent is not None and parent["id"] not in origins and parent not in chain:
+                chain.append(parent)
+                parent = by_id.get(parent["parent"])
+            x, y = origins.get(parent["id"], (0.0, 0.0)) if parent is not None else (0.0, 0.0)
+            for member in reversed(chain):
+                x += _float(member["geometry"], "x")
+                y += _float(member["geometry"], "y")
+                origins[member["id"]] = (x, y)
+        origins[node["id"]] = (x, y)
+        node["bounds"] = (x, y, _float(geom, "width"), _float(geom, "height"))
 
 
 def parse_drawio_xml(xml_text: str):
     """
-    Entry point: parse only pure draw.io XML
+    Entry point: parse a draw.io document (plain or compressed, single or
+    multi-page) into nodes and edges in one streaming pass
     """
-    cells = parse_mxfile(xml_text)
-    graph = to_graph_json(cells)
-    return graph
+    builder = _GraphBuilder()
+    builder.parse(xml_text)
+    if builder.page_start != (len(builder.nodes), len(builder.edges)):
+        # Plain <mxGraphModel> documents have no <diagram> page
+        builder.end_page()
+    return {"nodes": builder.nodes, "edges": builder.edges}
 
 
 
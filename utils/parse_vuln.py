@@ -1,7 +1,35 @@
-import re
+import codecs
 import html
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
 from urllib.parse import urlparse
 
+from utils.rules import default_rules
+
+# Bump when the parser output changes (invalidates cached parse results)
+PARSER_VERSION = 1
+
+# Read size used by the streaming parser (bytes or characters per read() call)
+CHUNK_SIZE = 1 << 20
+
+# セキュリティリスクレベルの基準値
+SEV_MAP = {"info": 1, "low": 2, "medium": 3, "high": 4, "critical": 5}
+
+# The optional lookahead captures host/port of "http(s)://host:port" URLs in the same match
+NUCLEI_LINE_RE = re.compile(
+    r"\[(?P<template>[^\]]+)\]\s+\[[^\]]+\]\s+\[(?P<sev>[^\]]+)\]\s+"
+    r"(?:(?=https?://(?P<host>[^/:\s]+)(?::(?P<port>\d+))?))?(?P<url>.*)"
+)
+URL_HOST_RE = re.compile(r"https?://([^/:]+)(?::(\d+))?")
+NIKTO_HOST_RE = re.compile(r"Target Host:\s*(\S+)")
+NIKTO_PORT_RE = re.compile(r"Target Port:\s*(\d+)")
+NIKTO_PATH_RE = re.compile(r"^(?:[A-Z]+)\s+([^\s:]+)")
+_HTML_SPECIAL_RE = re.compile(r"[&<>\"']")
+
+
 def read_file(path: str) -> str:
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
         return f.read()
@@ -15,98 +43,329 @@ def detect_tool(text: str) -> str:
     else:
         return "unknown"
 
+
+def iter_blocks(source, chunk_size: int = CHUNK_SIZE):
+    """
+    Yields blocks of complete lines from a path or a file object, reading it
+    in fixed-size chunks so memory use does not grow with file size.
+    Binary file objects are decoded as UTF-8.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from iter_blocks(f, chunk_size)
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    pending = ""
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        pending += chunk
+        cut = pending.rfind("\n")
+        if cut < 0:
+            continue
+        block, pending = pending[:cut + 1], pending[cut + 1:]
+        yield block
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+# --- Line Parsers ---
+
+def _escape(text: str) -> str:
+    # Most URLs contain nothing to escape; skip html.escape for those
+    return html.escape(text) if _HTML_SPECIAL_RE.search(text) else text
+
+
+# Template names repeat across millions of lines, so their escaped form is memoized
+_escape_title = lru_cache(maxsize=4096)(html.escape)
+
+
+def _nuclei_finding(m):
+    template, sev, host, port, raw_url = m.group("template", "sev", "host", "port", "url")
+    clean_url = raw_url.strip().split(" ")[0]
+
+    if host is not None:
+        port = int(port) if port else 80
+        return {
+            "tool": "nuclei",
+            "host": host,
+            "port": port,
+            "url": _escape(clean_url),
+            "title": _escape_title(template),
+            "severity": SEV_MAP.get(sev.lower(), 1)
+        }
+
+    host = "unknown"
+    port = 80
+
+    host_match = URL_HOST_RE.search(clean_url)
+    if host_match:
+        host = host_match.group(1)
+        if host_match.group(2):
+            port = int(host_match.group(2))
+    else:
+        parts = clean_url.split(':')
+        host_and_path = parts[0]
+        host = host_and_path.split('/')[0]
+        if len(parts) > 1:
+            port_and_path = parts[1]
+            port_str = port_and_path.split('/')[0]
+            if port_str.isdigit():
+                port = int(port_str)
+
+    return {
+        "tool": "nuclei",
+        "host": host,
+        "port": port,
+        "url": _escape(clean_url),
+        "title": _escape_title(template),
+        "severity": SEV_MAP.get(sev.lower(), 1)
+    }
+
+
+def _nikto_finding(msg: str, host: str, port: int, rules):
+    path_match = NIKTO_PATH_RE.search(msg)
+    if path_match:
+        path = path_match.group(1)
+        if not path.startswith('/'):
+            path = '/' + path
+        url = f"http://{host}:{port}{path}"
+    else:
+        url = f"http://{host}:{port}/"
+
+    # セキュリティリスクレベルの基準値 (RuleSet.nikto_severity)
+    sev = rules.nikto_severity(msg)
+
+    return {
+        "tool": "nikto",
+        "host": host,
+        "port": port,
+        "url": html.escape(url),
+        "title": html.escape(msg[:80]),
+        "severity": sev
+    }
+
+
+class ReportStreamParser:
+    """
+    Incremental parser for a single Nuclei/Nikto report.
+
+    Text is fed in blocks of complete lines and findings are yielded as soon
+    as they can be built. When the tool is not given it is detected from the
+    first block carrying a Nikto/Nuclei marker; blocks seen before that are
+    replayed once the tool is known. Nikto findings are held back only until
+    the target host and port header lines have been seen. Nikto severities
+    follow `rules` (a utils.rules.RuleSet; default_rules when not given).
+    """
+
+    def __init__(self, tool: str = None, rules=None):
+        self.tool = tool
+        self.rules = rules or default_rules
+        self._undetected = []
+        self._nikto_host = None
+        self._nikto_port = None
+        self._nikto_pending = []
+
+    def feed(self, block: str):
+        """Parses a block of complete lines and yields the findings it completed."""
+        if self.tool is None:
+            tool = detect_tool(block)
+            if tool == "unknown":
+                self._undetected.append(block)
+                return
+            self.tool = tool
+            replay, self._undetected = self._undetected, []
+            for prev in replay:
+                yield from self.feed(prev)
+
+        if self.tool == "nuclei":
+            yield from map(_nuclei_finding, NUCLEI_LINE_RE.finditer(block))
+        elif self.tool == "nikto":
+            yield from self._feed_nikto(block)
+
+    def _feed_nikto(self, block: str):
+        if self._nikto_host is None:
+            m = NIKTO_HOST_RE.search(block)
+            if m:
+                self._nikto_host = m.group(1)
+        if self._nikto_port is None:
+            m = NIKTO_PORT_RE.search(block)
+            if m:
+                self._nikto_port = int(m.group(1))
+
+        self._nikto_pending.extend(line[2:].strip() for line in block.splitlines() if line.startswith("+ "))
+        if self._nikto_host is not None and self._nikto_port is not None:
+            yield from self._flush_nikto()
+
+    def _flush_nikto(self):
+        host = self._nikto_host if self._nikto_host is not None else "unknown"
+        port = self._nikto_port if self._nikto_port is not None else 80
+        pending, self._nikto_pending = self._nikto_pending, []
+        for msg in pending:
+            yield _nikto_finding(msg, host, port, self.rules)
+
+    def close(self):
+        """Yields the findings still held back at the end of the report."""
+        self._undetected = []
+        if self.tool == "nikto":
+            yield from self._flush_nikto()
+
+
+def iter_findings(blocks, tool: str = None, rules=None):
+    """Yields findings from an iterable of text blocks (each made of complete lines)."""
+    parser = ReportStreamParser(tool, rules)
+    for block in blocks:
+        yield from parser.feed(block)
+    yield from parser.close()
+
+
 # extract tool, host, port, url, title, severity
-def extract_findings(text: str, tool: str):
-    findings = []
-
-    if tool == "nuclei":
-        pattern = re.compile(r"\[(?P<template>[^\]]+)\]\s+\[[^\]]+\]\s+\[(?P<sev>[^\]]+)\]\s+(?P<url>.*)")
-        for m in pattern.finditer(text):
-            raw_url = m.group("url").strip()
-            clean_url = raw_url.split(" ")[0]
-            
-            host = "unknown"
-            port = 80
-
-            host_match = re.search(r"https?://([^/:]+)(?::(\d+))?", clean_url)
-            if host_match:
-                host = host_match.group(1)
-                if host_match.group(2):
-                    port = int(host_match.group(2))
-            else:
-                parts = clean_url.split(':')
-                host_and_path = parts[0]
-                host = host_and_path.split('/')[0]
-                if len(parts) > 1:
-                    port_and_path = parts[1]
-                    port_str = port_and_path.split('/')[0]
-                    if port_str.isdigit():
-                        port = int(port_str)
-
-            sev_map = {"info":1,"low":2,"medium":3,"high":4,"critical":5} #セキュリティリスクレベルの基準値
-            findings.append({
-                "tool": "nuclei",
-                "host": host,
-                "port": port,
-                "url": html.escape(clean_url),
-                "title": html.escape(m.group("template")),
-                "severity": sev_map.get(m.group("sev").lower(),1)
-            })
-
-    elif tool == "nikto":
-        host_match = re.search(r"Target Host:\s*(\S+)", text)
-        port_match = re.search(r"Target Port:\s*(\d+)", text)
-        host = host_match.group(1) if host_match else "unknown"
-        port = int(port_match.group(1)) if port_match else 80
-
-        for line in text.splitlines():
-            if line.startswith("+ "):
-                msg = line[2:].strip()
-                
-                path_match = re.search(r"^(?:[A-Z]+)\s+([^\s:]+)", msg)
-                if path_match:
-                    path = path_match.group(1)
-                    if not path.startswith('/'):
-                        path = '/' + path
-                    url = f"http://{host}:{port}{path}"
-                else:
-                    url = f"http://{host}:{port}/"
-
-                # セキュリティリスクレベルの基準値
-                sev = 2
-                if "missing" in msg.lower(): sev = 3
-                if "config" in msg.lower(): sev = 4 
-                
-                findings.append({
-                    "tool": "nikto",
-                    "host": host,
-                    "port": port,
-                    "url": html.escape(url),
-                    "title": html.escape(msg[:80]),
-                    "severity": sev
-                })
-    return findings
-
-
-def parse_vuln_report_text(text: str):
-    ## text = read_file(filepath)
-    
-    tool = detect_tool(text)
-    findings = extract_findings(text, tool)
+def extract_findings(text: str, tool: str, rules=None):
+    return list(iter_findings([text], tool, rules))
+
+
+def aggregate_findings(findings, keep_findings: bool = True):
+    """
+    Groups findings per host:port with running Vuln_Count / severity sums.
+    With keep_findings=False the individual findings are dropped, so memory
+    only grows with the number of hosts.
+    """
+    # (host, port) -> [count, severity sum, findings]
+    groups = {}
+    for f in findings:
+        key = (f["host"], f["port"])
+        acc = groups.get(key)
+        if acc is None:
+            acc = groups[key] = [0, 0, []]
+        acc[0] += 1
+        acc[1] += f["severity"]
+        if keep_findings:
+            acc[2].append(f)
 
     hosts = {}
+    for (host, port), (count, sev_sum, host_findings) in groups.items():
+        hosts[f"{host}:{port}"] = {
+            "findings": host_findings,
+            "host": host,
+            "port": port,
+            "Vuln_Count": count,
+            "Severity": round(sev_sum / count, 2),
+            "Severity_Sum": sev_sum,
+        }
+    return hosts
+
+
+def update_host_aggregates(hosts: dict, findings, keep_findings: bool = True) -> dict:
+    """
+    Adds findings to a host dictionary (as built by aggregate_findings) in place.
+
+    Returns {host key: number of added findings}. Only the hosts that got new
+    findings are touched, so the cost grows with the new findings, not with
+    the findings already aggregated.
+    """
+    added = {}
     for f in findings:
         key = f"{f['host']}:{f['port']}"
-        if key not in hosts:
-            hosts[key] = {"findings": [], "host": f["host"], "port": f["port"]}
-        hosts[key]["findings"].append(f)
+        data = hosts.get(key)
+        if data is None:
+            data = hosts[key] = {
+                "findings": [],
+                "host": f["host"],
+                "port": f["port"],
+                "Vuln_Count": 0,
+                "Severity": 0.0,
+                "Severity_Sum": 0,
+            }
+        data["Vuln_Count"] += 1
+        data["Severity_Sum"] += f["severity"]
+        if keep_findings:
+            data["findings"].append(f)
+        added[key] = added.get(key, 0) + 1
 
-    for h, data in hosts.items():
-        sev_values = [f["severity"] for f in data["findings"]]
-        data["Vuln_Count"] = len(sev_values)
-        data["Severity"] = round(sum(sev_values) / len(sev_values), 2) if sev_values else 0
+    for key in added:
+        data = hosts[key]
+        data["Severity"] = round(data["Severity_Sum"] / data["Vuln_Count"], 2)
+    return added
+
+
+def parse_vuln_report_text(text: str, rules=None):
+    ## text = read_file(filepath)
+
+    tool = detect_tool(text)
+    return aggregate_findings(iter_findings([text], tool, rules))
+
+
+def parse_vuln_report_stream(source, keep_findings: bool = True, chunk_size: int = CHUNK_SIZE, rules=None):
+    """
+    Parses a report from a path or file object without loading it into memory.
+    """
+    return aggregate_findings(iter_findings(iter_blocks(source, chunk_size), rules=rules), keep_findings=keep_findings)
+
+def merge_host_aggregates(*parts):
+    """
+    Merges per-report host dictionaries into a new one.
+
+    Counts and severity sums are added, findings are concatenated in report
+    order and Severity is derived from the merged sums, so no finding needs
+    to be re-scanned. The merge is associative and leaves its inputs untouched.
+    """
+    merged = {}
+    for part in parts:
+        for key, value in part.items():
+            data = merged.get(key)
+            if data is None:
+                merged[key] = dict(value, findings=list(value["findings"]))
+                continue
+            data["findings"].extend(value["findings"])
+            data["Vuln_Count"] += value["Vuln_Count"]
+            data["Severity_Sum"] += value["Severity_Sum"]
+
+    for data in merged.values():
+        count = data["Vuln_Count"]
+        data["Severity"] = round(data["Severity_Sum"] / count, 2) if count else 0
+    return merged
+
+
+def _parse_source(source, keep_findings: bool = True, rules=None):
+    """Parses one report given as a path or as raw bytes (process pool worker)."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    return parse_vuln_report_stream(source, keep_findings=keep_findings, rules=rules)
+
+
+def parse_each_report(sources, workers: int = None, keep_findings: bool = True, rules=None):
+    """
+    Parses several reports (paths or raw bytes) and returns one host
+    dictionary per report, in input order. Reports are parsed on a process
+    pool when workers > 1 (default: one process per CPU).
+    """
+    sources = list(sources)
+    # RuleSets pickle as their config and are recompiled once per task in the workers
+    parse = partial(_parse_source, keep_findings=keep_findings, rules=rules)
+    if workers is None:
+        workers = min(len(sources), os.cpu_count() or 1)
+
+    if workers <= 1 or len(sources) <= 1:
+        return [parse(src) for src in sources]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(parse, sources))
+
+
+def parse_vuln_reports(sources, workers: int = None, keep_findings: bool = True, rules=None):
+    """
+    Parses several reports and merges their host aggregates.
+
+    Results are merged in input order, so the output is identical to
+    parsing the reports one by one.
+    """
+    return merge_host_aggregates(*parse_each_report(sources, workers=workers, keep_findings=keep_findings, rules=rules))
 
-    return hosts
 
 ## if __name__ == "__main__":
 ##     import argparse
@@ -0,0 +1,296 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from utils.cache import cached_parse_drawio_xml, cached_parse_vuln_reports
+from utils.parse_drawio_xml import parse_drawio_xml
+from utils.parse_vuln import merge_host_aggregates, parse_vuln_report_text, parse_vuln_reports
+from utils.networkx_core import AttackGraph
+from utils.retrieval import DEFAULT_MAX_CHARS, path_contexts
+from utils.risk_paths import path_exploitability
+
+# Columns written to the risk table (same order as the Streamlit view)
+RISK_TABLE_COLUMNS = ["id", "label", "Risk_Score", "Vuln_Count", "Severity", "Importance", "proximity"]
+
+
+class StageTimer:
+    """Collects wall-clock timings for each named pipeline stage."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - start)
+
+
+# --- Input Helpers ---
+
+def read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
+
+
+def list_report_files(report_dir: str):
+    """Returns the report files (*.txt) in a directory, sorted by name."""
+    return sorted(
+        os.path.join(report_dir, name)
+        for name in os.listdir(report_dir)
+        if name.lower().endswith(".txt") and os.path.isfile(os.path.join(report_dir, name))
+    )
+
+
+def resolve_labels(drawio_dict: dict, labels):
+    """Maps draw.io labels to node ids, ignoring unknown labels."""
+    label_to_id = {node['label']: node['id'] for node in drawio_dict.get('nodes', []) if node.get('label')}
+    return [label_to_id[label] for label in labels or [] if label in label_to_id]
+
+
+def resolve_edges(drawio_dict: dict, label_pairs):
+    """Maps (source label, target label) pairs to node id pairs; raises ValueError for unknown labels."""
+    label_to_id = {node['label']: node['id'] for node in drawio_dict.get('nodes', []) if node.get('label')}
+    edges = []
+    for source, target in label_pairs or []:
+        missing = [label for label in (source, target) if label not in label_to_id]
+        if missing:
+            raise ValueError(f"unknown node label: {', '.join(missing)}")
+        edges.append((label_to_id[source], label_to_id[target]))
+    return edges
+
+
+# --- Output Helpers ---
+
+def risk_table(G):
+    """Returns one row per node, sorted by Risk_Score (highest first). G may be a CompactGraph."""
+    rows = []
+    for node_id, data in G.nodes(data=True):
+        row = {"id": node_id}
+        row.update({col: data.get(col) for col in RISK_TABLE_COLUMNS if col != "id"})
+        rows.append(row)
+    rows.sort(key=lambda r: r.get("Risk_Score") or 0.0, reverse=True)
+    return rows
+
+
+def path_records(G, attack_paths, weight_of: dict = None):
+    """
+    Returns attack paths with labels and per-node Risk_Score
+    (plus cumulative exploitability when exploit weights are given).
+    """
+    records = []
+    for path in attack_paths:
+        nodes = [
+            {
+                "id": node_id,
+                "label": G.nodes[node_id].get("label", "unknown"),
+                "Risk_Score": G.nodes[node_id].get("Risk_Score", 0.0),
+            }
+            for node_id in path
+        ]
+        record = {
+            "path": list(path),
+            "labels": [n["label"] for n in nodes],
+            "total_risk": round(sum(n["Risk_Score"] for n in nodes), 6),
+            "nodes": nodes,
+        }
+        if weight_of is not None:
+            record["exploitability"] = round(path_exploitability(path, weight_of), 6)
+        records.append(record)
+    return records
+
+
+def write_results(result: dict, out_dir: str, formats=("json", "csv")):
+    """
+    Writes the risk table, attack paths and timings of a pipeline result to out_dir.
+    Returns the list of written files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+
+    def _write_json(name, payload):
+        path = os.path.join(out_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+        written.append(path)
+
+    if "json" in formats:
+        _write_json("risk_table.json", result["risk_table"])
+        _write_json("attack_paths.json", result["paths"])
+    if "csv" in formats:
+        path = os.path.join(out_dir, "risk_table.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=RISK_TABLE_COLUMNS)
+            writer.writeheader()
+            writer.writerows(result["risk_table"])
+        written.append(path)
+
+        path = os.path.join(out_dir, "attack_paths.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["index", "total_risk", "path", "labels"])
+            for i, rec in enumerate(result["paths"], start=1):
+                writer.writerow([i, rec["total_risk"], " -> ".join(rec["path"]), " -> ".join(rec["labels"])])
+        written.append(path)
+
+    if result.get("assessments"):
+        _write_json("assessments.json", result["assessments"])
+    if result.get("graph_html"):
+        path = os.path.join(out_dir, "attack_graph.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(result["graph_html"])
+        written.append(path)
+
+    if result.get("what_if"):
+        _write_json("what_if.json", result["what_if"])
+    if result.get("profile"):
+        _write_json("profile.json", result["profile"])
+        path = os.path.join(out_dir, "profile.prom")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(result["profile_prometheus"])
+        written.append(path)
+
+    _write_json("timings.json", result["timings"])
+    return written
+
+
+# --- Main Orchestration Function ---
+
+def run_pipeline(drawio_text: str, report_texts, manual_map: dict,
+                 entry_labels=None, critical_labels=None,
+                 assess: bool = False, render_html: bool = False, timer=None,
+                 report_paths=None, workers=None, cache=None,
+                 llm_model=None, llm_concurrency=None, context_chars: int = DEFAULT_MAX_CHARS,
+                 html_mode: str = "auto", instrumentation=None, snapshot_dir: str = None, what_if: dict = None,
+                 rules=None, **path_options):
+    """
+    Runs the full analysis without Streamlit.
+
+    Reports are given either as texts or, for large scan output, as
+    report_paths which are streamed from disk on `workers` processes.
+    When a ContentCache is given, unchanged diagrams and reports are not parsed again.
+    path_options (max_paths, top_k, dedup_subpaths, k_best) are passed to build_attack_graph.
+    Path assessments run concurrently (llm_concurrency) against llm_model (default: Gemini);
+    each prompt carries at most context_chars of findings retrieved for the path's
+    hosts and their neighbors (0 = the full report texts).
+    html_mode selects the graph renderer (see utils.visualize.build_graph_html).
+    With an Instrumentation, the stages inside build_attack_graph are timed and
+    counted as well and returned as result["profile"] (and Prometheus text).
+    With snapshot_dir, the analysis is also saved there (see utils.snapshot).
+    what_if asks utils.what_if questions without rebuilding: "removed_edges" /
+    "added_edges" ([source label, target label] pairs) and "patched_hosts"
+    give result["what_if"]["scenario"], "rank_edges" (N) the N edges carrying
+    the most shortest attack paths as result["what_if"]["ranked_edges"].
+    rules (a utils.rules.RuleSet, default: utils.rules.default_rules) sets node
+    importance, the automatic entry/critical nodes and Nikto severities.
+    result["graph"] is a CompactGraph (use .to_networkx() for a networkx DiGraph).
+    Optional stages (LLM assessment, HTML rendering) import their
+    dependencies only when requested.
+    """
+    timer = timer or StageTimer()
+    report_texts = list(report_texts or [])
+
+    with timer.stage("parse_drawio"):
+        if cache is not None:
+            drawio_dict = cached_parse_drawio_xml(drawio_text, cache=cache)
+        else:
+            drawio_dict = parse_drawio_xml(drawio_text)
+
+    with timer.stage("parse_reports"):
+        if report_paths and cache is not None:
+            vuln_dict = cached_parse_vuln_reports(report_paths, workers=workers, cache=cache, rules=rules)
+        elif report_paths:
+            vuln_dict = parse_vuln_reports(report_paths, workers=workers, rules=rules)
+        elif cache is not None:
+            vuln_dict = cached_parse_vuln_reports([txt.encode("utf-8") for txt in report_texts], cache=cache, rules=rules)
+        else:
+            vuln_dict = merge_host_aggregates(*(parse_vuln_report_text(txt, rules) for txt in report_texts))
+
+    with timer.stage("build_attack_graph"):
+        attack_graph = AttackGraph(
+            drawio_dict,
+            vuln_dict,
+            manual_map,
+            entry_nodes=resolve_labels(drawio_dict, entry_labels) or None,
+            critical_nodes=resolve_labels(drawio_dict, critical_labels) or None,
+            instrumentation=instrumentation,
+            rules=rules,
+            **path_options,
+        )
+        # The compact graph is read directly; a networkx graph is only built for HTML rendering
+        graph, attack_paths = attack_graph.graph, attack_graph.paths
+
+    with timer.stage("export"):
+        result = {
+            "graph": graph,
+            "attack_paths": attack_paths,
+            "risk_table": risk_table(graph),
+            "paths": path_records(
+                graph, attack_paths, attack_graph.exploit_weights if path_options.get("k_best") else None
+            ),
+        }
+
+    if snapshot_dir:
+        with timer.stage("snapshot"):
+            from utils.snapshot import save_snapshot
+            result["snapshot"] = save_snapshot(attack_graph, snapshot_dir)
+
+    if what_if:
+        with timer.stage("what_if"):
+            from utils.what_if import WhatIfAnalysis
+            analysis = WhatIfAnalysis(attack_graph)
+            result["what_if"] = {}
+            if what_if.get("rank_edges"):
+                result["what_if"]["ranked_edges"] = analysis.rank_edges(what_if["rank_edges"])
+            if what_if.get("removed_edges") or what_if.get("added_edges") or what_if.get("patched_hosts"):
+                result["what_if"]["scenario"] = analysis.evaluate(
+                    resolve_edges(drawio_dict, what_if.get("removed_edges")),
+                    resolve_edges(drawio_dict, what_if.get("added_edges")),
+                    what_if.get("patched_hosts") or (),
+                )
+
+    if assess:
+        with timer.stage("assess"):
+            from utils.rag import DEFAULT_CONCURRENCY, stream_risk_assessments
+            contexts = None
+            if context_chars:
+                contexts = path_contexts(graph, attack_paths, attack_graph.host_of, vuln_dict, max_chars=context_chars)
+            elif report_paths and not report_texts:
+                report_texts = [read_text(path) for path in report_paths]
+            texts = {}
+            latency = {}
+            for event in stream_risk_assessments(
+                [
+                    [{"label": n["label"], "Risk_Score": n["Risk_Score"]} for n in rec["nodes"]]
+                    for rec in result["paths"]
+                ],
+                report_texts,
+                max_concurrency=llm_concurrency or DEFAULT_CONCURRENCY,
+                model=llm_model,
+                contexts=contexts,
+            ):
+                i = event["index"]
+                texts[i] = event["text"] if event["error"] else texts.get(i, "") + event["text"]
+                if event["done"]:
+                    latency[i] = {"cached": event["cached"], "ttft_s": event["ttft"], "latency_s": event["latency"]}
+            result["assessments"] = [
+                {"path": rec["path"], "assessment": texts.get(i, ""), **latency.get(i, {})}
+                for i, rec in enumerate(result["paths"])
+            ]
+
+    if render_html:
+        with timer.stage("render_html"):
+            from utils.visualize import build_graph_html
+            result["graph_html"] = build_graph_html(attack_graph.G, attack_paths, drawio_dict=drawio_dict, mode=html_mode)
+
+    result["timings"] = {name: round(sec, 6) for name, sec in timer.timings.items()}
+    if instrumentation is not None:
+        result["profile"] = instrumentation.snapshot()
+        result["profile_prometheus"] = instrumentation.to_prometheus()
+    if cache is not None:
+        result["cache_stats"] = cache.stats()
+    return result
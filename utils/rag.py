@@ -1,8 +1,49 @@
-import streamlit as st
 import google.generativeai as genai
+import logging
 import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+from utils.cache import ContentCache, content_digest
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Persistent response cache (explicit dir, or <ATTACKROUTE_CACHE_DIR>/llm, or ./.attackroute_cache/llm)
+LLM_CACHE_DIR_ENV = "ATTACKROUTE_LLM_CACHE_DIR"
+DEFAULT_CONCURRENCY = 4
+
+NO_API_KEY_MESSAGE = "APIキーが設定されていません。"
+NO_CONTEXT_MESSAGE = "解説を生成するための情報(攻撃パスと脆弱性レポート)がありません。"
+FAILED_MESSAGE = "解説の生成に失敗しました。詳細は上記のエラーメッセージを確認してください。"
+_STATUS_MESSAGES = (NO_API_KEY_MESSAGE, NO_CONTEXT_MESSAGE, FAILED_MESSAGE)
+
+
+def _streamlit():
+    """
+    Returns the streamlit module when running inside the Streamlit app.
+    Headless callers (CLI) never import streamlit.
+    """
+    return sys.modules.get("streamlit")
+
+
+def _show_error(message, hint=None):
+    st = _streamlit()
+    if st is not None:
+        st.error(message)
+        if hint:
+            st.info(hint)
+    else:
+        logger.error(message)
+        if hint:
+            logger.info(hint)
+
+
 # --- Configuration ---
 # .envファイルから環境変数を読み込み、Streamlitのsecretsにもフォールバックします。
 
@@ -18,53 +59,32 @@ def get_gemini_api_key():
     if api_key:
         return api_key
     
-    # 2. Streamlit secretsからの取得を試みる（フォールバック）
+    # 2. Streamlit secretsからの取得を試みる（フォールバック、Streamlit実行時のみ）
+    st = _streamlit()
     try:
-        return st.secrets["GEMINI_API_KEY"]
+        if st is not None:
+            return st.secrets["GEMINI_API_KEY"]
     except (KeyError, FileNotFoundError):
-        st.error("Gemini APIキーが見つかりません。.envファイル、環境変数、またはStreamlit secretsに設定してください。")
-        st.info("設定方法: .envファイルに `GEMINI_API_KEY=your_key` を追加するか、secrets.tomlファイルに `GEMINI_API_KEY = \"your_key\"` を追加してください。")
-        return None
-
-
-def generate_risk_assessment_from_reports(path_node_scores, all_report_texts):
-    """
-    Generates a risk assessment by providing the full context of vulnerability reports and risk scores to the Gemini API.
-
-    Args:
-        path_node_scores (list): A list of dicts, each containing 'label' and 'Risk_Score' for a node in the path.
-        all_report_texts (list): A list of strings, where each string is the content of a vuln report.
-
-    Returns:
-        A string containing the generated explanation, or an error message.
-    """
-
-    api_key = get_gemini_api_key()
-    if not api_key:
-        return "APIキーが設定されていません。"
+        pass
+    _show_error(
+        "Gemini APIキーが見つかりません。.envファイル、環境変数、またはStreamlit secretsに設定してください。",
+        "設定方法: .envファイルに `GEMINI_API_KEY=your_key` を追加するか、secrets.tomlファイルに `GEMINI_API_KEY = \"your_key\"` を追加してください。",
+    )
+    return None
 
-    # Check for empty context to avoid unnecessary API calls
-    if not path_node_scores and not all_report_texts:
-        return "解説を生成するための情報(攻撃パスと脆弱性レポート)がありません。"
 
-    genai.configure(api_key=api_key)
-    
-    # モデルの設定
-    model = genai.GenerativeModel('gemini-2.5-flash')
-
-    # --- Build the Prompt ---
-    prompt_header = """
+PROMPT_HEADER = """
 あなたは優秀なセキュリティアナリストであり、オフェンシブセキュリティの知識を持つペネトレーションテスターです。
 以下の情報に基づき、検出された攻撃パス(攻撃チェーン)が、実際にどのような脅威となりうるかを分析し、その攻撃シナリオを具体的に説明してください。
 
 **考慮すべき情報:**
 1.  **検出された攻撃パスと各ノードのリスクスコア:** 分析の起点となる、特に注目すべき一連のステップです。各ノードに割り当てられたリスクスコアも重要な判断材料です。スコアが高いほど、そのノードは攻撃者にとって価値が高いか、あるいは侵害されやすいことを示します。
-2.  **脆弱性レポート全文:** システム全体に存在する可能性のある、全ての脆弱性情報です。
+2.  **{report_title}:** {report_description}
 
 **説明の手順:**
 
 *   まず、提示された「攻撃パス」に沿って攻撃が成立する可能性が最も高いクリティカルなシナリオを、「リスクスコア」と「脆弱性レポート」の内容を関連付けながら具体的に説明してください。特にリスクスコアが高いノードに注目してください。
-*   次に、攻撃パスとは直接関係ない脆弱性も含め、「脆弱性レポート全文」から読み取れる他の攻撃シナリオや潜在的なリスクを簡潔に説明してください。
+*   次に、攻撃パスとは直接関係ない脆弱性も含め、「{report_title}」から読み取れる他の攻撃シナリオや潜在的なリスクを簡潔に説明してください。
 *   現実的な攻撃シナリオがある場合、各攻撃シナリオごとに再現手順を1,2,3...のように数字を使って説明しなさい。
 *   最終的に、このシステム全体が直面している最も大きな脅威は何か、そして最悪の場合どのような事態が想定されるかを結論として述べてください。
 
@@ -77,37 +97,336 @@ def generate_risk_assessment_from_reports(path_node_scores, all_report_texts):
 
 
 """
-    
-    # 攻撃パスとリスクスコアの文字列を生成
-    path_with_scores_str = "\n".join([f"- `{node['label']}` (リスクスコア: **{node['Risk_Score']}**)" for node in path_node_scores])
-    
-    # 脆弱性レポートのリストを一つのテキストブロックに結合
-    reports_str = "\n\n---(次のレポート)---\n\n".join(all_report_texts)
 
-    prompt_context = f"""
+PROMPT_CONTEXT = """
 ---
 ### **分析対象のコンテキスト**
 
 **1. 検出された攻撃パスと各ノードのリスクスコア:**
-{path_with_scores_str}
+{path_with_scores}
 
-**2. 脆弱性レポート全文:**
+**2. {report_title}:**
 ```text
-{reports_str}
+{reports}
 ```
 ---
 """
 
-    # 回答作成
-    final_prompt = prompt_header + prompt_context
-    # st.text_area("Final Prompt to AI", final_prompt, height=300) # DEBUG: Show final prompt
 
-    # --- Generate Content ---
+# Report section of the prompt: full report texts, or findings retrieved for the path (utils.retrieval)
+FULL_REPORTS = ("脆弱性レポート全文", "システム全体に存在する可能性のある、全ての脆弱性情報です。")
+RETRIEVED_FINDINGS = (
+    "攻撃パス上および隣接ホストの脆弱性所見",
+    "攻撃パス上のホストと、その隣接ホストについて検出された脆弱性の抜粋です（深刻度の高いものから）。",
+)
+NO_FINDINGS_TEXT = "(攻撃パス上および隣接ホストに該当する所見はありません)"
+
+
+def build_prompt(path_node_scores, all_report_texts, context: str = None) -> str:
+    """
+    Builds the full prompt for one attack path.
+    With context (see utils.retrieval.path_contexts) only the retrieved
+    findings are included instead of every report, which bounds the prompt size.
+    """
+    # 攻撃パスとリスクスコアの文字列を生成
+    path_with_scores_str = "\n".join([f"- `{node['label']}` (リスクスコア: **{node['Risk_Score']}**)" for node in path_node_scores])
+
+    if context is None:
+        # 脆弱性レポートのリストを一つのテキストブロックに結合
+        reports_str = "\n\n---(次のレポート)---\n\n".join(all_report_texts)
+        report_title, report_description = FULL_REPORTS
+    else:
+        reports_str = context or NO_FINDINGS_TEXT
+        report_title, report_description = RETRIEVED_FINDINGS
+
+    header = PROMPT_HEADER.format(report_title=report_title, report_description=report_description)
+    return header + PROMPT_CONTEXT.format(
+        path_with_scores=path_with_scores_str, report_title=report_title, reports=reports_str
+    )
+
+
+# --- Client and Response Cache ---
+
+_model = None
+_model_lock = threading.Lock()
+_response_cache = None
+
+
+def get_model():
+    """
+    Returns the process-wide Gemini model, configuring the client only once.
+    Returns None when no API key is available.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            api_key = get_gemini_api_key()
+            if not api_key:
+                return None
+            genai.configure(api_key=api_key)
+            # モデルの設定
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
+
+
+def get_response_cache() -> ContentCache:
+    """Returns the persistent cache of generated assessments, keyed by prompt hash."""
+    global _response_cache
+    if _response_cache is None:
+        cache_dir = os.environ.get(LLM_CACHE_DIR_ENV)
+        if not cache_dir:
+            cache_dir = os.path.join(os.environ.get("ATTACKROUTE_CACHE_DIR") or ".attackroute_cache", "llm")
+        _response_cache = ContentCache(max_entries=1024, cache_dir=cache_dir)
+    return _response_cache
+
+
+class LocalStubModel:
+    """
+    Offline stand-in for GenerativeModel (tests, dry runs).
+    Returns a short deterministic text built from the prompt; with
+    stream=True the text is yielded in chunk_chars pieces, chunk_delay
+    seconds apart, like a streaming backend.
+    """
+
+    class _Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, name: str = "local-stub", chunk_chars: int = 16, chunk_delay: float = 0.0):
+        self.model_name = name
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _text(self, prompt):
+        path_lines = [line for line in prompt.splitlines() if line.startswith("- `")]
+        return "**[stub]** 攻撃パスの評価:\n" + "\n".join(path_lines)
+
+    def _stream(self, text):
+        for start in range(0, len(text), self.chunk_chars):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield self._Response(text[start:start + self.chunk_chars])
+
+    def generate_content(self, prompt, stream: bool = False):
+        with self._lock:
+            self.calls += 1
+        text = self._text(prompt)
+        return self._stream(text) if stream else self._Response(text)
+
+
+def _model_name(model) -> str:
+    return getattr(model, "model_name", None) or type(model).__name__
+
+
+def _chunk_text(chunk) -> str:
+    # Gemini raises on .text for chunks without parts (e.g. the final usage chunk)
     try:
-        result = model.generate_content(final_prompt)
-        res_content = result.text
-        return res_content
-    except Exception as e:
-        st.error(f"リスク評価でエラーが発生しました: {e}")
-        # st.exception(e) # Display the full stack trace for debugging
-        return "解説の生成に失敗しました。詳細は上記のエラーメッセージを確認してください。"
\ No newline at end of file
+        return chunk.text or ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+# --- Generate Content ---
+
+def _plan_assessments(paths_node_scores, all_report_texts, contexts, model, cache):
+    """
+    Builds the prompts and resolves cached responses.
+
+    Returns (results, pending, to_generate, model): results holds the
+    already known texts per path, pending maps each unique prompt to its
+    path indices, and to_generate maps the prompts still to be sent to
+    their cache keys.
+    """
+    results = [None] * len(paths_node_scores)
+
+    # Deduplicate prompts and resolve cached responses
+    pending = {}
+    for i, path_node_scores in enumerate(paths_node_scores):
+        context = contexts[i] if contexts is not None else None
+        # Check for empty context to avoid unnecessary API calls
+        if not path_node_scores and not (context if contexts is not None else all_report_texts):
+            results[i] = NO_CONTEXT_MESSAGE
+            continue
+        pending.setdefault(build_prompt(path_node_scores, all_report_texts, context), []).append(i)
+
+    if not pending:
+        return results, pending, {}, model
+
+    model = model or get_model()
+    # Without a client only cached responses can be returned
+    name = MODEL_NAME if model is None else _model_name(model)
+
+    to_generate = {}
+    for prompt, rows in pending.items():
+        key = cache.make_key("llm", name, content_digest(prompt))
+        text = cache.get(key)
+        if text is not None:
+            for i in rows:
+                results[i] = text
+        else:
+            to_generate[prompt] = key
+
+    if to_generate and model is None:
+        for prompt in to_generate:
+            for i in pending[prompt]:
+                results[i] = NO_API_KEY_MESSAGE
+        to_generate = {}
+    return results, pending, to_generate, model
+
+
+def generate_risk_assessments(paths_node_scores, all_report_texts, max_concurrency: int = DEFAULT_CONCURRENCY,
+                              model=None, cache: ContentCache = None, contexts=None):
+    """
+    Generates risk assessments for several attack paths concurrently.
+
+    Identical prompts are sent only once, and responses are served from a
+    persistent cache keyed by the prompt hash, so unchanged paths are never
+    sent again. At most max_concurrency requests run at the same time.
+
+    Args:
+        paths_node_scores (list): One list per path of dicts with 'label' and 'Risk_Score'.
+        all_report_texts (list): The vulnerability report texts.
+        contexts (list): Optional retrieved report context per path; replaces all_report_texts in the prompt.
+        model: Object with generate_content(prompt) -> response with .text (default: Gemini).
+        cache: Response cache (default: get_response_cache()).
+
+    Returns:
+        A list of explanation strings (or error messages), in path order.
+    """
+    paths_node_scores = list(paths_node_scores)
+    cache = cache or get_response_cache()
+    results, pending, to_generate, model = _plan_assessments(
+        paths_node_scores, all_report_texts, contexts, model, cache
+    )
+    if not to_generate:
+        return results
+
+    def _generate(prompt):
+        return model.generate_content(prompt).text
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        futures = {prompt: pool.submit(_generate, prompt) for prompt in to_generate}
+        for prompt, future in futures.items():
+            try:
+                text = future.result()
+            except Exception as e:
+                errors.append(e)
+                text = FAILED_MESSAGE
+            else:
+                cache.put(to_generate[prompt], text)
+            for i in pending[prompt]:
+                results[i] = text
+
+    # Errors are reported from the calling thread (Streamlit cannot render from workers)
+    for e in errors:
+        _show_error(f"リスク評価でエラーが発生しました: {e}")
+    return results
+
+
+def stream_risk_assessments(paths_node_scores, all_report_texts, max_concurrency: int = DEFAULT_CONCURRENCY,
+                            model=None, cache: ContentCache = None, contexts=None):
+    """
+    Streaming variant of generate_risk_assessments().
+
+    Paths are generated on background threads with
+    generate_content(prompt, stream=True), and their chunks are yielded in
+    the calling thread as soon as they arrive, interleaved across paths.
+    Each event is a dict:
+
+        {"index": path index, "text": new chunk, "done": bool, "cached": bool,
+         "ttft": seconds to the first chunk, "latency": total seconds, "error": exception or None}
+
+    "ttft"/"latency" are set on the first chunk / the final (done) event.
+    Cached and unavailable paths produce a single done event first.
+    Completed responses are stored in the cache like the batch variant.
+    """
+    paths_node_scores = list(paths_node_scores)
+    cache = cache or get_response_cache()
+    results, pending, to_generate, model = _plan_assessments(
+        paths_node_scores, all_report_texts, contexts, model, cache
+    )
+
+    for i, text in enumerate(results):
+        if text is not None:
+            yield {"index": i, "text": text, "done": True, "cached": text not in _STATUS_MESSAGES,
+                   "ttft": 0.0, "latency": 0.0, "error": None}
+    if not to_generate:
+        return
+
+    events = queue.Queue()
+
+    def _stream(prompt):
+        start = time.perf_counter()
+        ttft = None
+        parts = []
+        try:
+            for chunk in model.generate_content(prompt, stream=True):
+                text = _chunk_text(chunk)
+                if not text:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                parts.append(text)
+                events.put((prompt, text, False, ttft, None, None))
+        except Exception as e:
+            events.put((prompt, FAILED_MESSAGE, True, ttft, time.perf_counter() - start, e))
+            return
+        if not parts:
+            # No text at all (e.g. a safety-blocked stream): fail like the batch path and cache nothing
+            error = ValueError("the response contained no text (it may have been blocked)")
+            events.put((prompt, FAILED_MESSAGE, True, ttft, time.perf_counter() - start, error))
+            return
+        cache.put(to_generate[prompt], "".join(parts))
+        events.put((prompt, "", True, ttft, time.perf_counter() - start, None))
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    try:
+        for prompt in to_generate:
+            pool.submit(_stream, prompt)
+        remaining = len(to_generate)
+        started = set()
+        while remaining:
+            prompt, text, done, ttft, latency, error = events.get()
+            if done:
+                remaining -= 1
+            if error is not None:
+                # Errors are reported from the calling thread (Streamlit cannot render from workers)
+                _show_error(f"リスク評価でエラーが発生しました: {error}")
+            first = prompt not in started
+            started.add(prompt)
+            for i in pending[prompt]:
+                yield {"index": i, "text": text, "done": done, "cached": False,
+                       "ttft": ttft if first or done else None, "latency": latency, "error": error}
+    finally:
+        # The consumer may stop early (e.g. a Streamlit rerun); don't start the remaining requests
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_risk_assessment(path_node_scores, all_report_texts, model=None, cache: ContentCache = None,
+                           context: str = None):
+    """Yields the text chunks of the assessment for one path (see stream_risk_assessments)."""
+    contexts = None if context is None else [context]
+    for event in stream_risk_assessments([path_node_scores], all_report_texts, model=model, cache=cache,
+                                         contexts=contexts):
+        if event["text"]:
+            yield event["text"]
+
+
+def generate_risk_assessment_from_reports(path_node_scores, all_report_texts, model=None, cache: ContentCache = None,
+                                          context: str = None):
+    """
+    Generates a risk assessment by providing the full context of vulnerability reports and risk scores to the Gemini API.
+
+    Args:
+        path_node_scores (list): A list of dicts, each containing 'label' and 'Risk_Score' for a node in the path.
+        all_report_texts (list): A list of strings, where each string is the content of a vuln report.
+        context (str): Optional retrieved findings for this path, used instead of the full reports.
+
+    Returns:
+        A string containing the generated explanation, or an error message.
+    """
+    contexts = None if context is None else [context]
+    return generate_risk_assessments([path_node_scores], all_report_texts, model=model, cache=cache, contexts=contexts)[0]
@@ -0,0 +1,166 @@
+import math
+import re
+from collections import Counter
+
+# Upper bound of the retrieved context in a prompt (characters), independent of the report size
+DEFAULT_MAX_CHARS = 12000
+# Findings per retrievable chunk, and the longest line kept for one finding
+CHUNK_FINDINGS = 8
+MAX_LINE_CHARS = 240
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[0-9a-z]+|[^\x00-\x7f]+")
+
+SEVERITY_NAMES = {1: "info", 2: "low", 3: "medium", 4: "high", 5: "critical"}
+
+
+def tokenize(text: str) -> list:
+    """Lowercased alphanumeric runs; non-ASCII runs (e.g. Japanese labels) are kept as single tokens."""
+    return _TOKEN_RE.findall((text or "").lower())
+
+
+def _finding_line(f: dict) -> str:
+    sev = SEVERITY_NAMES.get(f.get("severity"), f.get("severity"))
+    line = f"- [{sev}] ({f.get('tool', '?')}) {f.get('title', '')} {f.get('url', '')}".rstrip()
+    return line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS - 3] + "..."
+
+
+def finding_chunks(vuln_dict: dict, chunk_findings: int = CHUNK_FINDINGS) -> list:
+    """
+    Splits the findings of each host into chunks of at most chunk_findings lines,
+    most severe findings first. Hosts parsed without findings get a single
+    summary chunk built from Vuln_Count / Severity.
+    """
+    chunks = []
+    for host_key, entry in vuln_dict.items():
+        findings = sorted(entry.get("findings") or [], key=lambda f: -f.get("severity", 0))
+        if not findings:
+            chunks.append({
+                "host": host_key,
+                "text": f"- {entry.get('Vuln_Count', 0)} findings, average severity {entry.get('Severity', 0.0)}",
+                "severity": entry.get("Severity", 0.0),
+            })
+            continue
+        for start in range(0, len(findings), chunk_findings):
+            part = findings[start:start + chunk_findings]
+            chunks.append({
+                "host": host_key,
+                "text": "\n".join(_finding_line(f) for f in part),
+                "severity": part[0].get("severity", 0),
+            })
+    return chunks
+
+
+class FindingIndex:
+    """
+    Local BM25 index over per-host finding chunks (no network, no model).
+
+    Chunks are only ever retrieved for a given set of hosts, so the context
+    added to a prompt is bounded by max_chars and does not grow with the
+    number or size of the uploaded reports.
+    """
+
+    def __init__(self, vuln_dict: dict, chunk_findings: int = CHUNK_FINDINGS):
+        self.vuln_dict = vuln_dict
+        self.chunks = finding_chunks(vuln_dict, chunk_findings)
+        self.by_host = {}
+        for i, chunk in enumerate(self.chunks):
+            self.by_host.setdefault(chunk["host"], []).append(i)
+
+        self._tf = []
+        df = Counter()
+        for chunk in self.chunks:
+            tf = Counter(tokenize(chunk["host"] + "\n" + chunk["text"]))
+            self._tf.append(tf)
+            df.update(tf.keys())
+        self._len = [sum(tf.values()) for tf in self._tf]
+        self._avg_len = (sum(self._len) / len(self._len)) if self._len else 0.0
+        n = len(self.chunks)
+        self._idf = {t: math.log(1 + (n - c + 0.5) / (c + 0.5)) for t, c in df.items()}
+
+    def score(self, query_tokens, chunk_id: int) -> float:
+        """BM25 score of one chunk for the query tokens."""
+        tf = self._tf[chunk_id]
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._len[chunk_id] / (self._avg_len or 1.0))
+        total = 0.0
+        for t in query_tokens:
+            freq = tf.get(t)
+            if freq:
+                total += self._idf[t] * freq * (BM25_K1 + 1) / (freq + norm)
+        return total
+
+    def search(self, query: str, hosts=None, k: int = None) -> list:
+        """Chunk ids ranked by BM25 (then severity), optionally restricted to the given hosts."""
+        query_tokens = set(tokenize(query))
+        if hosts is None:
+            candidates = range(len(self.chunks))
+        else:
+            candidates = [i for h in hosts for i in self.by_host.get(h, [])]
+        ranked = sorted(candidates, key=lambda i: (-self.score(query_tokens, i), -self.chunks[i]["severity"], i))
+        return ranked if k is None else ranked[:k]
+
+    def context_for(self, path_hosts, neighbor_hosts=(), query: str = "", max_chars: int = DEFAULT_MAX_CHARS) -> str:
+        """
+        Builds the report context for one attack path.
+
+        Chunks of the hosts on the path come first, then those of neighboring
+        hosts; within a host they are ranked by search(query). Hosts are
+        visited round-robin so every host gets its best chunk before any host
+        gets a second one, until max_chars is reached.
+        """
+        path_hosts = [h for h in dict.fromkeys(path_hosts) if h in self.by_host]
+        neighbor_hosts = [h for h in dict.fromkeys(neighbor_hosts) if h in self.by_host and h not in path_hosts]
+        hosts = path_hosts + neighbor_hosts
+        if not hosts:
+            return ""
+
+        headers = {}
+        for h in hosts:
+            entry = self.vuln_dict[h]
+            role = "攻撃パス上" if h in path_hosts else "隣接ホスト"
+            headers[h] = f"[{h}] ({role}, Vuln_Count: {entry.get('Vuln_Count', 0)}, Severity: {entry.get('Severity', 0.0)})"
+
+        ranked = {h: self.search(query, hosts=[h]) for h in hosts}
+        selected = {h: [] for h in hosts}
+        used = 0
+        depth = 0
+        while any(depth < len(ranked[h]) for h in hosts):
+            for h in hosts:
+                if depth >= len(ranked[h]):
+                    continue
+                text = self.chunks[ranked[h][depth]]["text"]
+                cost = len(text) + 1 + (0 if selected[h] else len(headers[h]) + 2)
+                if used + cost > max_chars:
+                    continue
+                selected[h].append(text)
+                used += cost
+            depth += 1
+
+        sections = [headers[h] + "\n" + "\n".join(parts) for h, parts in selected.items() if parts]
+        return "\n\n".join(sections)
+
+
+def path_hosts(G, path, host_of: dict):
+    """Report hosts of the nodes on a path, and of their direct (non-path) neighbors."""
+    on_path = set(path)
+    hosts = [host_of[n] for n in path if n in host_of]
+    neighbors = []
+    for n in path:
+        for m in list(G.pred[n]) + list(G.succ[n]):
+            if m not in on_path and m in host_of:
+                neighbors.append(host_of[m])
+    return list(dict.fromkeys(hosts)), list(dict.fromkeys(neighbors))
+
+
+def path_contexts(G, paths, host_of: dict, vuln_dict: dict, max_chars: int = DEFAULT_MAX_CHARS,
+                  index: FindingIndex = None) -> list:
+    """Retrieved report context (see FindingIndex.context_for) for each attack path."""
+    index = index or FindingIndex(vuln_dict)
+    contexts = []
+    for path in paths:
+        on_path, neighbors = path_hosts(G, path, host_of)
+        query = " ".join(G.nodes[n].get("label", "") for n in path)
+        contexts.append(index.context_for(on_path, neighbors, query=query, max_chars=max_chars))
+    return contexts
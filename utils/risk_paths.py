@@ -0,0 +1,171 @@
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+from utils.instrumentation import NULL_INSTRUMENTATION
+
+# Scale of the per-node exploitability curve and its lower bound
+# (a node without findings can still be traversed, just unlikely).
+EXPLOIT_GAMMA = 0.1
+EXPLOIT_FLOOR = 0.05
+
+# Virtual endpoints connecting all entry nodes / all critical nodes
+_SOURCE = object()
+_SINK = object()
+
+
+def exploit_weights(vuln_count, severity, importance, gamma: float = EXPLOIT_GAMMA, floor: float = EXPLOIT_FLOOR):
+    """
+    Vectorized edge weights for entering each node.
+
+    A node's exploitability p = 1 - exp(-gamma * Vuln_Count * Severity * Importance),
+    clipped to [floor, 1]. The weight is -log(p), so the summed weight of a
+    path is -log of its cumulative exploitability and the lightest path is
+    the most dangerous one. p rounds to 1 (weight 0) for very large exposure.
+    """
+    exposure = np.asarray(vuln_count, dtype=np.float64) * np.asarray(severity, dtype=np.float64) \
+        * np.asarray(importance, dtype=np.float64)
+    p = np.clip(-np.expm1(-gamma * exposure), floor, 1.0)
+    return -np.log(p)
+
+
+def graph_exploit_weights(G, **kwargs) -> dict:
+    """exploit_weights() for the node attributes of a networkx graph."""
+    nodes = list(G.nodes)
+    attrs = G.nodes
+    weights = exploit_weights(
+        [attrs[n].get("Vuln_Count", 0) for n in nodes],
+        [attrs[n].get("Severity", 0.0) for n in nodes],
+        [attrs[n].get("Importance", 1.0) for n in nodes],
+        **kwargs,
+    )
+    return dict(zip(nodes, weights.tolist()))
+
+
+def path_exploitability(path, weight_of: dict) -> float:
+    """Cumulative exploitability (product of node probabilities) of a path."""
+    return math.exp(-sum(weight_of.get(n, 0.0) for n in path))
+
+
+def _dijkstra(neighbors, step_cost, source, blocked_nodes, blocked_edges):
+    """Lightest source→_SINK path avoiding blocked nodes/edges, as (cost, path) or None."""
+    counter = itertools.count()
+    heap = [(0.0, next(counter), source)]
+    best = {source: 0.0}
+    parent = {source: None}
+    done = set()
+    while heap:
+        cost, _, u = heapq.heappop(heap)
+        if u in done:
+            continue
+        if u is _SINK:
+            path = []
+            while u is not None:
+                path.append(u)
+                u = parent[u]
+            return cost, path[::-1]
+        done.add(u)
+        for v in neighbors(u):
+            if v in blocked_nodes or v in done or (u, v) in blocked_edges:
+                continue
+            new_cost = cost + step_cost(v)
+            if new_cost < best.get(v, math.inf):
+                best[v] = new_cost
+                parent[v] = u
+                heapq.heappush(heap, (new_cost, next(counter), v))
+    return None
+
+
+def _iter_yen_paths(succ, entries: list, critical_set: set, weight_of, instrumentation=NULL_INSTRUMENTATION):
+    """Yen's algorithm between the virtual _SOURCE (→ entries) and _SINK (← critical nodes)."""
+
+    def neighbors(u):
+        if u is _SOURCE:
+            return entries
+        if u in critical_set:
+            return itertools.chain(succ[u], (_SINK,))
+        return succ[u]
+
+    def step_cost(v):
+        return 0.0 if v is _SINK else weight_of(v)
+
+    instrumentation.count("dijkstra_runs")
+    first = _dijkstra(neighbors, step_cost, _SOURCE, set(), set())
+    if first is None:
+        return
+
+    found = [first[1]]
+    yield first[1][1:-1]
+
+    candidates = []
+    queued = set()
+    counter = itertools.count()
+    while True:
+        prev = found[-1]
+        root_cost = 0.0
+        for i in range(len(prev) - 1):
+            spur = prev[i]
+            root = prev[:i + 1]
+            if i > 0:
+                root_cost += step_cost(spur)
+
+            blocked_edges = {(p[i], p[i + 1]) for p in found if len(p) > i + 1 and p[:i + 1] == root}
+            instrumentation.count("dijkstra_runs")
+            spur_result = _dijkstra(neighbors, step_cost, spur, set(root[:-1]), blocked_edges)
+            if spur_result is None:
+                continue
+
+            spur_cost, spur_path = spur_result
+            path = root[:-1] + spur_path
+            key = tuple(id(n) if n is _SOURCE or n is _SINK else n for n in path)
+            if key not in queued:
+                queued.add(key)
+                heapq.heappush(candidates, (root_cost + spur_cost, next(counter), path))
+
+        if not candidates:
+            return
+        _, _, best = heapq.heappop(candidates)
+        found.append(best)
+        yield best[1:-1]
+
+
+def iter_riskiest_paths(G, entry_nodes: list, critical_nodes: list, weight_of: dict,
+                        instrumentation=NULL_INSTRUMENTATION):
+    """
+    Yields simple entry→critical paths in order of decreasing cumulative
+    exploitability, using Yen's k-shortest-paths algorithm over the weights
+    in weight_of (see exploit_weights). Paths are produced one at a time, so
+    taking the first k stops the search after k paths.
+    On a CompactGraph the search runs on row numbers.
+    """
+    entries = [e for e in dict.fromkeys(entry_nodes) if e in G]
+    critical_set = {c for c in critical_nodes if c in G}
+    if not entries or not critical_set:
+        return
+
+    if isinstance(G, CompactGraph):
+        ids = G.node_ids
+        weights = [weight_of.get(n, 0.0) for n in ids]
+        paths = _iter_yen_paths(
+            G.succ_lists(), [G.index[e] for e in entries], {G.index[c] for c in critical_set}, weights.__getitem__,
+            instrumentation,
+        )
+        for path in paths:
+            yield [ids[i] for i in path]
+    else:
+        yield from _iter_yen_paths(G.succ, entries, critical_set, lambda v: weight_of.get(v, 0.0), instrumentation)
+
+
+def k_riskiest_paths(G, entry_nodes: list, critical_nodes: list, k: int = 10, weight_of: dict = None,
+                     instrumentation=NULL_INSTRUMENTATION):
+    """
+    Returns the k most exploitable entry→critical paths (most dangerous first).
+    weight_of defaults to graph_exploit_weights(G).
+    """
+    if weight_of is None:
+        weight_of = graph_exploit_weights(G)
+    paths = iter_riskiest_paths(G, entry_nodes, critical_nodes, weight_of, instrumentation)
+    return list(itertools.islice(paths, k))
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import os
+import re
+
+# Optional JSON file with the classification rules of the process-wide default
+RULES_PATH_ENV = "ATTACKROUTE_RULES"
+
+# Matchers with fewer keywords test each with a substring search instead of
+# the combined regex (str search beats the regex scan for a handful of keywords)
+SUBSTRING_SCAN_LIMIT = 8
+
+# Built-in rules (node importance, entry/critical keywords, Nikto severity).
+# Importance and severity rules are first-match-wins in the listed order.
+DEFAULT_CONFIG = {
+    "importance": {
+        "db": 4.0,
+        "redis": 3.0,
+        "api": 3.0,
+        "admin": 3.0,
+        "backend": 3.0,
+        "default": 1.0,
+    },
+    "entry_keywords": ["web", "ui", "frontend", "shop", "wordpress"],
+    "critical_keywords": ["db", "redis", "api", "admin", "backend"],
+    # セキュリティリスクレベルの基準値 (Nikto は深刻度を出力しないためメッセージから推定)
+    "nikto_severity": {
+        "rules": [["config", 4], ["missing", 3]],
+        "default": 2,
+    },
+}
+
+
+_NO_MATCH = frozenset()
+
+
+def _trie_pattern(node: dict) -> str:
+    # Optional tails are greedy, so the longest keyword at a position wins
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{body})?" if "" in node else body
+
+
+class KeywordMatcher:
+    """
+    Finds which of many keywords occur in a text, compiled once.
+
+    All keywords are compiled into one trie-shaped alternation, so a match
+    attempt costs at most one branch per character instead of one attempt
+    per keyword, and positions where no keyword can start are skipped by the
+    regex engine's prefix scan. Each search resumes one character after the
+    previous match start (matches may overlap) and reports the longest
+    keyword there; the keywords it contains are added from a closure
+    computed once, so the result is the full set of keywords occurring in
+    the text. Texts are expected in lower case (keywords are lowered on
+    compile). Below SUBSTRING_SCAN_LIMIT keywords no regex is compiled.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(k.lower() for k in keywords if k))
+        self._ids = {k: i for i, k in enumerate(self.keywords)}
+        self._regex = None
+        if len(self.keywords) < SUBSTRING_SCAN_LIMIT:
+            return
+        trie = {}
+        for keyword in self.keywords:
+            node = trie
+            for ch in keyword:
+                node = node.setdefault(ch, {})
+            node[""] = True
+        self._regex = re.compile(_trie_pattern(trie))
+        self._implied = {
+            keyword: frozenset(j for j, other in enumerate(self.keywords) if other in keyword)
+            for keyword in self.keywords
+        }
+
+    def search(self, text: str) -> bool:
+        """True when any keyword occurs in text."""
+        if self._regex is None:
+            return any(keyword in text for keyword in self.keywords)
+        return self._regex.search(text) is not None
+
+    def match_ids(self, text: str) -> frozenset:
+        """Indices (into self.keywords) of every keyword occurring in text."""
+        if self._regex is None:
+            found = [i for i, keyword in enumerate(self.keywords) if keyword in text]
+            return frozenset(found) if found else _NO_MATCH
+        search = self._regex.search
+        m = search(text)
+        if m is None:
+            return _NO_MATCH
+        implied = self._implied
+        found = implied[m.group()]
+        m = search(text, m.start() + 1)
+        while m is not None:
+            found = found | implied[m.group()]
+            m = search(text, m.start() + 1)
+        return found
+
+
+class RuleSet:
+    """
+    Compiled classification rules for node labels and Nikto findings.
+
+    The keywords of the importance, entry and critical rules share one
+    KeywordMatcher, so a label is scanned once for all three; each keyword
+    carries the outcome it contributes (importance rule rank, entry flag,
+    critical flag). Nikto severity keywords have their own matcher.
+    Build with from_config() / load_rules(); instances are read-only and
+    picklable (they are passed to the report parsing workers).
+    """
+
+    def __init__(self, importance: dict, entry_keywords, critical_keywords, nikto_rules, nikto_default: int):
+        importance = dict(importance)
+        self.default_importance = float(importance.pop("default", 1.0))
+        # Empty keywords would match everything and are ignored
+        self.importance_rules = [(k.lower(), float(v)) for k, v in importance.items() if k]
+        self.entry_keywords = [k.lower() for k in entry_keywords if k]
+        self.critical_keywords = [k.lower() for k in critical_keywords if k]
+        self.nikto_rules = [(k.lower(), int(v)) for k, v in nikto_rules if k]
+        self.nikto_default = int(nikto_default)
+
+        self.label_matcher = KeywordMatcher(
+            [k for k, _ in self.importance_rules] + self.entry_keywords + self.critical_keywords
+        )
+        ids = self.label_matcher._ids
+        # Per keyword: rank of the first importance rule it triggers (None when it is not one)
+        self._importance_rank = [None] * len(self.label_matcher.keywords)
+        for rank, (keyword, _) in enumerate(self.importance_rules):
+            if self._importance_rank[ids[keyword]] is None:
+                self._importance_rank[ids[keyword]] = rank
+        self._entry_ids = frozenset(ids[k] for k in self.entry_keywords)
+        self._critical_ids = frozenset(ids[k] for k in self.critical_keywords)
+
+        self.nikto_matcher = KeywordMatcher(k for k, _ in self.nikto_rules)
+        self._nikto_rank = [None] * len(self.nikto_matcher.keywords)
+        for rank, (keyword, _) in enumerate(self.nikto_rules):
+            i = self.nikto_matcher._ids[keyword]
+            if self._nikto_rank[i] is None:
+                self._nikto_rank[i] = rank
+        self._outcomes = {}
+
+    def __getstate__(self):
+        return {"config": self.to_config()}
+
+    def __setstate__(self, state):
+        self.__init__(**_rule_args(state["config"]))
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Builds a RuleSet from a config dict; sections left out keep the built-in defaults."""
+        return cls(**_rule_args(config))
+
+    def to_config(self) -> dict:
+        importance = dict(self.importance_rules)
+        importance["default"] = self.default_importance
+        return {
+            "importance": importance,
+            "entry_keywords": list(self.entry_keywords),
+            "critical_keywords": list(self.critical_keywords),
+            "nikto_severity": {"rules": [list(rule) for rule in self.nikto_rules], "default": self.nikto_default},
+        }
+
+    @property
+    def digest(self) -> str:
+        """Fingerprint of all rules."""
+        return _config_digest(self.to_config())
+
+    @property
+    def severity_digest(self) -> str:
+        """Fingerprint of the rules that affect report parsing (part of the parse cache keys)."""
+        return _config_digest(self.to_config()["nikto_severity"])
+
+    def _label_outcome(self, ids: frozenset):
+        # Outcomes depend only on the matched keyword set, which repeats a lot across labels
+        outcome = self._outcomes.get(ids)
+        if outcome is None:
+            ranks = [r for r in (self._importance_rank[i] for i in ids) if r is not None]
+            importance = self.importance_rules[min(ranks)][1] if ranks else self.default_importance
+            outcome = (importance, not ids.isdisjoint(self._entry_ids), not ids.isdisjoint(self._critical_ids))
+            self._outcomes[ids] = outcome
+        return outcome
+
+    def classify_label(self, label) -> tuple:
+        """(importance, is_entry, is_critical) of one node label."""
+        return self._label_outcome(self.label_matcher.match_ids((label or "").lower()))
+
+    def classify_labels(self, labels) -> tuple:
+        """
+        Classifies many labels in one pass.
+        Returns (importance, is_entry, is_critical) lists aligned with labels.
+        """
+        outcomes = [self.classify_label(label) for label in labels]
+        if not outcomes:
+            return [], [], []
+        importance, is_entry, is_critical = map(list, zip(*outcomes))
+        return importance, is_entry, is_critical
+
+    def importance(self, label) -> float:
+        return self.classify_label(label)[0]
+
+    def nikto_severity(self, msg: str) -> int:
+        """Severity of a Nikto message: the first severity rule whose keyword it contains."""
+        lower = msg.lower()
+        if len(self.nikto_rules) < SUBSTRING_SCAN_LIMIT:
+            # Few rules: test them in order and stop at the first hit
+            for keyword, severity in self.nikto_rules:
+                if keyword in lower:
+                    return severity
+            return self.nikto_default
+        ids = self.nikto_matcher.match_ids(lower)
+        if not ids:
+            return self.nikto_default
+        ranks = [r for r in (self._nikto_rank[i] for i in ids) if r is not None]
+        return self.nikto_rules[min(ranks)][1] if ranks else self.nikto_default
+
+
+def _config_digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _rule_args(config: dict) -> dict:
+    """Validates a rules config and returns RuleSet() arguments."""
+    if not isinstance(config, dict):
+        raise ValueError("rules config must be a JSON object")
+    unknown = set(config) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError(f"unknown rules section(s): {', '.join(sorted(unknown))}")
+
+    importance = config.get("importance", DEFAULT_CONFIG["importance"])
+    if not isinstance(importance, dict) or not all(
+        isinstance(v, (int, float)) and not isinstance(v, bool) for v in importance.values()
+    ):
+        raise ValueError("'importance' must map keywords to numbers")
+
+    keywords = {}
+    for section in ("entry_keywords", "critical_keywords"):
+        value = config.get(section, DEFAULT_CONFIG[section])
+        if not isinstance(value, list) or not all(isinstance(k, str) for k in value):
+            raise ValueError(f"'{section}' must be a list of strings")
+        keywords[section] = value
+
+    severity = config.get("nikto_severity", DEFAULT_CONFIG["nikto_severity"])
+    if not isinstance(severity, dict):
+        raise ValueError("'nikto_severity' must be an object with 'rules' and 'default'")
+    rules = severity.get("rules", DEFAULT_CONFIG["nikto_severity"]["rules"])
+    if not isinstance(rules, list) or not all(
+        isinstance(r, list) and len(r) == 2 and isinstance(r[0], str)
+        and isinstance(r[1], int) and not isinstance(r[1], bool) for r in rules
+    ):
+        raise ValueError("'nikto_severity.rules' must be a list of [keyword, severity] pairs")
+    default = severity.get("default", DEFAULT_CONFIG["nikto_severity"]["default"])
+    if not isinstance(default, int) or isinstance(default, bool):
+        raise ValueError("'nikto_severity.default' must be an integer")
+
+    return {
+        "importance": importance,
+        "entry_keywords": keywords["entry_keywords"],
+        "critical_keywords": keywords["critical_keywords"],
+        "nikto_rules": rules,
+        "nikto_default": default,
+    }
+
+
+def load_rules(path: str) -> RuleSet:
+    """Loads and compiles a JSON rules file (see DEFAULT_CONFIG for the format)."""
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            config = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid rules file {path}: {e}") from None
+    return RuleSet.from_config(config)
+
+
+# Process-wide rules used when no RuleSet is passed explicitly
+default_rules = (
+    load_rules(os.environ[RULES_PATH_ENV]) if os.environ.get(RULES_PATH_ENV) else RuleSet.from_config(DEFAULT_CONFIG)
+)
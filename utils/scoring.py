@@ -0,0 +1,86 @@
+import numpy as np
+
+# Inputs of Risk_Score = (Vuln_Count * Severity) * Importance * proximity
+SCORE_COLUMNS = {
+    "Vuln_Count": (np.int64, 0),
+    "Severity": (np.float64, 0.0),
+    "Importance": (np.float64, 1.0),
+    "proximity": (np.float64, 0.0),
+}
+
+
+class RiskScorer:
+    """
+    Column store for the per-node scoring inputs.
+
+    Each input is a NumPy array indexed like `nodes` (e.g. the rows of
+    graph_to_csr), so Risk_Score is computed for every node in one
+    vectorized pass. Results are only written to a graph or exported as a
+    DataFrame when asked.
+    """
+
+    def __init__(self, nodes):
+        self.nodes = list(nodes)
+        self.columns = {
+            name: np.full(len(self.nodes), default, dtype=dtype)
+            for name, (dtype, default) in SCORE_COLUMNS.items()
+        }
+        self.risk = np.zeros(len(self.nodes), dtype=np.float64)
+
+    @classmethod
+    def from_graph(cls, G, nodes=None):
+        """Reads the scoring inputs from node attributes (missing ones use defaults)."""
+        scorer = cls(G.nodes if nodes is None else nodes)
+        node_attrs = G.nodes
+        for name, (dtype, default) in SCORE_COLUMNS.items():
+            scorer.columns[name] = np.fromiter(
+                (node_attrs[n].get(name, default) for n in scorer.nodes),
+                dtype=dtype,
+                count=len(scorer.nodes),
+            )
+        return scorer
+
+    def set(self, name: str, values):
+        dtype, _ = SCORE_COLUMNS[name]
+        values = np.asarray(values, dtype=dtype)
+        if values.shape != (len(self.nodes),):
+            raise ValueError(f"column {name} must have {len(self.nodes)} values, got shape {values.shape}")
+        self.columns[name] = values
+
+    def compute(self):
+        """Computes Risk_Score for all nodes (rounded to 6 decimals like before)."""
+        c = self.columns
+        self.risk = np.round((c["Vuln_Count"] * c["Severity"]) * c["Importance"] * c["proximity"], 6)
+        return self.risk
+
+    def compute_rows(self, rows):
+        """Recomputes Risk_Score in place for the given row indices only."""
+        rows = np.asarray(rows, dtype=np.int64)
+        c = self.columns
+        self.risk[rows] = np.round(
+            (c["Vuln_Count"][rows] * c["Severity"][rows]) * c["Importance"][rows] * c["proximity"][rows], 6
+        )
+        return self.risk[rows]
+
+    def column(self, name: str):
+        return self.risk if name == "Risk_Score" else self.columns[name]
+
+    def write_back(self, G, names=None):
+        """Writes the given columns (default: Risk_Score) to G's node attributes."""
+        node_attrs = G.nodes
+        for name in names or ["Risk_Score"]:
+            values = self.column(name).tolist()
+            for node_id, value in zip(self.nodes, values):
+                node_attrs[node_id][name] = value
+        return G
+
+    def to_dataframe(self, labels=None):
+        """Returns the scoring table as a pandas DataFrame indexed by node id."""
+        import pandas as pd
+
+        data = {}
+        if labels is not None:
+            data["label"] = list(labels)
+        data["Risk_Score"] = self.risk
+        data.update(self.columns)
+        return pd.DataFrame(data, index=pd.Index(self.nodes, name="id"))
@@ -0,0 +1,448 @@
+"""
+Local analysis service: a bounded job queue in front of a worker pool.
+
+Jobs (diagram, reports, manual map, selection and path options) are queued
+and run by a fixed number of worker threads that share one ContentCache
+(parsed diagrams and reports) and an LRU of built AttackGraphs, so jobs on
+the same inputs only re-run the stages their options change. When the
+queue is full, submit() raises QueueFull instead of accepting more work.
+serve() exposes the service over HTTP; ServiceClient talks to it.
+"""
+import itertools
+import json
+import queue
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.cache import ContentCache, cached_parse_drawio_xml, cached_parse_vuln_reports, content_digest
+from utils.instrumentation import METRIC_PREFIX
+from utils.networkx_core import AttackGraph
+from utils.pipeline import StageTimer, path_records, resolve_labels, risk_table
+from utils.rules import RuleSet, default_rules
+
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_SIZE = 16
+# Finished jobs kept for GET /jobs/<id>, and built graphs kept for reuse
+MAX_FINISHED_JOBS = 256
+MAX_CACHED_GRAPHS = 8
+# Largest accepted request body, and the longest ?wait= of a status request
+MAX_BODY_BYTES = 256 << 20
+MAX_WAIT_SECONDS = 60.0
+
+PATH_OPTIONS = ("max_paths", "top_k", "dedup_subpaths", "k_best")
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class QueueFull(Exception):
+    """Raised by submit() when the job queue is at capacity."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"job queue is full, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def to_prometheus(self, metric: str) -> list:
+        lines = [f"# TYPE {metric} histogram"]
+        lines += [f'{metric}_bucket{{le="{bound}"}} {n}' for bound, n in zip(self.buckets, self.counts)]
+        lines += [f'{metric}_bucket{{le="+Inf"}} {self.count}', f"{metric}_sum {self.total:.6f}",
+                  f"{metric}_count {self.count}"]
+        return lines
+
+
+def job_spec(payload: dict) -> dict:
+    """Validates a job request (as posted to /jobs) and returns the normalized spec."""
+    if not isinstance(payload, dict):
+        raise ValueError("job must be a JSON object")
+    drawio = payload.get("drawio")
+    reports = payload.get("reports")
+    manual_map = payload.get("manual_map", {})
+    if not isinstance(drawio, str) or not drawio.strip():
+        raise ValueError("'drawio' must be the draw.io XML text")
+    if not isinstance(reports, list) or not all(isinstance(r, str) for r in reports):
+        raise ValueError("'reports' must be a list of report texts")
+    if not isinstance(manual_map, dict):
+        raise ValueError("'manual_map' must be an object (label -> host:port)")
+    selection = {}
+    for name in ("entry", "critical"):
+        labels = payload.get(name) or []
+        if not isinstance(labels, list) or not all(isinstance(label, str) for label in labels):
+            raise ValueError(f"'{name}' must be a list of node labels")
+        selection[name] = labels
+    # Optional classification rules, in the format of a rules file (see utils.rules)
+    rules = RuleSet.from_config(payload["rules"]) if payload.get("rules") is not None else default_rules
+    options = {}
+    for name in PATH_OPTIONS:
+        value = payload.get(name)
+        if value is None:
+            continue
+        if name == "dedup_subpaths":
+            options[name] = bool(value)
+        elif not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError(f"'{name}' must be a positive integer")
+        else:
+            options[name] = value
+    return {
+        "drawio": drawio,
+        "reports": [r.encode("utf-8") for r in reports],
+        "manual_map": manual_map,
+        "entry": selection["entry"],
+        "critical": selection["critical"],
+        "options": options,
+        "rules": rules,
+    }
+
+
+class Job:
+    def __init__(self, job_id: str, spec: dict, key: str):
+        self.id = job_id
+        self.spec = spec
+        self.key = key
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "status": self.status,
+            "submitted": self.submitted,
+            "queue_wait_s": round(self.started - self.submitted, 6) if self.started else None,
+            "run_s": round(self.finished - self.started, 6) if self.finished and self.started else None,
+        }
+        if self.error:
+            data["error"] = self.error
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class AnalysisService:
+    """
+    Runs analysis jobs on `workers` threads behind a queue of queue_size jobs.
+
+    A job identical to one that is queued or running (same inputs, selection
+    and options) is not queued again; its submit() returns the existing job.
+    """
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 cache: ContentCache = None, max_graphs: int = MAX_CACHED_GRAPHS):
+        self.workers = workers
+        self.cache = cache or ContentCache()
+        self.max_graphs = max_graphs
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._jobs = OrderedDict()
+        self._inflight = {}
+        self._graphs = OrderedDict()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.started = time.time()
+        self.counters = {"submitted": 0, "rejected": 0, "deduplicated": 0, "completed": 0, "failed": 0,
+                         "graph_cache_hits": 0, "graph_cache_misses": 0}
+        self.running = 0
+        self.queue_wait = Histogram()
+        self.run_time = Histogram()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"analysis-worker-{i}", daemon=True) for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    # --- Jobs ---
+
+    def submit(self, payload: dict) -> Job:
+        """Queues a job request (see job_spec); raises ValueError or QueueFull."""
+        spec = job_spec(payload)
+        key = content_digest(json.dumps(
+            [content_digest(spec["drawio"]), [content_digest(r) for r in spec["reports"]], spec["manual_map"],
+             spec["entry"], spec["critical"], spec["options"], spec["rules"].digest],
+            sort_keys=True, ensure_ascii=False,
+        ))
+        with self._lock:
+            existing = self._inflight.get(key)
+            if existing is not None:
+                self.counters["deduplicated"] += 1
+                return existing
+            job = Job(f"job-{next(self._ids)}", spec, key)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.counters["rejected"] += 1
+                raise QueueFull(self._retry_after()) from None
+            self.counters["submitted"] += 1
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _retry_after(self) -> float:
+        # Expected time until a queue slot frees up, from the mean run time so far
+        return max(1.0, self.run_time.mean() * max(1, self._queue.qsize()) / max(1, self.workers))
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                job.status = "running"
+                job.started = time.time()
+                self.running += 1
+                self.queue_wait.observe(job.started - job.submitted)
+            try:
+                result = self._execute(job.spec)
+                error = None
+            except Exception as exc:  # a failed job must not take the worker down
+                result, error = None, f"{type(exc).__name__}: {exc}"
+            with self._lock:
+                job.finished = time.time()
+                job.result, job.error = result, error
+                job.status = "failed" if error else "done"
+                job.spec = None
+                self.running -= 1
+                self.run_time.observe(job.finished - job.started)
+                self.counters["failed" if error else "completed"] += 1
+                self._inflight.pop(job.key, None)
+                self._evict_finished()
+            job.done.set()
+            self._queue.task_done()
+
+    def _evict_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    # --- Execution ---
+
+    def _graph_for(self, key: str, build):
+        """Returns (entry, cached) where entry is [lock, AttackGraph] shared by the jobs on the same inputs."""
+        with self._lock:
+            entry = self._graphs.get(key)
+            cached = entry is not None
+            if cached:
+                self._graphs.move_to_end(key)
+            else:
+                entry = self._graphs[key] = [threading.Lock(), None]
+                while len(self._graphs) > self.max_graphs:
+                    self._graphs.popitem(last=False)
+            self.counters["graph_cache_hits" if cached else "graph_cache_misses"] += 1
+        # A job arriving while the graph is still being built waits for it instead of building it again
+        with entry[0]:
+            if entry[1] is None:
+                entry[1] = build()
+        return entry, cached
+
+    def _execute(self, spec: dict) -> dict:
+        timer = StageTimer()
+        with timer.stage("parse_drawio"):
+            drawio_dict = cached_parse_drawio_xml(spec["drawio"], cache=self.cache)
+        with timer.stage("parse_reports"):
+            # Reports are parsed in the worker thread; the pool size bounds the parallelism
+            vuln_dict = cached_parse_vuln_reports(spec["reports"], workers=1, cache=self.cache,
+                                                  rules=spec["rules"])
+
+        entry_nodes = resolve_labels(drawio_dict, spec["entry"]) or None
+        critical_nodes = resolve_labels(drawio_dict, spec["critical"]) or None
+        options = {name: spec["options"].get(name) for name in PATH_OPTIONS}
+        options["dedup_subpaths"] = bool(options["dedup_subpaths"])
+        graph_key = content_digest(json.dumps(
+            [content_digest(spec["drawio"]), [content_digest(r) for r in spec["reports"]], spec["manual_map"],
+             spec["rules"].digest],
+            sort_keys=True, ensure_ascii=False,
+        ))
+
+        with timer.stage("build_attack_graph"):
+            (lock, attack_graph), cached = self._graph_for(graph_key, lambda: AttackGraph(
+                drawio_dict, vuln_dict, spec["manual_map"], entry_nodes, critical_nodes,
+                rules=spec["rules"], **options
+            ))
+        with lock:
+            with timer.stage("update_selection"):
+                attack_graph.configure_paths(**options)
+                attack_graph.update_selection(entry_nodes, critical_nodes)
+            with timer.stage("export"):
+                graph = attack_graph.graph
+                result = {
+                    "risk_table": risk_table(graph),
+                    "paths": path_records(graph, attack_graph.paths,
+                                          attack_graph.exploit_weights if options["k_best"] else None),
+                }
+        result["graph_cached"] = cached
+        result["timings"] = {name: round(sec, 6) for name, sec in timer.timings.items()}
+        return result
+
+    # --- Metrics ---
+
+    def metrics(self) -> dict:
+        with self._lock:
+            uptime = time.time() - self.started
+            return {
+                "uptime_s": round(uptime, 3),
+                "workers": self.workers,
+                "running": self.running,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                **self.counters,
+                "throughput_jobs_per_s": round(self.counters["completed"] / uptime, 6) if uptime else 0.0,
+                "queue_wait_mean_s": round(self.queue_wait.mean(), 6),
+                "run_mean_s": round(self.run_time.mean(), 6),
+                "cache": self.cache.stats(),
+                "cached_graphs": len(self._graphs),
+            }
+
+    def to_prometheus(self, prefix: str = METRIC_PREFIX) -> str:
+        m = self.metrics()
+        lines = []
+        for name in ("workers", "running", "queue_depth", "queue_capacity", "cached_graphs"):
+            lines += [f"# TYPE {prefix}_service_{name} gauge", f"{prefix}_service_{name} {m[name]}"]
+        for name in self.counters:
+            lines += [f"# TYPE {prefix}_service_jobs_{name}_total counter", f"{prefix}_service_jobs_{name}_total {m[name]}"]
+        for name, value in m["cache"].items():
+            lines += [f"# TYPE {prefix}_service_cache_{name} gauge", f"{prefix}_service_cache_{name} {value}"]
+        with self._lock:
+            lines += self.queue_wait.to_prometheus(f"{prefix}_service_queue_wait_seconds")
+            lines += self.run_time.to_prometheus(f"{prefix}_service_run_seconds")
+        return "\n".join(lines) + "\n"
+
+
+# --- HTTP ---
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None  # set by make_server()
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        data = body if isinstance(body, bytes) else (
+            body.encode("utf-8") if isinstance(body, str) else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        )
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/jobs":
+            return self._send(HTTPStatus.NOT_FOUND, {"error": "not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            return self._send(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": f"body exceeds {MAX_BODY_BYTES} bytes"})
+        try:
+            job = self.service.submit(json.loads(self.rfile.read(length) or b"null"))
+        except QueueFull as exc:
+            return self._send(HTTPStatus.TOO_MANY_REQUESTS, {"error": str(exc)},
+                              headers={"Retry-After": str(int(exc.retry_after + 0.999))})
+        except ValueError as exc:
+            return self._send(HTTPStatus.BAD_REQUEST, {"error": str(exc)})
+        self._send(HTTPStatus.ACCEPTED, job.to_dict(include_result=False), headers={"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send(HTTPStatus.OK, {"status": "ok"})
+        if url.path == "/metrics":
+            return self._send(HTTPStatus.OK, self.service.to_prometheus(), content_type="text/plain; version=0.0.4")
+        if url.path == "/metrics.json":
+            return self._send(HTTPStatus.OK, self.service.metrics())
+        if url.path.startswith("/jobs/"):
+            job = self.service.get(url.path[len("/jobs/"):])
+            if job is None:
+                return self._send(HTTPStatus.NOT_FOUND, {"error": "unknown job"})
+            wait = parse_qs(url.query).get("wait")
+            if wait:
+                try:
+                    job.done.wait(min(float(wait[0]), MAX_WAIT_SECONDS))
+                except ValueError:
+                    return self._send(HTTPStatus.BAD_REQUEST, {"error": "wait must be a number of seconds"})
+            return self._send(HTTPStatus.OK, job.to_dict())
+        self._send(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service: AnalysisService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    handler = type("AnalysisHandler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+class ServiceClient:
+    """Minimal client for the HTTP service (standard library only)."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None):
+        data = None if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout + MAX_WAIT_SECONDS) as response:
+            return json.loads(response.read())
+
+    def submit(self, drawio_text: str, report_texts, manual_map: dict, entry=None, critical=None, **options) -> dict:
+        """Posts a job; raises QueueFull when the service answers 429."""
+        payload = {"drawio": drawio_text, "reports": list(report_texts), "manual_map": manual_map,
+                   "entry": entry or [], "critical": critical or [], **options}
+        try:
+            return self._request("POST", "/jobs", payload)
+        except urllib.error.HTTPError as exc:
+            if exc.code == HTTPStatus.TOO_MANY_REQUESTS:
+                raise QueueFull(float(exc.headers.get("Retry-After") or 1)) from None
+            raise
+
+    def job(self, job_id: str, wait: float = 0) -> dict:
+        return self._request("GET", f"/jobs/{job_id}?wait={wait}")
+
+    def analyze(self, drawio_text: str, report_texts, manual_map: dict, **kwargs) -> dict:
+        """Submits a job (retrying while the queue is full) and returns its result once done."""
+        while True:
+            try:
+                job = self.submit(drawio_text, report_texts, manual_map, **kwargs)
+                break
+            except QueueFull as exc:
+                time.sleep(exc.retry_after)
+        deadline = time.time() + self.timeout
+        while job["status"] in ("queued", "running"):
+            if time.time() > deadline:
+                raise TimeoutError(f"{job['id']} did not finish within {self.timeout}s")
+            job = self.job(job["id"], wait=min(10.0, self.timeout))
+        if job["status"] == "failed":
+            raise RuntimeError(job.get("error"))
+        return job["result"]
+
+    def metrics(self) -> dict:
+        return self._request("GET", "/metrics.json")
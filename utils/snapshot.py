@@ -0,0 +1,345 @@
+"""
+On-disk snapshots of an analysis and diffs between two of them.
+
+A snapshot is a directory of .npy arrays (node table, CSR adjacency, path
+table, per-host finding hashes) plus meta.json and findings.jsonl. Arrays
+are memory-mapped on load, so reopening a snapshot costs no parsing and
+diffing two large snapshots only touches the columns being compared.
+String tables (node ids, labels, hosts) are a UTF-8 blob plus offsets,
+decoded on first use, so one long label does not widen every row.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from utils.compact_graph import CompactGraph
+
+SNAPSHOT_VERSION = 2
+
+# Per-node columns stored in the node table (nearest_entry is a row number, -1 = None)
+NODE_COLUMNS = ["Vuln_Count", "Severity", "Importance", "proximity", "Risk_Score", "nearest_entry"]
+
+# Risk_Score differences at or below this are not reported by diff_snapshots
+RISK_TOLERANCE = 1e-6
+# Findings listed per host in a diff (all new findings are counted)
+DIFF_FINDINGS_PER_HOST = 20
+
+
+# Fields of a finding stored in findings.jsonl (host and port come from the host table)
+FINDING_FIELDS = ("tool", "url", "title", "severity")
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def _finding_line(f: dict) -> bytes:
+    return _encode([f.get(k) for k in FINDING_FIELDS]).encode("utf-8")
+
+
+def _digest(line: bytes) -> bytes:
+    return hashlib.blake2b(line, digest_size=8).digest()
+
+
+def finding_hash(f: dict) -> int:
+    """64-bit identity of a finding (tool, url, title, severity), stable across runs."""
+    return int.from_bytes(_digest(_finding_line(f)), "little", signed=True)
+
+
+def _string_table(arrays: dict, name: str, values):
+    # UTF-8 bytes of all strings plus their offsets (fixed-width "<U" arrays pad every row to the longest one)
+    encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    arrays[f"{name}_offsets"] = offsets
+    arrays[f"{name}_utf8"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def _is_snapshot(path: str) -> bool:
+    try:
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(meta, dict) and "version" in meta
+
+
+def _rows_csr(rows_lists):
+    indptr = np.zeros(len(rows_lists) + 1, dtype=np.int64)
+    np.cumsum([len(r) for r in rows_lists], out=indptr[1:])
+    flat = [i for rows in rows_lists for i in rows]
+    return indptr, np.asarray(flat, dtype=np.int64)
+
+
+def save_snapshot(attack_graph, path: str, meta: dict = None) -> str:
+    """
+    Writes an AttackGraph (graph, scores, paths and the findings of its
+    vuln_dict) to the directory `path`, replacing any previous snapshot there.
+    The directory is written next to the target and renamed into place.
+    Raises FileExistsError when `path` exists but is not a snapshot.
+    """
+    if os.path.lexists(path) and not _is_snapshot(path):
+        raise FileExistsError(f"{path} exists and is not a snapshot; refusing to replace it")
+    graph = attack_graph.graph
+    index = graph.index
+    vuln_dict = attack_graph.vuln_dict
+    tmp = f"{path.rstrip(os.sep)}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    arrays = {
+        "indptr": graph.indptr,
+        "indices": graph.indices,
+        "entry_rows": np.asarray([index[n] for n in attack_graph.entry_nodes if n in index], dtype=np.int64),
+        "critical_rows": np.asarray([index[n] for n in attack_graph.critical_nodes if n in index], dtype=np.int64),
+    }
+    _string_table(arrays, "node_ids", graph.node_ids)
+    _string_table(arrays, "labels", graph.labels)
+    for name in NODE_COLUMNS:
+        arrays[f"col_{name}"] = np.asarray(graph.columns[name])
+
+    # Hosts: aggregates, node -> host row, and finding hashes grouped per host
+    hosts = list(vuln_dict)
+    host_row = {h: i for i, h in enumerate(hosts)}
+    node_host = np.full(len(graph.node_ids), -1, dtype=np.int64)
+    for node_id, host_key in attack_graph.host_of.items():
+        node_host[index[node_id]] = host_row[host_key]
+    _string_table(arrays, "hosts", hosts)
+    arrays["host_vuln_count"] = np.asarray([vuln_dict[h].get("Vuln_Count", 0) for h in hosts], dtype=np.int64)
+    arrays["host_severity"] = np.asarray([vuln_dict[h].get("Severity", 0.0) for h in hosts], dtype=np.float64)
+    arrays["node_host"] = node_host
+
+    # One compact JSON line per finding; the hash of the line is the finding's identity
+    finding_indptr = np.zeros(len(hosts) + 1, dtype=np.int64)
+    digests, lengths = [], []
+    with open(os.path.join(tmp, "findings.jsonl"), "wb") as f:
+        for i, h in enumerate(hosts):
+            lines = [_finding_line(finding) for finding in vuln_dict[h].get("findings") or []]
+            if lines:
+                f.write(b"\n".join(lines) + b"\n")
+                digests.extend(map(_digest, lines))
+                lengths.extend(map(len, lines))
+            finding_indptr[i + 1] = len(lengths)
+    ends = np.cumsum(np.asarray(lengths, dtype=np.int64) + 1)
+    arrays["finding_indptr"] = finding_indptr
+    arrays["finding_hash"] = np.frombuffer(b"".join(digests), dtype="<i8").astype(np.int64)
+    arrays["finding_offset"] = ends - (np.asarray(lengths, dtype=np.int64) + 1)
+
+    arrays["path_indptr"], arrays["path_rows"] = _rows_csr([[index[n] for n in p] for p in attack_graph.paths])
+
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), values, allow_pickle=False)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "version": SNAPSHOT_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "nodes": len(graph.node_ids),
+            "edges": int(len(graph.indices)),
+            "hosts": len(hosts),
+            "findings": len(lengths),
+            "paths": len(attack_graph.paths),
+            "beta": attack_graph.beta,
+            "path_options": attack_graph.path_options,
+            **(meta or {}),
+        }, f, ensure_ascii=False, indent=2)
+
+    # Only a previous snapshot is replaced (checked above)
+    if os.path.lexists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+    return path
+
+
+class Snapshot:
+    """A saved analysis; arrays are loaded (memory-mapped by default) on first access."""
+
+    def __init__(self, path: str, mmap: bool = True):
+        self.path = path
+        self._mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"unsupported snapshot version {self.meta.get('version')} in {path}")
+        self._arrays = {}
+        self._strings = {}
+        self._row_of = None
+
+    def array(self, name: str) -> np.ndarray:
+        values = self._arrays.get(name)
+        if values is None:
+            values = self._arrays[name] = np.load(
+                os.path.join(self.path, f"{name}.npy"), mmap_mode=self._mmap_mode, allow_pickle=False
+            )
+        return values
+
+    def column(self, name: str) -> np.ndarray:
+        return self.array(f"col_{name}")
+
+    def string(self, name: str, i: int) -> str:
+        """One entry of a string table ("node_ids", "labels", "hosts"), decoded on its own."""
+        values = self._strings.get(name)
+        if values is not None:
+            return values[i]
+        start, end = self.array(f"{name}_offsets")[i:i + 2].tolist()
+        return self.array(f"{name}_utf8")[start:end].tobytes().decode("utf-8")
+
+    def strings(self, name: str) -> list:
+        """A whole string table, decoded on first access."""
+        values = self._strings.get(name)
+        if values is None:
+            offsets = self.array(f"{name}_offsets").tolist()
+            blob = self.array(f"{name}_utf8").tobytes()
+            values = self._strings[name] = [blob[a:b].decode("utf-8") for a, b in zip(offsets, offsets[1:])]
+        return values
+
+    @property
+    def node_ids(self) -> list:
+        return self.strings("node_ids")
+
+    def row_of(self, node_id: str) -> int:
+        if self._row_of is None:
+            self._row_of = {n: i for i, n in enumerate(self.node_ids)}
+        return self._row_of[node_id]
+
+    def paths(self) -> list:
+        """Attack paths as lists of node ids."""
+        bounds, rows = self.array("path_indptr").tolist(), self.array("path_rows").tolist()
+        ids = self.node_ids
+        return [[ids[r] for r in rows[a:b]] for a, b in zip(bounds, bounds[1:])]
+
+    def host_findings(self, host_row: int, positions=None) -> list:
+        """Findings of one host (optionally only the given positions within that host), read from findings.jsonl."""
+        start, end = self.array("finding_indptr")[host_row:host_row + 2].tolist()
+        offsets = self.array("finding_offset")[start:end]
+        if positions is not None:
+            offsets = offsets[positions]
+        host, _, port = self.string("hosts", host_row).rpartition(":")
+        port = int(port) if port.isdigit() else port
+        findings = []
+        with open(os.path.join(self.path, "findings.jsonl"), "rb") as f:
+            for offset in offsets.tolist():
+                f.seek(offset)
+                tool, url, title, severity = json.loads(f.readline())
+                findings.append(
+                    {"tool": tool, "host": host, "port": port, "url": url, "title": title, "severity": severity}
+                )
+        return findings
+
+    def to_compact_graph(self) -> CompactGraph:
+        """Rebuilds the scored CompactGraph (labels, edges and node columns) without parsing the inputs."""
+        indptr, indices = np.asarray(self.array("indptr")), np.asarray(self.array("indices"))
+        sources = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        graph = CompactGraph(list(self.node_ids), list(self.strings("labels")), sources, indices)
+        for name in NODE_COLUMNS:
+            graph.set_column(name, np.asarray(self.column(name)), node_refs=(name == "nearest_entry"))
+        return graph
+
+
+def load_snapshot(path: str, mmap: bool = True) -> Snapshot:
+    return Snapshot(path, mmap=mmap)
+
+
+def _id_array(values) -> np.ndarray:
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _match_rows(old_ids: np.ndarray, new_ids: np.ndarray):
+    """(new rows, old rows) of the ids present in both, plus the ids only in old / only in new."""
+    order = np.argsort(old_ids, kind="stable")
+    sorted_old = old_ids[order]
+    pos = np.searchsorted(sorted_old, new_ids)
+    pos = np.minimum(pos, max(len(sorted_old) - 1, 0))
+    found = (sorted_old[pos] == new_ids) if len(sorted_old) else np.zeros(len(new_ids), dtype=bool)
+    new_rows = np.flatnonzero(found)
+    old_rows = order[pos[found]]
+    seen_old = np.zeros(len(old_ids), dtype=bool)
+    seen_old[old_rows] = True
+    return new_rows, old_rows, old_ids[~seen_old], new_ids[~found]
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot, risk_tolerance: float = RISK_TOLERANCE,
+                   findings_per_host: int = DIFF_FINDINGS_PER_HOST) -> dict:
+    """
+    Compares two snapshots.
+
+    Returns the nodes whose Risk_Score changed (by more than risk_tolerance),
+    nodes added/removed from the diagram, paths that are new or gone, and per
+    host the findings that were not in the old snapshot (counted in full,
+    listed up to findings_per_host). Nodes and hosts are matched by id with
+    vectorized lookups on the memory-mapped tables.
+    """
+    # Object arrays keep each id's own length (no fixed-width padding) and still sort/search
+    old_ids, new_ids = _id_array(old.node_ids), _id_array(new.node_ids)
+    new_rows, old_rows, removed_nodes, added_nodes = _match_rows(old_ids, new_ids)
+
+    old_risk, new_risk = np.asarray(old.column("Risk_Score")), np.asarray(new.column("Risk_Score"))
+    delta = new_risk[new_rows] - old_risk[old_rows]
+    changed = np.flatnonzero(np.abs(delta) > risk_tolerance)
+    changed = changed[np.argsort(-np.abs(delta[changed]), kind="stable")]
+    risk_changes = [
+        {
+            "id": str(new_ids[new_rows[k]]),
+            "label": new.string("labels", int(new_rows[k])),
+            "old": float(old_risk[old_rows[k]]),
+            "new": float(new_risk[new_rows[k]]),
+            "delta": round(float(delta[k]), 6),
+        }
+        for k in changed.tolist()
+    ]
+
+    old_paths, new_paths = old.paths(), new.paths()
+    old_path_set, new_path_set = {tuple(p) for p in old_paths}, {tuple(p) for p in new_paths}
+
+    # Findings: hashes of each host in new that are missing from the same host in old
+    old_hosts, new_hosts = _id_array(old.strings("hosts")), _id_array(new.strings("hosts"))
+    host_new_rows, host_old_rows, removed_hosts, _ = _match_rows(old_hosts, new_hosts)
+    old_row_of_host = dict(zip(host_new_rows.tolist(), host_old_rows.tolist()))
+    old_ptr, old_hash = old.array("finding_indptr"), old.array("finding_hash")
+    new_ptr, new_hash = new.array("finding_indptr"), new.array("finding_hash")
+    new_vc, old_vc = new.array("host_vuln_count"), old.array("host_vuln_count")
+
+    new_findings = {}
+    for h in range(len(new_hosts)):
+        hashes = np.asarray(new_hash[new_ptr[h]:new_ptr[h + 1]])
+        o = old_row_of_host.get(h)
+        if o is None:
+            fresh = np.arange(len(hashes))
+            old_count = 0
+        else:
+            fresh = np.flatnonzero(~np.isin(hashes, old_hash[old_ptr[o]:old_ptr[o + 1]]))
+            old_count = int(old_vc[o])
+        if not len(fresh) and int(new_vc[h]) == old_count:
+            continue
+        new_findings[str(new_hosts[h])] = {
+            "new_host": o is None,
+            "Vuln_Count": {"old": old_count, "new": int(new_vc[h])},
+            "new_findings": int(len(fresh)),
+            "findings": new.host_findings(h, fresh[:findings_per_host]) if len(fresh) else [],
+        }
+
+    return {
+        "old": {"path": old.path, "created": old.meta.get("created")},
+        "new": {"path": new.path, "created": new.meta.get("created")},
+        "risk_changes": risk_changes,
+        "added_nodes": added_nodes.tolist(),
+        "removed_nodes": removed_nodes.tolist(),
+        "added_paths": [p for p in new_paths if tuple(p) not in old_path_set],
+        "removed_paths": [p for p in old_paths if tuple(p) not in new_path_set],
+        "new_findings": new_findings,
+        "removed_hosts": removed_hosts.tolist(),
+    }
+
+
+if __name__ == "__main__":
+    # python -m utils.snapshot OLD_DIR NEW_DIR > diff.json
+    if len(sys.argv) != 3:
+        print("usage: python -m utils.snapshot OLD_SNAPSHOT NEW_SNAPSHOT", file=sys.stderr)
+        sys.exit(2)
+    json.dump(diff_snapshots(load_snapshot(sys.argv[1]), load_snapshot(sys.argv[2])), sys.stdout,
+              ensure_ascii=False, indent=2)
+    print()
@@ -0,0 +1,354 @@
+import functools
+import json
+
+import networkx as nx
+import numpy as np
+
+from utils.cache import ContentCache, content_digest
+from utils.networkx_core import graph_to_csr, multi_source_bfs
+
+# Graphs above this size are drawn in the static (pyvis-free) mode by default
+LARGE_GRAPH_NODES = 300
+
+# Spacing of the server-side layered layout (pixels)
+LAYER_GAP = 240
+ROW_GAP = 90
+MAX_LAYER_ROWS = 40
+
+VIS_NETWORK_JS = "https://unpkg.com/vis-network@9.1.9/standalone/umd/vis-network.min.js"
+
+# Rendered HTML by graph fingerprint (memory only; reruns of an unchanged graph are free)
+_html_cache = ContentCache(max_entries=16)
+
+# Columns of the compact per-node tooltip table (see STATIC_TEMPLATE)
+TOOLTIP_FIELDS = ["label", "Risk_Score", "Vuln_Count", "Severity", "Importance", "proximity"]
+
+
+def graph_fingerprint(G, attack_paths, drawio_dict=None, mode: str = "auto") -> str:
+    """Hash of everything the rendered HTML depends on (node data, edges, paths, draw.io geometry)."""
+    geometry = [(n.get("id"), n.get("bounds")) for n in (drawio_dict or {}).get("nodes", [])]
+    return content_digest(repr((mode, list(G.nodes(data=True)), list(G.edges), list(attack_paths), geometry)))
+
+
+def build_graph_html(G, attack_paths, drawio_dict=None, mode: str = "auto", cache: ContentCache = None,
+                     key: str = None):
+    """
+    Renders the enriched attack graph as an interactive HTML document.
+
+    mode "pyvis" keeps the Pyvis output with browser-side physics, "static"
+    uses build_static_graph_html() (server-side layout, no physics,
+    off-path nodes clustered). "auto" picks static for large graphs or when
+    pyvis is not installed.
+
+    The HTML is cached by `key`, a caller-supplied identity of the graph
+    and its paths (e.g. input digests plus selection and path options), so
+    reruns with an unchanged graph skip generation without re-serialising
+    it. Without a key, graph_fingerprint() (O(V+E)) is used.
+    """
+    if mode == "auto":
+        mode = "static" if G.number_of_nodes() > LARGE_GRAPH_NODES else "pyvis"
+        if mode == "pyvis":
+            try:
+                import pyvis  # noqa: F401
+            except ImportError:
+                mode = "static"
+
+    cache = cache or _html_cache
+    key = cache.make_key("graphhtml", mode, key or graph_fingerprint(G, attack_paths, drawio_dict, mode))
+    if mode == "static":
+        return cache.get_or_compute(key, lambda: build_static_graph_html(G, attack_paths, drawio_dict))
+    return cache.get_or_compute(key, lambda: build_pyvis_html(G, attack_paths))
+
+
+@functools.lru_cache(maxsize=1)
+def _pyvis_template():
+    """Pyvis' HTML template, loaded and compiled once per process."""
+    from pyvis.network import Network
+
+    net = Network()
+    return net.templateEnv.get_template(net.path)
+
+
+def build_pyvis_html(G, attack_paths):
+    """
+    Renders the enriched attack graph as an interactive Pyvis HTML document.
+    The HTML is rendered in memory from the cached template.
+    """
+    # pyvis is only needed for rendering, so it is imported lazily
+    from pyvis.network import Network
+
+    net = Network(height="755px", width="100%", bgcolor="#ffffff", directed=True)
+
+    # Get a set of all nodes that are part of any attack path
+    path_nodes = set(node for path in attack_paths for node in path)
+
+    for node_id, data in G.nodes(data=True):
+        node_color = {"border": "#FF0000", "background": "#FFDCDC"} if node_id in path_nodes else {}
+        border_width = 3 if node_id in path_nodes else 1
+
+        net.add_node(
+            node_id,
+            label=data.get('label'),
+            title=str(data),
+            color=node_color,
+            borderWidth=border_width
+        )
+
+    for source_id, target_id, _ in G.edges(data=True):
+        target_node_data = G.nodes[target_id]
+
+        risk = target_node_data.get("Risk_Score", 0.0)
+        width, color = _edge_style(risk)
+
+        title = f"To: {target_node_data.get('label', 'N/A')}\n" + json.dumps(target_node_data, indent=2)
+
+        net.add_edge(source_id, target_id, width=width, color=color, title=title)
+
+    # generate_html() renders self.template when notebook=True (the flag is otherwise unused by the template)
+    net.template = _pyvis_template()
+    return net.generate_html(notebook=True)
+
+
+def _edge_style(risk):
+    width = 1 + (risk / 900)
+    red = min(255, int(risk * 20))
+    green = max(0, 150 - int(risk * 20))
+    return width, f"rgb({red},{green},80)"
+
+
+# --- Server-side Layout ---
+
+def drawio_positions(drawio_dict) -> dict:
+    """
+    Node centers from the draw.io geometry. Absolute bounds (see
+    parse_drawio_xml) are used, so children of groups land inside them;
+    further pages are placed to the right of the previous ones.
+    """
+    pages = {}
+    for node in (drawio_dict or {}).get("nodes", []):
+        bounds = node.get("bounds")
+        if bounds is None:
+            continue
+        x, y, width, height = bounds
+        pages.setdefault(node.get("page"), {})[node["id"]] = (x + width / 2, y + height / 2)
+
+    positions = {}
+    offset = 0.0
+    for page_positions in pages.values():
+        left = min(x for x, _ in page_positions.values())
+        shift = offset - left if positions else 0.0
+        for node_id, (x, y) in page_positions.items():
+            positions[node_id] = (x + shift, y)
+        offset = max(x for x, _ in positions.values()) + LAYER_GAP
+    return positions
+
+
+def layered_layout(G, sources=None) -> dict:
+    """
+    Deterministic O(V+E) layout: the column of a node is its BFS depth from
+    the sources (default: nodes without predecessors), unreached nodes go
+    to a last column. Tall columns wrap after MAX_LAYER_ROWS rows.
+    """
+    nodes, index, indptr, indices = graph_to_csr(G)
+    if not nodes:
+        return {}
+    if sources is None:
+        sources = [n for n in nodes if G.in_degree(n) == 0] or nodes[:1]
+    dist, _ = multi_source_bfs(indptr, indices, [index[s] for s in sources if s in index])
+    dist = np.where(dist >= 0, dist, dist.max() + 1)
+
+    positions = {}
+    column = 0
+    for layer in np.unique(dist).tolist():
+        members = np.flatnonzero(dist == layer).tolist()
+        for start in range(0, len(members), MAX_LAYER_ROWS):
+            part = members[start:start + MAX_LAYER_ROWS]
+            offset = (len(part) - 1) * ROW_GAP / 2
+            for row, i in enumerate(part):
+                positions[nodes[i]] = (column * LAYER_GAP, row * ROW_GAP - offset)
+            column += 1
+    return positions
+
+
+def node_positions(G, drawio_dict=None, sources=None) -> dict:
+    """
+    Positions for all nodes: draw.io coordinates where present, the layered
+    layout for the rest (placed below the diagram's bounding box).
+    """
+    positions = {n: p for n, p in drawio_positions(drawio_dict).items() if n in G}
+    missing = [n for n in G.nodes if n not in positions]
+    if not missing:
+        return positions
+
+    fallback = layered_layout(G.subgraph(missing), sources=[s for s in (sources or []) if s in set(missing)] or None)
+    if positions:
+        left = min(x for x, _ in positions.values())
+        below = max(y for _, y in positions.values()) + 2 * ROW_GAP
+        top = min(y for _, y in fallback.values())
+        fallback = {n: (x + left, y - top + below) for n, (x, y) in fallback.items()}
+    positions.update(fallback)
+    return positions
+
+
+# --- Level of Detail ---
+
+def cluster_off_path_nodes(G, path_nodes) -> dict:
+    """
+    Groups nodes that are on no attack path. Connected groups of off-path
+    nodes form one cluster each; single off-path nodes are grouped by the
+    path node they hang off (or into one cluster of isolated nodes).
+    Returns {cluster_id: [node ids]} for clusters of two or more nodes.
+    """
+    off_path = [n for n in G.nodes if n not in path_nodes]
+    clusters = {}
+    for component in nx.weakly_connected_components(G.subgraph(off_path)):
+        if len(component) > 1:
+            members = sorted(component, key=str)
+            clusters[f"cluster:{members[0]}"] = members
+            continue
+        (node_id,) = component
+        anchor = next((m for m in G.pred[node_id] if m in path_nodes), None)
+        if anchor is None:
+            anchor = next((m for m in G.succ[node_id] if m in path_nodes), None)
+        key = f"cluster:near:{anchor}" if anchor is not None else "cluster:isolated"
+        clusters.setdefault(key, []).append(node_id)
+    return {key: members for key, members in clusters.items() if len(members) > 1}
+
+
+def _rounded(value):
+    return round(value, 3) if isinstance(value, float) else value
+
+
+def static_graph_data(G, attack_paths, drawio_dict=None, cluster: bool = None) -> dict:
+    """
+    Compact vis-network payload: fixed positions, one edge per cluster pair,
+    and a per-node info table used to build tooltips on hover.
+    Off-path nodes are clustered when cluster is True (default: large graphs only).
+    """
+    if cluster is None:
+        cluster = G.number_of_nodes() > LARGE_GRAPH_NODES
+    path_nodes = set(node for path in attack_paths for node in path)
+    positions = node_positions(G, drawio_dict, sources=[p[0] for p in attack_paths])
+
+    clusters = cluster_off_path_nodes(G, path_nodes) if cluster else {}
+    cluster_of = {n: key for key, members in clusters.items() for n in members}
+
+    ids = {}
+    nodes, info = [], []
+    for node_id, data in G.nodes(data=True):
+        if node_id in cluster_of:
+            continue
+        ids[node_id] = len(nodes)
+        x, y = positions[node_id]
+        nodes.append({
+            "id": ids[node_id], "label": data.get("label"), "x": round(x, 1), "y": round(y, 1),
+            "onPath": node_id in path_nodes,
+        })
+        info.append([_rounded(data.get(f)) for f in TOOLTIP_FIELDS])
+
+    for key, members in clusters.items():
+        ids[key] = len(nodes)
+        xs, ys = zip(*(positions[n] for n in members))
+        risks = [G.nodes[n].get("Risk_Score", 0.0) for n in members]
+        nodes.append({
+            "id": ids[key], "label": f"{len(members)} nodes", "x": round(sum(xs) / len(xs), 1),
+            "y": round(sum(ys) / len(ys), 1), "cluster": True,
+        })
+        sample = ", ".join(str(G.nodes[n].get("label")) for n in members[:10])
+        info.append([f"{sample}{' ...' if len(members) > 10 else ''}", _rounded(max(risks)), None, None, None, None])
+
+    edges = {}
+    for source_id, target_id in G.edges():
+        u = ids[cluster_of.get(source_id, source_id)]
+        v = ids[cluster_of.get(target_id, target_id)]
+        if u == v or (u, v) in edges:
+            continue
+        if target_id in cluster_of or source_id in cluster_of:
+            edges[(u, v)] = {"from": u, "to": v, "color": "#bbbbbb", "width": 1}
+        else:
+            width, color = _edge_style(G.nodes[target_id].get("Risk_Score", 0.0))
+            edges[(u, v)] = {"from": u, "to": v, "color": color, "width": round(width, 3)}
+
+    return {"nodes": nodes, "edges": list(edges.values()), "info": info, "fields": TOOLTIP_FIELDS}
+
+
+STATIC_TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<script src="__VIS_JS__"></script>
+<style>
+  body { margin: 0; font-family: sans-serif; }
+  #graph { width: 100%; height: 755px; border: 1px solid #eee; }
+  #tip { position: absolute; display: none; background: #fff; border: 1px solid #ccc; padding: 6px;
+         font-size: 12px; pointer-events: none; white-space: nowrap; }
+</style>
+</head>
+<body>
+<div id="graph"></div>
+<div id="tip"></div>
+<script>
+  var payload = __PAYLOAD__;
+  var nodes = payload.nodes.map(function (n) {
+    return {
+      id: n.id, label: n.label, x: n.x, y: n.y,
+      shape: n.cluster ? "box" : "dot", size: 10, borderWidth: n.onPath ? 3 : 1,
+      color: n.onPath ? {border: "#FF0000", background: "#FFDCDC"}
+           : (n.cluster ? {border: "#999999", background: "#eeeeee"} : undefined)
+    };
+  });
+  var network = new vis.Network(
+    document.getElementById("graph"),
+    {nodes: new vis.DataSet(nodes), edges: new vis.DataSet(payload.edges)},
+    {
+      physics: false,
+      layout: {improvedLayout: false},
+      interaction: {hover: true, hideEdgesOnDrag: true},
+      edges: {arrows: "to", smooth: false}
+    }
+  );
+  var tip = document.getElementById("tip");
+  function show(id, pointer) {
+    // Tooltips are built on hover from the compact info table
+    var row = payload.info[id];
+    tip.textContent = "";
+    payload.fields.forEach(function (f, i) {
+      if (row[i] === null || row[i] === undefined) return;
+      var line = document.createElement("div");
+      line.textContent = f + ": " + row[i];
+      tip.appendChild(line);
+    });
+    tip.style.left = (pointer.DOM.x + 12) + "px";
+    tip.style.top = (pointer.DOM.y + 12) + "px";
+    tip.style.display = "block";
+  }
+  function hide() { tip.style.display = "none"; }
+  network.on("hoverNode", function (p) { show(p.node, p.pointer); });
+  network.on("hoverEdge", function (p) {
+    var edge = network.body.data.edges.get(p.edge);
+    show(edge.to, p.pointer);
+  });
+  network.on("blurNode", hide);
+  network.on("blurEdge", hide);
+  network.on("dragStart", hide);
+</script>
+</body>
+</html>
+"""
+
+
+# The template is split once per process; each render only joins the new payload in
+_STATIC_HEAD, _STATIC_TAIL = STATIC_TEMPLATE.replace("__VIS_JS__", VIS_NETWORK_JS).split("__PAYLOAD__")
+
+
+def build_static_graph_html(G, attack_paths, drawio_dict=None, cluster: bool = None):
+    """
+    Renders a large attack graph without pyvis: positions are computed on the
+    server (or taken from draw.io), physics is off, off-path nodes are
+    collapsed into clusters and tooltips are created in the browser on hover.
+    """
+    payload = json.dumps(static_graph_data(G, attack_paths, drawio_dict, cluster), ensure_ascii=False,
+                         separators=(",", ":"))
+    # Keep the payload from closing the script element
+    payload = payload.replace("</", "<\\/")
+    return _STATIC_HEAD + payload + _STATIC_TAIL
@@ -0,0 +1,163 @@
+import codecs
+import os
+import time
+
+from utils.networkx_core import AttackGraph
+from utils.parse_vuln import CHUNK_SIZE, ReportStreamParser, update_host_aggregates
+from utils.pipeline import list_report_files, path_records
+
+# Default polling interval of the watch loop (seconds)
+DEFAULT_INTERVAL = 2.0
+
+
+class ReportTail:
+    """
+    Follows one report file and parses only the lines appended since the last read.
+
+    The byte offset, the incomplete last line and the ReportStreamParser
+    state (detected tool, Nikto target) are kept between reads. A file that
+    shrinks or is replaced is read again from the start as a new report;
+    the findings already counted from it are kept.
+    """
+
+    def __init__(self, path: str, rules=None):
+        self.path = path
+        self.rules = rules
+        self._reset(None)
+
+    def _reset(self, inode):
+        self.inode = inode
+        self.offset = 0
+        self.parser = ReportStreamParser(rules=self.rules)
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._pending = ""
+
+    def read_new(self, chunk_size: int = CHUNK_SIZE) -> list:
+        """Returns the findings of the complete lines appended since the previous call."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if self.inode != stat.st_ino or stat.st_size < self.offset:
+            self._reset(stat.st_ino)
+        if stat.st_size == self.offset:
+            return []
+
+        findings = []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                self._pending += self._decoder.decode(chunk)
+                cut = self._pending.rfind("\n")
+                if cut < 0:
+                    continue
+                block, self._pending = self._pending[:cut + 1], self._pending[cut + 1:]
+                findings.extend(self.parser.feed(block))
+            self.offset = f.tell()
+        return findings
+
+
+class ReportWatcher:
+    """Tails every report file (*.txt) of a directory, including files created later."""
+
+    def __init__(self, report_dir: str, rules=None):
+        self.report_dir = report_dir
+        self.rules = rules
+        self.tails = {}
+
+    def poll(self) -> list:
+        """New findings of all report files since the previous poll."""
+        findings = []
+        for path in list_report_files(self.report_dir):
+            tail = self.tails.get(path)
+            if tail is None:
+                tail = self.tails[path] = ReportTail(path, self.rules)
+            findings.extend(tail.read_new())
+        return findings
+
+
+class WatchSession:
+    """
+    Continuous analysis of a report directory against a fixed diagram.
+
+    The reports found at start-up are parsed once and the AttackGraph is
+    built from them. Each update() then parses only the appended lines,
+    adds them to the per-host aggregates in place and re-scores only the
+    nodes mapped to the affected hosts (AttackGraph.update_vuln_data), so
+    its cost follows the new findings rather than the whole history.
+    """
+
+    def __init__(self, drawio_dict: dict, manual_map: dict, report_dir: str, entry_nodes=None, critical_nodes=None,
+                 keep_findings: bool = True, instrumentation=None, rules=None, **path_options):
+        self.watcher = ReportWatcher(report_dir, rules)
+        self.keep_findings = keep_findings
+        self.vuln_dict = {}
+        update_host_aggregates(self.vuln_dict, self.watcher.poll(), keep_findings)
+        self.attack_graph = AttackGraph(
+            drawio_dict, self.vuln_dict, manual_map, entry_nodes, critical_nodes,
+            instrumentation=instrumentation, rules=rules, **path_options,
+        )
+        self.updates = 0
+
+    def update(self):
+        """Parses new report lines and returns the resulting delta, or None when nothing was appended."""
+        start = time.perf_counter()
+        findings = self.watcher.poll()
+        if not findings:
+            return None
+
+        known = set(self.vuln_dict)
+        added = update_host_aggregates(self.vuln_dict, findings, self.keep_findings)
+        new_hosts = [key for key in added if key not in known]
+        ag = self.attack_graph
+        rows, paths_changed = ag.update_vuln_data(added, new_hosts)
+
+        graph = ag.graph
+        node_ids = [graph.node_ids[i] for i in rows]
+        path_indices = range(len(ag.paths)) if paths_changed else ag.paths_through(node_ids)
+        self.updates += 1
+        return {
+            "update": self.updates,
+            "findings": len(findings),
+            "hosts": {
+                key: {
+                    "new_findings": n,
+                    "new_host": key in new_hosts,
+                    "Vuln_Count": self.vuln_dict[key]["Vuln_Count"],
+                    "Severity": self.vuln_dict[key]["Severity"],
+                }
+                for key, n in added.items()
+            },
+            "nodes": [
+                {
+                    "id": node_id,
+                    "label": graph.labels[i],
+                    "host": ag.host_of.get(node_id),
+                    **{name: graph.column_value(name, i) for name in ("Risk_Score", "Vuln_Count", "Severity")},
+                }
+                for i, node_id in zip(rows, node_ids)
+            ],
+            "paths_recomputed": paths_changed,
+            "paths": [
+                dict(rec, index=k)
+                for k, rec in zip(path_indices, path_records(
+                    graph, [ag.paths[k] for k in path_indices],
+                    ag.exploit_weights if ag.path_options["k_best"] else None,
+                ))
+            ],
+            "elapsed_s": round(time.perf_counter() - start, 6),
+        }
+
+    def run(self, on_delta, interval: float = DEFAULT_INTERVAL, max_updates: int = None):
+        """Polls every `interval` seconds and passes each delta to on_delta (until max_updates deltas)."""
+        emitted = 0
+        while max_updates is None or emitted < max_updates:
+            delta = self.update()
+            if delta is None:
+                time.sleep(interval)
+                continue
+            on_delta(delta)
+            emitted += 1
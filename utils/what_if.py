@@ -0,0 +1,459 @@
+import heapq
+import time
+
+import numpy as np
+
+from utils.networkx_core import (
+    drop_subpaths, extract_attack_paths, iter_source_paths, multi_source_bfs, path_risk, search_from_criticals,
+)
+from utils.risk_paths import exploit_weights, k_riskiest_paths
+
+# Default number of edges returned by WhatIfAnalysis.rank_edges()
+DEFAULT_RANKED_EDGES = 20
+
+
+class _EditedAdjacency:
+    """Row adjacency of a CSR graph with some edges removed and others appended (the arrays are not copied)."""
+
+    def __init__(self, indptr, indices, removed: dict, added: dict):
+        self._indptr = indptr
+        self._indices = indices
+        self._removed = removed  # row -> set of rows
+        self._added = added      # row -> list of rows
+
+    def __getitem__(self, i):
+        row = self._indices[self._indptr[i]:self._indptr[i + 1]].tolist()
+        removed = self._removed.get(i)
+        if removed:
+            row = [j for j in row if j not in removed]
+        added = self._added.get(i)
+        return row + added if added else row
+
+
+def _edit_maps(removed, added, flip: bool = False):
+    removed_map, added_map = {}, {}
+    for u, v in removed:
+        u, v = (v, u) if flip else (u, v)
+        removed_map.setdefault(u, set()).add(v)
+    for u, v in added:
+        u, v = (v, u) if flip else (u, v)
+        added_map.setdefault(u, []).append(v)
+    return removed_map, added_map
+
+
+def repair_distances(dist, nearest, succ_removed, pred_removed, succ_edited, removed, added) -> set:
+    """
+    Updates multi-source BFS distances (and nearest sources) in place after edge changes.
+
+    dist / nearest are the arrays of multi_source_bfs() on the original graph.
+    succ_removed / pred_removed are the adjacency without the removed edges,
+    succ_edited the adjacency with all changes. Removals are repaired first:
+    the nodes that lose their last predecessor one hop closer to a source are
+    collected in order of distance and re-settled from their unaffected
+    predecessors; additions then propagate shorter distances forward. Only the
+    nodes whose distance can change are visited. Returns the changed rows.
+    Among several equally near sources, nearest may name a different one than
+    a full BFS would.
+    """
+    before = {}
+
+    # Nodes whose distance grows: all their shortest-path predecessors were cut off
+    affected = set()
+    heap = [(int(dist[v]), v) for u, v in removed if dist[u] >= 0 and dist[v] == dist[u] + 1]
+    heapq.heapify(heap)
+    while heap:
+        d, v = heapq.heappop(heap)
+        if v in affected or d == 0:
+            continue
+        if any(dist[p] == d - 1 and p not in affected for p in pred_removed[v]):
+            continue
+        affected.add(v)
+        for w in succ_removed[v]:
+            if dist[w] == d + 1 and w not in affected:
+                heapq.heappush(heap, (d + 1, w))
+
+    for v in affected:
+        before[v] = (int(dist[v]), int(nearest[v]))
+        dist[v] = nearest[v] = -1
+    heap = []
+    for v in affected:
+        options = [(int(dist[p]) + 1, int(nearest[p])) for p in pred_removed[v] if p not in affected and dist[p] >= 0]
+        if options:
+            d, source = min(options)
+            heap.append((d, v, source))
+    heapq.heapify(heap)
+    while heap:
+        d, v, source = heapq.heappop(heap)
+        if dist[v] >= 0:
+            continue
+        dist[v], nearest[v] = d, source
+        for w in succ_removed[v]:
+            if w in affected and dist[w] < 0:
+                heapq.heappush(heap, (d + 1, w, source))
+
+    # Added edges only shorten distances
+    heap = [(int(dist[u]) + 1, v, int(nearest[u])) for u, v in added if dist[u] >= 0]
+    heapq.heapify(heap)
+    while heap:
+        d, v, source = heapq.heappop(heap)
+        if 0 <= dist[v] <= d:
+            continue
+        before.setdefault(v, (int(dist[v]), int(nearest[v])))
+        dist[v], nearest[v] = d, source
+        for w in succ_edited[v]:
+            if dist[w] < 0 or dist[w] > d + 1:
+                heapq.heappush(heap, (d + 1, w, source))
+
+    return {v for v, (d, source) in before.items() if dist[v] != d or nearest[v] != source}
+
+
+class WhatIfAnalysis:
+    """
+    What-if questions against a built AttackGraph: how do proximity,
+    Risk_Score and the attack paths change when edges are removed or added,
+    or hosts are patched, without editing the diagram and rebuilding.
+
+    The entry distances (one multi-source BFS) and the shortest paths grouped
+    by BFS source (entry, or critical node when there are fewer of those) are
+    kept from the current selection. evaluate() repairs the distances around
+    the changed edges, re-scores only the nodes whose proximity or host
+    changed and searches paths again only from the BFS sources whose
+    shortest-path DAG contains a changed edge. With max_paths or k_best the
+    path search is redone on an edited copy of the graph, since those results
+    depend on the search order or on every weight.
+
+    rank_edges() counts, without enumerating them, how many shortest
+    entry→critical paths run through each edge (one counting BFS per source).
+
+    The AttackGraph is never modified; changes to its selection or path
+    options are picked up on the next call.
+    """
+
+    def __init__(self, attack_graph):
+        self.attack_graph = attack_graph
+        self._state = None
+
+    def _prepare(self):
+        ag = self.attack_graph
+        key = (tuple(ag.entry_nodes), tuple(ag.critical_nodes), tuple(sorted(ag.path_options.items())))
+        if self._state is not None and self._state["key"] == key:
+            return self._state
+
+        graph = ag.graph
+        index = graph.index
+        entries = [index[e] for e in dict.fromkeys(ag.entry_nodes) if e in index]
+        criticals = [index[c] for c in dict.fromkeys(ag.critical_nodes) if c in index]
+        reverse = search_from_criticals(entries, criticals)
+        dist, nearest = multi_source_bfs(graph.indptr, graph.indices, entries)
+        self._state = {
+            "key": key,
+            "dist": dist,
+            "nearest": nearest,
+            "reverse": reverse,
+            "sources": criticals if reverse else entries,
+            "targets": entries if reverse else criticals,
+            "groups": None,
+            "used": None,
+            "depth": None,
+            "edge_paths": None,
+            "total_paths": 0,
+        }
+        return self._state
+
+    def _search_arrays(self, reverse: bool):
+        graph = self.attack_graph.graph
+        return (graph.pred_indptr, graph.pred_indices) if reverse else (graph.indptr, graph.indices)
+
+    def _groups(self, state):
+        """
+        Shortest paths per BFS source, in the order the path search yields them,
+        with the edges each source's paths use and its distance to every target.
+        """
+        if state["groups"] is None:
+            ag = self.attack_graph
+            graph = ag.graph
+            ids = graph.node_ids
+            reverse = state["reverse"]
+            if not ag.path_options["dedup_subpaths"] and ag.path_options["top_k"] is None:
+                # The current path list is the full one, already in source order
+                by_source = {}
+                for path in ag.paths:
+                    by_source.setdefault(path[-1] if reverse else path[0], []).append(path)
+                groups = [by_source.get(ids[s], []) for s in state["sources"]]
+            else:
+                adj = graph.pred_lists() if reverse else graph.succ_lists()
+                groups = [
+                    [[ids[i] for i in path] for path in iter_source_paths(adj, s, state["targets"], reverse)]
+                    for s in state["sources"]
+                ]
+
+            target_pos = {ids[t]: k for k, t in enumerate(state["targets"])}
+            depth = np.full((len(groups), len(target_pos)), np.inf)
+            used = []
+            for k, group in enumerate(groups):
+                edges = set()
+                for path in group:
+                    edges.update(zip(path, path[1:]))
+                    depth[k, target_pos[path[0] if reverse else path[-1]]] = len(path) - 1
+                used.append(edges)
+            state["groups"], state["used"], state["depth"] = groups, used, depth
+        return state["groups"]
+
+    def _edge_rows(self, edges):
+        index = self.attack_graph.graph.index
+        rows = []
+        for edge in edges:
+            u, v = edge
+            if u not in index or v not in index:
+                raise ValueError(f"unknown node in edge {u} -> {v}")
+            rows.append((index[u], index[v]))
+        return rows
+
+    # --- Edge ranking ---
+
+    def _count_paths(self, state):
+        """Shortest entry→critical paths through each search-CSR edge position (Brandes-style counting)."""
+        indptr, indices = self._search_arrays(state["reverse"])
+        n = len(indptr) - 1
+        is_target = np.zeros(n, dtype=np.float64)
+        is_target[state["targets"]] = 1.0
+        edge_paths = np.zeros(len(indices), dtype=np.float64)
+        total = 0.0
+
+        for source in state["sources"]:
+            dist = np.full(n, -1, dtype=np.int64)
+            sigma = np.zeros(n, dtype=np.float64)  # shortest paths from the source
+            dist[source] = 0
+            sigma[source] = 1.0
+            frontier = np.asarray([source], dtype=np.int64)
+            levels = []
+            level = 0
+            while frontier.size:
+                level += 1
+                starts = indptr[frontier]
+                counts = indptr[frontier + 1] - starts
+                size = int(counts.sum())
+                if size == 0:
+                    break
+                tails = np.repeat(frontier, counts)
+                pos = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(size)
+                heads = indices[pos]
+                frontier = np.unique(heads[dist[heads] < 0])
+                dist[frontier] = level
+                dag = dist[heads] == level
+                pos, tails, heads = pos[dag], tails[dag], heads[dag]
+                np.add.at(sigma, heads, sigma[tails])
+                levels.append((pos, tails, heads))
+
+            # tau: paths from each node to the targets within the source's shortest-path DAG
+            tau = is_target.copy()
+            for pos, tails, heads in reversed(levels):
+                np.add.at(tau, tails, tau[heads])
+            for pos, tails, heads in levels:
+                edge_paths[pos] += sigma[tails] * tau[heads]
+            total += tau[source]
+        return edge_paths, total
+
+    def rank_edges(self, limit: int = DEFAULT_RANKED_EDGES) -> list:
+        """
+        Edges ordered by the number of shortest entry→critical paths they
+        carry, i.e. the paths removing the edge would cut (before any longer
+        detour takes over). Counts cover every shortest path regardless of
+        max_paths / top_k / k_best.
+        """
+        state = self._prepare()
+        if state["edge_paths"] is None:
+            with self.attack_graph.instrumentation.stage("what_if_rank_edges"):
+                state["edge_paths"], state["total_paths"] = self._count_paths(state)
+        edge_paths, total = state["edge_paths"], state["total_paths"]
+
+        graph = self.attack_graph.graph
+        indptr, indices = self._search_arrays(state["reverse"])
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        ranked = []
+        for pos in np.argsort(-edge_paths, kind="stable")[:limit].tolist():
+            if edge_paths[pos] <= 0:
+                break
+            u, v = (int(indices[pos]), int(rows[pos])) if state["reverse"] else (int(rows[pos]), int(indices[pos]))
+            ranked.append({
+                "source": graph.node_ids[u],
+                "target": graph.node_ids[v],
+                "source_label": graph.labels[u],
+                "target_label": graph.labels[v],
+                "paths": int(edge_paths[pos]),
+                "share": round(float(edge_paths[pos] / total), 6),
+            })
+        return ranked
+
+    # --- Scenarios ---
+
+    def _affected_sources(self, state, removed, added) -> set:
+        """
+        Positions in state["sources"] whose shortest paths can change: a
+        removed edge matters to the sources whose paths use it; an added edge
+        (a, b) to the sources s with d(s, a) + 1 + d(b, t) <= d(s, t) for some
+        target t (distances in search direction, d(s, t) infinite when t was
+        unreachable).
+        """
+        graph = self.attack_graph.graph
+        ids = graph.node_ids
+        affected = set()
+        for u, v in removed:
+            edge = (ids[u], ids[v])
+            affected.update(k for k, edges in enumerate(state["used"]) if edge in edges)
+        if not added:
+            return affected
+
+        reverse = state["reverse"]
+        sources = np.asarray(state["sources"], dtype=np.int64)
+        targets = np.asarray(state["targets"], dtype=np.int64)
+        # d(s, a) for every source from one BFS against the search direction, on the original
+        # graph (a lower bound once edges are removed); d(b, t) on the graph with the added edges
+        opposite = (graph.indptr, graph.indices) if reverse else (graph.pred_indptr, graph.pred_indices)
+        extended = graph.with_edge_changes(added=added)
+        forward = (extended.pred_indptr, extended.pred_indices) if reverse else (extended.indptr, extended.indices)
+        depth = state["depth"]
+        for u, v in added:
+            a, b = (v, u) if reverse else (u, v)
+            da = multi_source_bfs(opposite[0], opposite[1], [a])[0][sources]
+            db = multi_source_bfs(forward[0], forward[1], [b])[0][targets]
+            reach = db >= 0
+            if not reach.any():
+                continue
+            slack = (depth[:, reach] - db[reach]).max(axis=1)
+            affected.update(np.flatnonzero((da >= 0) & (slack >= da + 1)).tolist())
+        return affected
+
+    def evaluate(self, removed_edges=(), added_edges=(), patched_hosts=()) -> dict:
+        """
+        Effect of removing / adding (source_id, target_id) edges and patching
+        hosts (vuln_dict keys; their nodes lose all findings) on proximity,
+        Risk_Score and the attack paths. Returns the changed nodes, the new
+        path list and the paths added / removed relative to the current ones.
+        """
+        start = time.perf_counter()
+        ag = self.attack_graph
+        graph = ag.graph
+        state = self._prepare()
+        removed = list(dict.fromkeys(self._edge_rows(removed_edges)))
+        for u, v in removed:
+            if not graph.has_edge_rows(u, v):
+                raise ValueError(f"no edge {graph.node_ids[u]} -> {graph.node_ids[v]}")
+        added = [(u, v) for u, v in dict.fromkeys(self._edge_rows(added_edges)) if not graph.has_edge_rows(u, v)]
+        unknown = [h for h in patched_hosts if h not in ag.vuln_dict]
+        if unknown:
+            raise ValueError(f"unknown hosts: {', '.join(unknown)}")
+
+        with ag.instrumentation.stage("what_if"):
+            # Proximity: repair the entry distances around the changed edges
+            dist, nearest = state["dist"].copy(), state["nearest"].copy()
+            succ_removed = _EditedAdjacency(graph.indptr, graph.indices, *_edit_maps(removed, ()))
+            pred_removed = _EditedAdjacency(graph.pred_indptr, graph.pred_indices, *_edit_maps(removed, (), flip=True))
+            succ_edited = _EditedAdjacency(graph.indptr, graph.indices, *_edit_maps(removed, added))
+            moved = repair_distances(dist, nearest, succ_removed, pred_removed, succ_edited, removed, added)
+
+            # Risk_Score of the moved and patched nodes only
+            patched = ag.host_rows(patched_hosts)
+            rows = np.asarray(sorted(moved | patched), dtype=np.int64)
+            columns = ag.scorer.columns
+            vuln_count = np.where(np.isin(rows, list(patched)), 0, columns["Vuln_Count"][rows])
+            severity = np.where(np.isin(rows, list(patched)), 0.0, columns["Severity"][rows])
+            proximity = np.where(dist[rows] >= 0, np.exp(-ag.beta * np.maximum(dist[rows], 0)), 0.0)
+            old_risk = ag.scorer.risk[rows]
+            new_risk = np.round((vuln_count * severity) * columns["Importance"][rows] * proximity, 6)
+
+            paths, sources_recomputed, changed_groups = self._scenario_paths(
+                state, removed, added, rows, new_risk, patched, vuln_count, severity,
+            )
+
+        ids = graph.node_ids
+        nodes = []
+        for k, i in enumerate(rows.tolist()):
+            before, after = float(old_risk[k]), float(new_risk[k])
+            old_proximity = float(columns["proximity"][i])
+            if before == after and old_proximity == proximity[k] and i not in patched:
+                continue
+            nodes.append({
+                "id": ids[i],
+                "label": graph.labels[i],
+                "patched": i in patched,
+                "proximity_before": old_proximity,
+                "proximity": float(proximity[k]),
+                "nearest_entry": ids[nearest[i]] if nearest[i] >= 0 else None,
+                "Risk_Score_before": before,
+                "Risk_Score": after,
+            })
+        if changed_groups is None:
+            changed_groups = [(ag.paths, paths)]
+        added_paths, removed_paths = [], []
+        for old, new in changed_groups:
+            old_set, new_set = set(map(tuple, old)), set(map(tuple, new))
+            added_paths += [p for p in new if tuple(p) not in old_set]
+            removed_paths += [p for p in old if tuple(p) not in new_set]
+        return {
+            "removed_edges": [[ids[u], ids[v]] for u, v in removed],
+            "added_edges": [[ids[u], ids[v]] for u, v in added],
+            "patched_hosts": list(patched_hosts),
+            "nodes": nodes,
+            "risk_delta": round(float((new_risk - old_risk).sum()), 6),
+            "paths": paths,
+            "added_paths": added_paths,
+            "removed_paths": removed_paths,
+            "sources_recomputed": sources_recomputed,
+            "elapsed_s": round(time.perf_counter() - start, 6),
+        }
+
+    def _scenario_paths(self, state, removed, added, rows, new_risk, patched, vuln_count, severity):
+        """
+        Returns (paths as node id lists, number of BFS sources searched again,
+        [(old, new)] path lists to diff, or None to diff the whole lists).
+        """
+        ag = self.attack_graph
+        graph = ag.graph
+        ids = graph.node_ids
+        options = ag.path_options
+
+        risk_of = None
+        if options["top_k"] is not None:
+            risk = ag.scorer.risk.copy()
+            risk[rows] = new_risk
+            risk_of = dict(zip(ids, risk.tolist()))
+
+        if options["k_best"] or options["max_paths"] is not None:
+            edited = graph.with_edge_changes(removed, added) if removed or added else graph
+            if options["k_best"]:
+                weights = dict(ag.exploit_weights)
+                if patched:
+                    patched_rows = [i for i in rows.tolist() if i in patched]
+                    mask = np.isin(rows, patched_rows)
+                    values = exploit_weights(vuln_count[mask], severity[mask], ag.scorer.columns["Importance"][patched_rows])
+                    weights.update(zip((ids[i] for i in patched_rows), values.tolist()))
+                paths = k_riskiest_paths(edited, ag.entry_nodes, ag.critical_nodes, k=options["k_best"], weight_of=weights)
+            else:
+                paths = extract_attack_paths(
+                    edited, ag.entry_nodes, ag.critical_nodes, risk_of=risk_of,
+                    **{name: options[name] for name in ("max_paths", "top_k", "dedup_subpaths")},
+                )
+            return paths, len(state["sources"]) if removed or added else 0, None
+
+        groups = old_groups = self._groups(state)
+        affected = self._affected_sources(state, removed, added) if removed or added else set()
+        if affected:
+            reverse = state["reverse"]
+            indptr, indices = self._search_arrays(reverse)
+            adj = _EditedAdjacency(indptr, indices, *_edit_maps(removed, added, flip=reverse))
+            groups = list(groups)
+            for k in affected:
+                groups[k] = [
+                    [ids[i] for i in path] for path in iter_source_paths(adj, state["sources"][k], state["targets"], reverse)
+                ]
+
+        paths = [path for group in groups for path in group]
+        if options["dedup_subpaths"] or risk_of is not None:
+            if options["dedup_subpaths"]:
+                paths = drop_subpaths(paths)
+            if risk_of is not None:
+                paths = heapq.nlargest(options["top_k"], paths, key=lambda p: path_risk(p, risk_of))
+            return paths, len(affected), None
+        # Only the re-searched sources' paths can differ
+        return paths, len(affected), [(old_groups[k], groups[k]) for k in sorted(affected)]